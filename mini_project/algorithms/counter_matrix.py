@@ -1,6 +1,17 @@
+import itertools
 from typing import Optional
 from mini_project.utils import Estimator, _choose_prime
 import numpy as np
+from scipy.stats import chi2
+
+# Number of hash values computed at a time by CounterTensor.read_batch
+BATCH_ELEMENTS = 2 ** 20
+
+# Number of counters up to which CounterTensor counts all the matrices at once
+COUNT_BINS = 2 ** 16
+
+# Unsigned counter types, in the order they are promoted to
+COUNTER_DTYPES = [np.uint8, np.uint16, np.uint32, np.uint64]
 
 
 class CounterMatrix(Estimator):
@@ -9,28 +20,45 @@ class CounterMatrix(Estimator):
 
     Args:
         A (int): set the size of counter matrix to be A * A
+        seed (int or np.random.Generator): seed of the hash functions. Counter matrices
+            constructed with the same seed can be merged.
+        incremental (bool): maintain the marginals and the sums the statistic is made of
+            as the items arrive, so that compute() takes O(A) instead of O(A^2) and does
+            not allocate any A * A matrix, at the cost of O(A) more work per item (or
+            O(A^2) per batch).
     """
-    def __init__(self, A: int, metric: str = "l2") -> None:
+    _linear_state = ("C",)
+    _hash_state = ("A", "p", "param_x", "param_y")
+
+    def __init__(self, A: int, metric: str = "l2", seed=None, incremental: bool = False) -> None:
         super().__init__(input_type=int)
         self.C = np.zeros((A, A), dtype=int)   # Counter matrix
         self.A = A                             # Size of counter matrix
         self.metric = metric
+        self.incremental = incremental
 
         # Generate hash functions
+        rng = np.random.default_rng(seed)
         self.p = _choose_prime(10 * A)
-        self.param_x = self._generate_random_hash_parameters()
-        self.param_y = self._generate_random_hash_parameters()
+        self.param_x = self._generate_random_hash_parameters(rng)
+        self.param_y = self._generate_random_hash_parameters(rng)
+
+        if incremental:
+            self._refresh()
 
 
-    def _generate_random_hash_parameters(self):
+    def _generate_random_hash_parameters(self, rng):
         """
         Generate random parameters for the hash functions. We only generate two
         functions for X and Y respectively.
 
+        Args:
+            rng (np.random.Generator): the random number generator to use.
+
         Returns:
             A list of two integers, for the parameters in hash function.
         """
-        return [np.random.randint(1, self.p), np.random.randint(0, self.p)]
+        return [int(rng.integers(1, self.p)), int(rng.integers(0, self.p))]
     
     def _calculate_hash_functions(self, i, j):
         """
@@ -44,21 +72,347 @@ class CounterMatrix(Estimator):
         y = (self.param_y[0] * j + self.param_y[1]) % self.p % self.A
         return x, y
     
+    def _hash_key(self):
+        return (self.A, self.p, *self.param_x, *self.param_y)
+
+    def _refresh(self, previous: dict = None):
+        """
+        Recompute the incremental statistics from the counter matrix:
+            row, col: the marginals of C.
+            cross: C @ col, so that the cross term sum_xy C[x, y] row[x] col[y] is
+                row @ cross.
+            sum_squares, row_squares, col_squares: the sums of the squares of C, row
+                and col.
+        cross and the sums of squares grow as N^2, so they are computed in float64,
+        as they would overflow int64 from N = 3e9.
+        If the previous counter matrix is given, the statistics are updated with the
+        difference of the counters, as in read_batch, instead of being recomputed.
+        """
+        if not self.incremental:
+            return
+        old = previous.get("C") if previous is not None else None
+        if old is not None and old is not self.C and old.dtype == self.C.dtype and hasattr(self, "cross"):
+            C, self.C = self.C, old
+            self._add_statistics(C - self.C)
+            self.C = C
+            return
+        self.row = np.sum(self.C, axis=1)
+        self.col = np.sum(self.C, axis=0)
+        self.cross = self.C @ self.col.astype(np.float64)
+        self.sum_squares = np.sum(self.C.astype(np.float64) ** 2).item()
+        self.row_squares = np.sum(self.row.astype(np.float64) ** 2).item()
+        self.col_squares = np.sum(self.col.astype(np.float64) ** 2).item()
+
     def _read_item(self, i, j):
         super()._read_item(i, j)
         x, y = self._calculate_hash_functions(i, j)
-        self.C[x, y] += 1
+        if self.incremental:
+            # Add the item to C with the marginals fixed, then to row, then to col
+            self.sum_squares += 2 * self.C[x, y].item() + 1
+            self.cross[x] += self.col[y]
+            self.row_squares += 2 * self.row[x].item() + 1
+            self.row[x] += 1
+            self.col_squares += 2 * self.col[y].item() + 1
+            self.col[y] += 1
+            self.C[x, y] += 1
+            self.cross += self.C[:, y]
+        else:
+            self.C[x, y] += 1
+
+    def read_batch(self, xs, ys):
+        xs, ys = self._to_arrays(xs, ys)
+        self.N += len(xs)
+        x, y = self._hash_batch(xs, ys)
+        D = np.bincount(x * self.A + y, minlength=self.A * self.A).reshape(self.A, self.A)
+        if self.incremental:
+            self._add_statistics(D)
+        self.C += D
+
+    def _add_statistics(self, D):
+        """
+        Update the incremental statistics with the counts D about to be added to C, with
+        the same steps as in _read_item.
+        """
+        d_row, d_col = np.sum(D, axis=1), np.sum(D, axis=0)
+        self.sum_squares += np.sum((2.0 * self.C + D) * D).item()
+        self.cross += D @ self.col.astype(np.float64)
+        self.row_squares += np.sum((2.0 * self.row + d_row) * d_row).item()
+        self.row += d_row
+        self.col_squares += np.sum((2.0 * self.col + d_col) * d_col).item()
+        self.col += d_col
+        self.cross += (self.C + D) @ d_col.astype(np.float64)
 
     def compute(self) -> float:
+        if self.incremental:
+            # ||C / N - row col^T / N^2||^2, expanded
+            N = float(self.N)
+            cross = float(np.dot(self.row.astype(float), self.cross))
+            norm = self.sum_squares / N ** 2 - 2 * cross / N ** 3 + \
+                self.row_squares * float(self.col_squares) / N ** 4
+            return max(norm, 0.0) / (1-1/self.A) ** 2
+
         p_x = np.sum(self.C, axis=1, keepdims=True)
         p_y = np.sum(self.C, axis=0, keepdims=True)
         observed = self.C / self.N
-        expected = np.dot(p_x, p_y) / self.N ** 2
+        expected = np.dot(p_x / self.N, p_y / self.N)
         
         return np.linalg.norm(observed - expected) ** 2 / (1-1/self.A) ** 2
 
 
-class L2Estimator(Estimator):
+class CounterTensor(Estimator):
+    """
+    B counter matrices stored as one (B, A, A) array, with the hash functions of all the
+    matrices evaluated at once. The matrices and hash functions are the same as those of B
+    CounterMatrix built in turn from the same seed, at a fraction of the Python overhead.
+
+    The counters start with a compact unsigned type (uint16 by default), and are promoted
+    to a larger type when a count would overflow. Subtracting estimators switches to a
+    signed type if a count becomes negative.
+
+    Args:
+        A (int): size of each counter matrix.
+        B (int): number of counter matrices.
+        seed (int or np.random.Generator): seed of the hash functions.
+        incremental (bool): maintain the statistics of each matrix as the items arrive,
+            as CounterMatrix does.
+        dtype (np.dtype): initial type of the counters.
+    """
+    _linear_state = ("C",)
+    _hash_state = ("A", "B", "p", "param_x", "param_y")
+
+    def __init__(self, A: int, B: int, seed=None, incremental: bool = False, dtype=np.uint16) -> None:
+        super().__init__(input_type=int)
+        self.A = A
+        self.B = B
+        self.incremental = incremental
+        self.dtype = np.dtype(dtype).type                           # Initial type of the counters
+        self.C = np.zeros((self._matrices(), A, A), dtype=dtype)   # Counter matrices
+        self.peak = 0                                               # Upper bound of the counts
+
+        rng = np.random.default_rng(seed)
+        self.p = _choose_prime(10 * A)
+        self._generate_hash_parameters(rng)
+
+        if incremental:
+            self._refresh()
+
+    def _matrices(self) -> int:
+        """
+        Return the number of counter matrices.
+        """
+        return self.B
+
+    def _generate_hash_parameters(self, rng):
+        """
+        Generate the parameters of the hash functions, the same as those of B CounterMatrix
+        built from the rng in turn.
+
+        Args:
+            rng (np.random.Generator): the random number generator to use.
+        """
+        params = [[int(rng.integers(1, self.p)), int(rng.integers(0, self.p)),
+                   int(rng.integers(1, self.p)), int(rng.integers(0, self.p))] for _ in range(self.B)]
+        params = np.array(params, dtype=np.int64).reshape(self.B, 4)
+        self.param_x = params[:, :2].copy()         # Shape (B, 2)
+        self.param_y = params[:, 2:].copy()         # Shape (B, 2)
+
+    def _calculate_hash_functions(self, i, j):
+        """
+        Calculate the hash values of samples in all the matrices.
+
+        Args:
+            i, j (int or np.array of shape (k,)): samples of X and Y.
+
+        Returns:
+            x, y (np.array): shape (B,) or (B, k), the places in each counter matrix.
+        """
+        i, j = np.asarray(i), np.asarray(j)
+        shape = (self.B,) + (1,) * i.ndim
+        param_x, param_y = self.param_x, self.param_y
+        if i.size and self.p * (max(np.abs(i).max(), np.abs(j).max()) + 1) < 2 ** 31:
+            # The polynomials cannot overflow int32, which is much faster to divide
+            param_x, param_y = param_x.astype(np.int32), param_y.astype(np.int32)
+            i, j = i.astype(np.int32), j.astype(np.int32)
+        p, A = param_x.dtype.type(self.p), param_x.dtype.type(self.A)
+        x = (param_x[:, 0].reshape(shape) * i + param_x[:, 1].reshape(shape)) % p % A
+        y = (param_y[:, 0].reshape(shape) * j + param_y[:, 1].reshape(shape)) % p % A
+        return x, y
+
+    def _hash_key(self):
+        return (self.A, self.B, self.p, self.param_x.tobytes(), self.param_y.tobytes())
+
+    def _fit_dtype(self, low: int, high: int):
+        """
+        Return the smallest counter type, at least as large as the initial one, that holds
+        counts in [low, high].
+        """
+        if low < 0:
+            return np.int32 if max(-low, high) <= np.iinfo(np.int32).max else np.int64
+        start = COUNTER_DTYPES.index(self.dtype) if self.dtype in COUNTER_DTYPES else 0
+        return next(d for d in COUNTER_DTYPES[start:] if high <= np.iinfo(d).max)
+
+    def _reserve(self, increase: int):
+        """
+        Promote the counters to a larger type if the counts may exceed the current one
+        after increasing by up to `increase`.
+        """
+        self.peak += increase
+        if self.C.dtype.kind not in "iu" or self.peak <= np.iinfo(self.C.dtype).max:
+            return
+        # The bound is loose after decreases, so check the actual counts
+        self.peak = int(self.C.max()) + increase
+        if self.peak > np.iinfo(self.C.dtype).max:
+            self.C = self.C.astype(self._fit_dtype(int(self.C.min()), self.peak))
+
+    def _read_item(self, i, j):
+        super()._read_item(i, j)
+        x, y = self._calculate_hash_functions(i, j)
+        self._reserve(1)
+        b = np.arange(self.B)
+        if self.incremental:
+            # Same steps as in CounterMatrix._read_item, in every matrix
+            self.sum_squares += 2.0 * self.C[b, x, y] + 1
+            self.cross[b, x] += self.col[b, y]
+            self.row_squares += 2 * self.row[b, x] + 1
+            self.row[b, x] += 1
+            self.col_squares += 2 * self.col[b, y] + 1
+            self.col[b, y] += 1
+            self.C[b, x, y] += 1
+            self.cross += self.C[b, :, y]
+        else:
+            self.C[b, x, y] += 1
+
+    def read_batch(self, xs, ys):
+        xs, ys = self._to_arrays(xs, ys)
+        self.N += len(xs)
+        step = max(1, BATCH_ELEMENTS // self.B)
+        if len(xs) <= step:
+            # The hash values may be shared with other estimators, see engine.FanOut
+            x, y = self._hash_batch(xs, ys)
+            self._count(x * x.dtype.type(self.A) + y)
+            return
+        for start in range(0, len(xs), step):
+            x, y = self._calculate_hash_functions(xs[start:start + step], ys[start:start + step])
+            x *= x.dtype.type(self.A)
+            x += y
+            self._count(x)
+
+    def _count(self, cells):
+        """
+        Add a batch to the counters.
+
+        Args:
+            cells (np.array): shape (number of matrices, k), the cell x * A + y of each
+                sample in each matrix. It is modified.
+        """
+        self._reserve(cells.shape[1])
+        M = self.C.shape[0]
+        if self.C.size <= COUNT_BINS:
+            cells += (np.arange(M, dtype=cells.dtype) * cells.dtype.type(self.A * self.A)).reshape(M, 1)
+            D = np.bincount(cells.ravel(), minlength=self.C.size).reshape(self.C.shape)
+            if self.incremental:
+                self._add_statistics(D)
+            np.add(self.C, D, out=self.C, casting="unsafe")
+            return
+        # Count matrix by matrix, so that the counts stay in cache
+        for b in range(M):
+            D = np.bincount(cells[b], minlength=self.A * self.A).reshape(self.A, self.A)
+            if self.incremental:
+                self._add_statistics(D, b)
+            np.add(self.C[b], D, out=self.C[b], casting="unsafe")
+
+    def _add_statistics(self, D, b=slice(None)):
+        """
+        Update the incremental statistics with the counts D about to be added to the
+        matrices C[b], as in CounterMatrix._add_statistics.
+        """
+        C = self.C[b]
+        d_row, d_col = np.sum(D, axis=-1), np.sum(D, axis=-2)
+        self.sum_squares[b] += np.sum((2.0 * C + D) * D, axis=(-2, -1))
+        self.cross[b] += np.matmul(D, self.col[b, ..., None].astype(np.float64))[..., 0]
+        self.row_squares[b] += np.sum((2.0 * self.row[b] + d_row) * d_row, axis=-1)
+        self.row[b] += d_row
+        self.col_squares[b] += np.sum((2.0 * self.col[b] + d_col) * d_col, axis=-1)
+        self.col[b] += d_col
+        self.cross[b] += np.matmul(C + D, d_col[..., None].astype(np.float64))[..., 0]
+
+    def counters(self) -> list:
+        # Integer counters are handed out as int64, so that they can be added up and
+        # subtracted without overflowing the compact type
+        N, C = super().counters()
+        return [N, C.astype(np.int64) if C.dtype.kind in "iu" else C]
+
+    def _refresh(self, previous: dict = None):
+        """
+        Store integer counters with the smallest type that holds them, and update the
+        incremental statistics (see CounterMatrix._refresh).
+        """
+        integer = self.C.dtype.kind in "iu"
+        if self.incremental:
+            old = previous.get("C") if previous is not None else None
+            if old is not None and old is not self.C and hasattr(self, "cross") and \
+                    integer and old.dtype.kind in "iu":
+                C, self.C = self.C, old
+                self._add_statistics(C.astype(np.int64) - old)
+                self.C = C
+            else:
+                C = self.C.astype(np.int64 if integer else np.float64)
+                self.row = np.sum(C, axis=2)
+                self.col = np.sum(C, axis=1)
+                self.cross = np.matmul(C, self.col[..., None].astype(np.float64))[..., 0]
+                self.sum_squares = np.sum(C.astype(np.float64) ** 2, axis=(1, 2))
+                self.row_squares = np.sum(self.row.astype(np.float64) ** 2, axis=1)
+                self.col_squares = np.sum(self.col.astype(np.float64) ** 2, axis=1)
+        if not integer:
+            return
+        low, high = (int(self.C.min()), int(self.C.max())) if self.C.size else (0, 0)
+        self.C = self.C.astype(self._fit_dtype(low, high), copy=False)
+        self.peak = high
+
+    def statistics(self) -> np.ndarray:
+        """
+        Return the statistic of each counter matrix, i.e. CounterMatrix.compute() of each.
+
+        Returns:
+            np.array of shape (B,).
+        """
+        if self.incremental:
+            # ||C / N - row col^T / N^2||^2, expanded as in CounterMatrix.compute
+            N = float(self.N)
+            cross = np.sum(self.row * self.cross, axis=1)
+            norm = self.sum_squares / N ** 2 - 2 * cross / N ** 3 + \
+                self.row_squares * self.col_squares / N ** 4
+            return np.maximum(norm, 0.0) / (1-1/self.A) ** 2
+        C = self.C.astype(float)
+        p_x = np.sum(C, axis=2, keepdims=True)
+        p_y = np.sum(C, axis=1, keepdims=True)
+        difference = C / self.N - p_x * p_y / self.N ** 2
+        return np.sum(difference ** 2, axis=(1, 2)) / (1-1/self.A) ** 2
+
+    def chisq(self):
+        """
+        Return Pearson's chi-square statistic of independence of each counter matrix, seen
+        as the contingency table of the hashed samples, and its degrees of freedom. Rows
+        and columns that are never hit are left out.
+
+        Returns:
+            statistic, dof (np.array): shape (B,).
+        """
+        C = self.C.astype(float)
+        row = np.sum(C, axis=2, keepdims=True)
+        col = np.sum(C, axis=1, keepdims=True)
+        expected = row * col / max(self.N, 1)
+        nonzero = expected > 0
+        terms = np.zeros_like(C)
+        terms[nonzero] = (C[nonzero] - expected[nonzero]) ** 2 / expected[nonzero]
+        dof = (np.count_nonzero(row[:, :, 0], axis=1) - 1) * (np.count_nonzero(col[:, 0, :], axis=1) - 1)
+        return np.sum(terms, axis=(1, 2)), dof
+
+    def compute(self) -> float:
+        return np.mean(self.statistics())
+
+
+class L2Estimator(CounterTensor):
     """
     Estimator for L2 difference that uses multiple counter matrices and return the mean
     norm.
@@ -66,25 +420,19 @@ class L2Estimator(Estimator):
     Args:
         A (int): size of counter matrix
         B (int): number of counter matrices
+        seed (int or np.random.Generator): seed of the hash functions.
+        incremental (bool): maintain the statistics as the items arrive, see
+            CounterMatrix.
+        dtype (np.dtype): initial type of the counters.
     """
-    def __init__(self, A: int, B: int) -> None:
-        super().__init__(input_type=int)
-
-        self.C_list = []
-        for _ in range(B):
-            self.C_list.append(CounterMatrix(A, metric="l2"))
-        
-    def _read_item(self, i, j):
-        for C in self.C_list:
-            C._read_item(i, j)
-    
     def compute(self) -> float:
-        res = [C.compute() for C in self.C_list]
-        print("variance:", np.var(res))
+        res = self.statistics()
+        if self.verbose:
+            print("variance:", np.var(res))
         return np.sqrt(np.median(res))
 
 
-class L1Estimator(Estimator):
+class L1Estimator(CounterTensor):
     """
     Estimator for L1 difference that uses multiple counter matrices and return the largest
     norm (since result from counter matrix is always underestimated).
@@ -93,25 +441,188 @@ class L1Estimator(Estimator):
         A (int): size of counter matrix
         B (int): number of counter matrices
         n (int): range of the distributions
+        seed (int or np.random.Generator): seed of the hash functions.
+        incremental (bool): maintain the statistics as the items arrive, see
+            CounterMatrix.
+        dtype (np.dtype): initial type of the counters.
     """
-    def __init__(self, A: int, B: int, n: int) -> None:
-        super().__init__(input_type=int)
+    _hash_state = CounterTensor._hash_state + ("n",)
+
+    def __init__(self, A: int, B: int, n: int, seed=None, incremental: bool = False,
+                 dtype=np.uint16) -> None:
+        super().__init__(A, B, seed=seed, incremental=incremental, dtype=dtype)
         self.n = n
 
-        self.C_list = []
-        for _ in range(B):
-            self.C_list.append(CounterMatrix(A, metric="l1"))
-        
-    def _read_item(self, i, j):
-        for C in self.C_list:
-            C._read_item(i, j)
-    
     def compute(self) -> float:
-        res = [C.compute() for C in self.C_list]
-        
-        return np.sqrt(np.mean(res)) * self.n
+        return np.sqrt(np.mean(self.statistics())) * self.n
+
+
+class AllPairsL2Estimator(CounterTensor):
+    """
+    The L2 differences of all the pairs among k variables, read from streams of k columns
+    in one pass. Each pair of columns (c, d), c < d, has B counter matrices as in
+    L2Estimator, with column c hashed into the rows and column d into the columns.
+    The hash functions belong to the columns rather than to the matrices: each column is
+    hashed once per item with B hash functions, and the values are shared by the k - 1
+    pairs the column is in, so an item costs k * B hash evaluations and k (k - 1) / 2 * B
+    counter increments, instead of k (k - 1) * B hash evaluations with one estimator per
+    pair.
+
+    The counter matrices of all the pairs are stored in one CounterTensor, those of the
+    q-th pair of `pairs` being C[q * B:(q + 1) * B].
+
+    Args:
+        k (int): number of variables (columns of the stream).
+        A (int): size of each counter matrix.
+        B (int): number of counter matrices per pair.
+        seed (int or np.random.Generator): seed of the hash functions.
+        dtype (np.dtype): initial type of the counters.
+    """
+    _hash_state = ("A", "B", "k", "p", "param")
+
+    def __init__(self, k: int, A: int, B: int, seed=None, dtype=np.uint16) -> None:
+        assert k >= 2, "at least 2 variables are needed."
+        # The number of matrices and the hash functions depend on the pairs
+        self.k = k
+        self.columns = k
+        self.pairs = np.array(list(itertools.combinations(range(k), 2)))  # Shape (k (k - 1) / 2, 2)
+        super().__init__(A, B, seed=seed, dtype=dtype)
+
+    def _matrices(self) -> int:
+        return len(self.pairs) * self.B
+
+    def _generate_hash_parameters(self, rng):
+        """
+        Generate B hash functions per column.
+        """
+        self.param = np.stack([rng.integers(1, self.p, size=(self.k, self.B)),
+                               rng.integers(0, self.p, size=(self.k, self.B))], axis=-1)  # Shape (k, B, 2)
+
+    def _hash_key(self):
+        return None
+
+    def _calculate_hash_functions(self, *values):
+        """
+        Calculate the hash values of the samples of all the columns.
+
+        Args:
+            values (int or np.array of shape (m,)): the samples of each of the k variables.
+
+        Returns:
+            np.array of shape (k, B) or (k, B, m), the hash values of each sample by each
+            of the B hash functions of its column, i.e. one array per column as the x, y
+            of CounterTensor._calculate_hash_functions.
+        """
+        values = np.asarray(values)
+        shape = (self.k, self.B) + (1,) * (values.ndim - 1)
+        values = values.reshape((self.k, 1) + values.shape[1:])
+        param = self.param
+        if values.size and self.p * (np.abs(values).max() + 1) < 2 ** 31:
+            # The polynomials cannot overflow int32, which is much faster to divide
+            param, values = param.astype(np.int32), values.astype(np.int32)
+        p, A = param.dtype.type(self.p), param.dtype.type(self.A)
+        return (param[..., 0].reshape(shape) * values + param[..., 1].reshape(shape)) % p % A
+
+    def _cells(self, h):
+        """
+        Combine the hash values of the columns into the cells x * A + y of every matrix.
+
+        Args:
+            h (np.array): hash values returned by _calculate_hash_functions.
+
+        Returns:
+            np.array of shape (k (k - 1) / 2 * B,) or (k (k - 1) / 2 * B, m).
+        """
+        cells = h[self.pairs[:, 0]] * h.dtype.type(self.A) + h[self.pairs[:, 1]]
+        return cells.reshape((-1,) + h.shape[2:])
+
+    def _read_item(self, *values):
+        """
+        Read one sample of each of the k variables.
+        """
+        assert len(values) == self.k, f"expected {self.k} samples but got {len(values)}."
+        self.N += 1
+        cells = self._cells(self._calculate_hash_functions(*values))
+        self._reserve(1)
+        self.C.reshape(len(cells), -1)[np.arange(len(cells)), cells] += 1
+
+    def read_batch(self, *columns):
+        """
+        Read a batch of items, given as k arrays with the samples of each variable.
+        """
+        assert len(columns) == self.k, f"expected {self.k} columns but got {len(columns)}."
+        values = np.stack([np.asarray(c, dtype=np.int64).ravel() for c in columns])
+        self.N += values.shape[1]
+        step = max(1, BATCH_ELEMENTS // self.C.shape[0])
+        for start in range(0, values.shape[1], step):
+            self._count(self._cells(self._calculate_hash_functions(*values[:, start:start + step])))
 
+    def compute(self) -> np.ndarray:
+        """
+        Estimate the L2 difference of every pair of variables.
 
+        Returns:
+            np.array of shape (k, k), symmetric, whose entry (c, d) is the estimated L2
+            difference between the joint distribution of the variables c and d and the
+            product of their marginals. The diagonal is nan.
+        """
+        res = np.sqrt(np.median(self.statistics().reshape(len(self.pairs), self.B), axis=1))
+        matrix = np.full((self.k, self.k), np.nan)
+        matrix[self.pairs[:, 0], self.pairs[:, 1]] = res
+        matrix[self.pairs[:, 1], self.pairs[:, 0]] = res
+        return matrix
 
 
-        
\ No newline at end of file
+class ChiSquareEstimator(CounterTensor):
+    """
+    Chi-square test of independence of X and Y on B counter matrices. If X and Y are
+    independent, so are their hashes x(X) and y(Y), so each counter matrix is the
+    contingency table of two independent variables and Pearson's test on it is valid
+    whatever the hash functions. Dependence is detected as long as it survives the hashing
+    in one of the matrices. The p-values of the B matrices are combined with the
+    Bonferroni correction (B times the smallest one) or as twice their median, both valid
+    for dependent tests.
+
+    Args:
+        A (int): size of each counter matrix.
+        B (int): number of counter matrices.
+        metric (str): "chisq" to compute the p-value, or "independent" to compute whether
+            independence is accepted at level alpha, as in exact.ExactEstimator.
+        alpha (float): level of the test.
+        aggregate (str): how the p-values of the matrices are combined, "bonferroni" or
+            "median".
+        seed (int or np.random.Generator): seed of the hash functions.
+        dtype (np.dtype): initial type of the counters.
+    """
+    def __init__(self, A: int, B: int, metric: str = "independent", alpha: float = 0.05,
+                 aggregate: str = "bonferroni", seed=None, dtype=np.uint16) -> None:
+        super().__init__(A, B, seed=seed, dtype=dtype)
+        assert metric in ["chisq", "independent"], f"metric {metric} is not supported."
+        assert aggregate in ["bonferroni", "median"], f"aggregate {aggregate} is not supported."
+        self.metric = metric
+        self.alpha = alpha
+        self.aggregate = aggregate
+
+    def p_values(self) -> np.ndarray:
+        """
+        Return the p-value of the test on each counter matrix, 1 if a matrix has a single
+        row or column hit.
+
+        Returns:
+            np.array of shape (B,).
+        """
+        statistic, dof = self.chisq()
+        return np.where(dof > 0, chi2.sf(statistic, np.maximum(dof, 1)), 1.0)
+
+    def p_value(self) -> float:
+        """
+        Return the p-value of the test, combining those of the matrices.
+        """
+        p = self.p_values()
+        if self.aggregate == "bonferroni":
+            return min(1.0, self.B * float(np.min(p)))
+        return min(1.0, 2 * float(np.median(p)))
+
+    def compute(self):
+        p = self.p_value()
+        return p if self.metric == "chisq" else p > self.alpha
@@ -0,0 +1,115 @@
+import copy
+import numpy as np
+from mini_project.utils import Estimator
+
+
+class DiscretizedEstimator(Estimator):
+    """
+    Estimator for streams of real values: each column is cut into `bins` buckets of
+    (approximately) equal frequency, and the bucket numbers 1, ..., bins are read by an
+    estimator on integers, so that the metric is that of the discretized distributions.
+
+    The bucket edges are learned from the stream itself, in the same pass: the first
+    `warmup` items are kept, the edges are set to the exact quantiles of each column among
+    them, and the kept items are then read with the others. The edges are not maintained
+    online by a quantile sketch over the whole stream: after the warmup they are fixed,
+    since the counters of the wrapped estimator must keep the same meaning, and values
+    outside the warmup range go to the first or the last bucket. Streams whose
+    distribution drifts after the warmup are therefore cut into buckets of unequal
+    frequency. Memory is `warmup` items during the warmup, then `bins` edges per column.
+
+    Estimators can be merged if they use the same edges, e.g. given by `edges` or taken
+    from the `edges` of another estimator.
+
+    Args:
+        estimator (utils.Estimator): an empty estimator on integers in [1, bins], e.g.
+            counter_matrix.L2Estimator or sketching_sketches.L2Estimator with n=bins. It
+            may read more than 2 columns (e.g. counter_matrix.AllPairsL2Estimator).
+        bins (int): number of buckets of each column.
+        warmup (int): number of items the edges are learned from.
+        edges (list of np.array): the inner edges (at most bins - 1, increasing) of each
+            column, instead of learning them.
+    """
+    _hash_state = ("bins", "edges")
+
+    def __init__(self, estimator: Estimator, bins: int, warmup: int = 1 << 16, edges: list = None) -> None:
+        assert estimator.input_type is int, "the wrapped estimator should read integers."
+        super().__init__(input_type=float)
+        self.estimator = estimator
+        self.columns = estimator.columns
+        self.bins = bins
+        self.warmup = warmup
+        self.buffer = []          # Items of the warmup
+        self.edges = None
+        if edges is not None:
+            assert len(edges) == self.columns, f"expected the edges of {self.columns} columns."
+            self.edges = [np.asarray(e, dtype=np.float64) for e in edges]
+            assert all(len(e) < bins for e in self.edges), f"at most {bins - 1} edges per column."
+
+    def _children(self):
+        return [self.estimator]
+
+    def _learns_hash_state(self) -> bool:
+        # The edges are the quantiles of the warmup prefix of the stream
+        return self.edges is None or super()._learns_hash_state()
+
+    def _learn_edges(self):
+        """
+        Set the edges to the quantiles of the warmup items, if they are not set yet, and
+        read the warmup items.
+        """
+        if self.edges is not None:
+            return
+        quantiles = np.linspace(0, 1, self.bins + 1)[1:-1]
+        columns = [np.concatenate(c) for c in zip(*self.buffer)] if self.buffer else \
+            [np.zeros(0)] * self.columns
+        # Repeated quantiles (e.g. values with ties) give fewer buckets
+        self.edges = [np.unique(np.quantile(c, quantiles)) if len(c) else np.zeros(0) for c in columns]
+        buffer, self.buffer = self.buffer, []
+        for batch in buffer:
+            self.estimator.read_batch(*self.discretize(*batch))
+
+    def discretize(self, *columns) -> list:
+        """
+        Map a batch of real values to their buckets.
+
+        Args:
+            columns (np.array): the samples of each column.
+
+        Returns:
+            A list of np.array of dtype int64, with values in [1, bins].
+        """
+        assert self.edges is not None, "the edges are not learned yet."
+        return [np.searchsorted(e, np.asarray(c, dtype=np.float64), side="right") + 1
+                for e, c in zip(self.edges, columns)]
+
+    def _read_item(self, *values):
+        # Same as a batch of one item (read_batch counts N)
+        self.read_batch(*[[v] for v in values])
+
+    def read_batch(self, *columns):
+        assert len(columns) == self.columns, f"expected {self.columns} columns but got {len(columns)}."
+        columns = [np.asarray(c, dtype=np.float64).ravel() for c in columns]
+        self.N += len(columns[0])
+        if self.edges is not None:
+            self.estimator.read_batch(*self.discretize(*columns))
+            return
+        self.buffer.append([c.copy() for c in columns])
+        if self.N >= self.warmup:
+            self._learn_edges()
+
+    def is_compatible(self, other) -> bool:
+        # The counters only have a meaning once the edges are set
+        return self.edges is not None and super().is_compatible(other)
+
+    def reset(self):
+        super().reset()
+        self.buffer = []
+
+    def compute(self):
+        if self.edges is None:
+            # Learn the edges on a copy, so that querying during the warmup does not end it
+            estimator = copy.deepcopy(self)
+            estimator._learn_edges()
+            return estimator.compute()
+        return self.estimator.compute()
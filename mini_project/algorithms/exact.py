@@ -6,6 +6,9 @@ from scipy.stats import chi2
 SUPPORTED_METRICS = ["l1", "l2", "chisq", "independent"]
 
 class ExactEstimator(Estimator):
+    _linear_state = ("C",)
+    _hash_state = ("n",)
+
     def __init__(self, n: int, metric: List[str] = ["l2"]) -> None:
         """
         Creator for the exact estimator.
@@ -28,28 +31,183 @@ class ExactEstimator(Estimator):
         super()._read_item(i, j)
         self.C[i-1, j-1] += 1
 
-    def compute(self) -> float:
+    def read_batch(self, xs, ys):
+        xs, ys = self._to_arrays(xs, ys)
+        self.N += len(xs)
+        np.add.at(self.C, (xs - 1, ys - 1), 1)
+
+    def _statistics(self) -> dict:
+        """
+        Compute the l1 and l2 difference between the observed joint distribution and the
+        product of the observed marginals, and the chi-square statistic of the table with
+        its degrees of freedom.
+        """
         p_x = np.sum(self.C, axis=1, keepdims=True)
         p_y = np.sum(self.C, axis=0, keepdims=True)
         observed = self.C
         expected = np.dot(p_x, p_y) / self.N
+
+        # Cells with expected count 0 (values never seen) are left out of the statistic,
+        # and so are their rows and columns from the degrees of freedom
+        nonzero = expected > 0
+        chisq_stat = np.sum((observed[nonzero] - expected[nonzero]) ** 2 / expected[nonzero])
+        return {
+            "l1": np.sum(np.absolute(observed / self.N - expected / self.N)),
+            "l2": np.linalg.norm(observed / self.N - expected / self.N),
+            "chisq": chisq_stat,
+            "dof": (np.count_nonzero(p_x) - 1) * (np.count_nonzero(p_y) - 1),
+        }
+
+    def compute(self) -> list:
+        """
+        Compute the metrics.
+
+        Returns:
+            A list with the value of each metric of self.metric, in the same order.
+        """
+        statistics = self._statistics()
         
         res = []
         for m in self.metric:
             if m == "l2":
-                res.append(np.linalg.norm(observed / self.N - expected / self.N))
+                res.append(statistics["l2"])
             elif m == "l1":
-                res.append(np.sum(np.absolute(observed / self.N - expected / self.N)))
+                res.append(statistics["l1"])
             elif m == "chisq" or m == "independent":
-                chisq_stat = np.sum((observed - expected) ** 2 / expected)
-                deg_of_freedom = (self.n - 1) ** 2
-                p_value = 1 - chi2.cdf(chisq_stat, deg_of_freedom)
+                chisq_stat = statistics["chisq"]
+                deg_of_freedom = statistics["dof"]
+                # A single row or column seen cannot show any dependence
+                p_value = 1 - chi2.cdf(chisq_stat, deg_of_freedom) if deg_of_freedom > 0 else 1.0
                 if m == "chisq":
                     res.append(p_value)
                 else:
                     res.append(p_value > 0.05)
         
-        if len(res) == 0:
-            return res[0]
-        else:
-            return res
\ No newline at end of file
+        return res
+
+
+class SparseExactEstimator(ExactEstimator):
+    """
+    Exact estimator that only stores the observed cells (i, j) with their counts, instead
+    of the dense n * n table, so that the memory scales with the number of distinct pairs.
+    The metrics are computed from the marginals: each unobserved cell has observed count
+    0, so its contribution only depends on its expected count r_i * c_j / N, and the
+    unobserved cells are summed up as the total minus the observed ones.
+
+    The observed cells (keys, counts) are not linear in the stream, since the keys depend
+    on the pairs observed: they come after the linear state in counters(), and are merged
+    by _add_counters.
+    """
+    _linear_state = ("row", "col")
+
+    def __init__(self, n: int, metric: List[str] = ["l2"]) -> None:
+        """
+        Creator for the sparse exact estimator.
+
+        Args:
+            n (int): range of the samples should be [1, n].
+            metric (str or List[str]): type of metric to be estimated.
+        """
+        Estimator.__init__(self, input_type=int)
+        self.n = n
+        if isinstance(metric, str):
+            metric = [metric]
+        for m in metric:
+            assert m in SUPPORTED_METRICS, f"metric {m} is not supported."
+        self.metric = metric
+
+        # Marginal counts of X and Y
+        self.row = np.zeros(n, dtype=np.int64)
+        self.col = np.zeros(n, dtype=np.int64)
+
+        # Sorted keys (i - 1) * n + (j - 1) of the observed cells, and their counts
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+
+        # Keys that are not yet added to self.keys
+        self._pending = []
+        self._pending_size = 0
+
+    def _read_item(self, i, j):
+        Estimator._read_item(self, i, j)
+        self.row[i-1] += 1
+        self.col[j-1] += 1
+        self._add_pending(np.array([(i - 1) * self.n + (j - 1)], dtype=np.int64))
+
+    def read_batch(self, xs, ys):
+        xs, ys = self._to_arrays(xs, ys)
+        self.N += len(xs)
+        np.add.at(self.row, xs - 1, 1)
+        np.add.at(self.col, ys - 1, 1)
+        self._add_pending((xs - 1) * self.n + (ys - 1))
+
+    def _add_pending(self, keys):
+        """
+        Buffer the keys of new samples, and add them to the table once the buffer is as
+        large as the table, so the amortized cost per sample is O(log(distinct pairs)).
+        """
+        self._pending.append(keys)
+        self._pending_size += len(keys)
+        if self._pending_size >= max(len(self.keys), 1 << 16):
+            self._flush()
+
+    def _flush(self):
+        """
+        Add the buffered keys to the table.
+        """
+        if self._pending_size == 0:
+            return
+        keys = np.concatenate(self._pending)
+        self._pending, self._pending_size = [], 0
+        self._add_cells(keys, np.ones(len(keys), dtype=np.int64))
+
+    def _add_cells(self, keys, counts):
+        """
+        Add counts to the cells with the given keys, and drop the cells with count 0.
+        """
+        keys, inverse = np.unique(np.concatenate([self.keys, keys]), return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate([self.counts, counts]),
+                             minlength=len(keys)).astype(np.int64)
+        self.keys, self.counts = keys[counts != 0], counts[counts != 0]
+
+    def counters(self) -> list:
+        self._flush()
+        return super().counters() + [self.keys, self.counts]
+
+    def _load_counters(self, counters: list):
+        *linear, self.keys, self.counts = counters
+        self._pending, self._pending_size = [], 0
+        super()._load_counters(linear)
+
+    def _add_counters(self, counters: list, sign: int = 1):
+        N, row, col, keys, counts = counters
+        self._flush()
+        self.N += sign * N
+        self.row = self.row + sign * row
+        self.col = self.col + sign * col
+        self._add_cells(keys, sign * counts)
+
+    def reset(self):
+        self._pending, self._pending_size = [], 0
+        super().reset()
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def _statistics(self) -> dict:
+        self._flush()
+        r = self.row.astype(float)
+        c = self.col.astype(float)
+        observed = self.counts.astype(float)
+        expected = r[self.keys // self.n] * c[self.keys % self.n] / self.N
+
+        # Expected counts of the unobserved cells
+        unobserved = self.N - np.sum(expected)
+        unobserved_squares = np.sum(r ** 2) * np.sum(c ** 2) / self.N ** 2 - np.sum(expected ** 2)
+
+        l2 = np.sum((observed - expected) ** 2) + max(unobserved_squares, 0)
+        return {
+            "l1": (np.sum(np.absolute(observed - expected)) + max(unobserved, 0)) / self.N,
+            "l2": np.sqrt(l2) / self.N,
+            "chisq": np.sum((observed - expected) ** 2 / expected) + max(unobserved, 0),
+            "dof": (np.count_nonzero(r) - 1) * (np.count_nonzero(c) - 1),
+        }
@@ -0,0 +1,286 @@
+"""
+Hybrid estimator for skewed streams: the heaviest pairs are counted exactly, and only the
+other items (the tail) go through the sketches.
+
+On skewed (e.g. zipfian) streams a few cells (i, j) carry most of the mass, and their
+differences p_ij - p_i q_j dominate the variance of the sketches through their
+collisions. Let H be the set of heavy pairs and D the difference matrix p_ij - p_i q_j.
+Then
+
+    ||D||^2 = sum_{(i, j) in H} D_ij^2 + ||D'||^2
+
+where D' is D with the heavy cells set to 0. The first term is exact, since the counts of
+the heavy pairs and the marginal counts of their values are tracked exactly. The second
+one is estimated with signed counter matrices: the values i and j are hashed into a row
+x(i) and a column y(j) and given random signs s(i) and t(j), and
+
+    M_xy = sum_{x(i) = x, y(j) = y} s(i) t(j) D'_ij
+
+has E ||M||^2 = ||D'||^2. (Unsigned counter matrices, as in CounterMatrix, rely on the
+rows and columns of D summing to 0, which is not the case of D'.) M is made of the signed
+counts of the tail, the signed hashed marginals of the whole stream and the exact counts
+of the heavy cells:
+
+    M_xy = S_xy / N - r_x c_y / N^2 + sum_{(i, j) in H -> (x, y)} s(i) t(j) n_i n_j / N^2
+
+The heavy pairs are chosen after a warmup prefix, with a Misra-Gries summary that is
+updated a batch at a time. The warmup items are kept and read once the pairs are chosen.
+The selection is warmup-only: the heavy pairs are fixed afterwards, and the summary is
+dropped. Pairs that only become heavy later are read by the sketches, which keeps the
+estimate unbiased but without the variance reduction for those pairs, so streams whose
+heavy pairs drift need a longer warmup (or the pairs given with `heavy_pairs`).
+"""
+import copy
+import numpy as np
+from mini_project.utils import Estimator, _choose_prime
+from mini_project.algorithms.counter_matrix import BATCH_ELEMENTS
+
+
+def misra_gries_update(keys: np.ndarray, counts: np.ndarray, new_keys: np.ndarray, capacity: int):
+    """
+    Add a batch of keys to a Misra-Gries summary with at most `capacity` counters. The
+    batch is counted exactly and merged with the summary, then the (capacity + 1)-th
+    largest count is subtracted from all the counts and the non-positive ones are dropped,
+    which is the merge of two summaries of Agarwal et al. Each count underestimates the
+    frequency of its key by at most (number of keys) / (capacity + 1).
+
+    Args:
+        keys (np.array): sorted keys of the summary.
+        counts (np.array): counts of the keys.
+        new_keys (np.array): keys of the batch.
+        capacity (int): maximum number of counters.
+
+    Returns:
+        keys, counts (np.array): the updated summary.
+    """
+    batch_keys, batch_counts = np.unique(new_keys, return_counts=True)
+    keys, inverse = np.unique(np.concatenate([keys, batch_keys]), return_inverse=True)
+    counts = np.bincount(inverse, weights=np.concatenate([counts, batch_counts])).astype(np.int64)
+    if len(keys) > capacity:
+        threshold = np.partition(counts, len(counts) - capacity - 1)[len(counts) - capacity - 1]
+        counts = counts - threshold
+        keys, counts = keys[counts > 0], counts[counts > 0]
+    return keys, counts
+
+
+def _check_range(xs: np.ndarray, ys: np.ndarray):
+    """
+    Check that the samples are in [0, 2^31), where their pair keys and hash values cannot
+    overflow int64.
+    """
+    assert not len(xs) or (min(xs.min(), ys.min()) >= 0 and max(xs.max(), ys.max()) < 2 ** 31), \
+        "the samples should be in [0, 2^31)."
+
+
+def _pair_keys(xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    """
+    Encode the pairs (xs[k], ys[k]) of non-negative samples below 2^31 into int64 keys.
+    """
+    _check_range(xs, ys)
+    return (xs << 32) | ys
+
+
+class HybridL2Estimator(Estimator):
+    """
+    Estimator for L2 difference that counts the heaviest pairs (i, j) exactly, together
+    with the marginal counts of their values, and reads the other items into B signed
+    counter matrices. See the module documentation for how both parts are combined.
+
+    The heavy pairs are only chosen from the warmup items, and fixed afterwards (see the
+    module documentation). Estimators can be merged if they use the same heavy pairs, e.g.
+    given by `heavy_pairs` or taken from the `heavy_keys` of another estimator.
+
+    Args:
+        A (int): size of each counter matrix.
+        B (int): number of counter matrices.
+        heavy (int): number of heavy pairs counted exactly.
+        warmup (int): number of items read before choosing the heavy pairs.
+        capacity (int): number of counters of the Misra-Gries summary used to find the
+            heavy pairs during the warmup, 4 * heavy by default.
+        heavy_pairs (np.array of shape (h, 2)): the heavy pairs, instead of finding them
+            during the warmup.
+        seed (int or np.random.Generator): seed of the hash functions.
+    """
+    _linear_state = ("C", "row", "col", "heavy_counts", "row_counts", "col_counts")
+    _hash_state = ("A", "B", "p", "param", "heavy_keys")
+
+    def __init__(self, A: int, B: int, heavy: int = 64, warmup: int = 1 << 16, capacity: int = None,
+                 heavy_pairs=None, seed=None) -> None:
+        super().__init__(input_type=int)
+        self.A = A
+        self.B = B
+        self.heavy = heavy
+        self.warmup = warmup
+        self.capacity = capacity if capacity is not None else 4 * heavy
+        assert self.capacity >= heavy, "the summary should have at least `heavy` counters."
+        self.C = np.zeros((B, A, A), dtype=np.int64)   # Signed counts of the tail
+        self.row = np.zeros((B, A), dtype=np.int64)    # Signed hashed marginals of the tail
+        self.col = np.zeros((B, A), dtype=np.int64)
+
+        # Hash functions (a v + b) mod p mod 2A of X and Y, whose last bit is the sign
+        rng = np.random.default_rng(seed)
+        self.p = _choose_prime(2 ** 30)
+        self.param = np.stack([rng.integers(1, self.p, size=(2, B)),
+                               rng.integers(0, self.p, size=(2, B))], axis=-1)  # Shape (2, B, 2)
+
+        # Warmup items and Misra-Gries summary of their pairs
+        self.buffer = []
+        self.summary_keys = np.zeros(0, dtype=np.int64)
+        self.summary_counts = np.zeros(0, dtype=np.int64)
+
+        self.heavy_keys = None
+        self.heavy_counts = np.zeros(0, dtype=np.int64)
+        self.row_counts = np.zeros(0, dtype=np.int64)
+        self.col_counts = np.zeros(0, dtype=np.int64)
+        if heavy_pairs is not None:
+            heavy_pairs = np.asarray(heavy_pairs, dtype=np.int64).reshape(-1, 2)
+            self._set_heavy(_pair_keys(heavy_pairs[:, 0], heavy_pairs[:, 1]))
+
+    def _calculate_hash_functions(self, i, j):
+        """
+        Calculate the places and signs of samples in all the matrices.
+
+        Args:
+            i, j (np.array of shape (k,)): samples of X and Y, in [0, 2^31).
+
+        Returns:
+            x, y (np.array): shape (B, k), the hash values in [0, 2A) of i and j in each
+                matrix: the row (column) is x >> 1 and the sign is -1 if x & 1 else 1.
+        """
+        return [(param[:, :1] * values + param[:, 1:]) % self.p % (2 * self.A)
+                for param, values in zip(self.param, [i, j])]
+
+    def _set_heavy(self, keys: np.ndarray):
+        """
+        Fix the heavy pairs, given by their keys, and start counting them.
+        """
+        self.heavy_keys = np.unique(keys)
+        self.heavy_x, self.heavy_y = self.heavy_keys >> 32, self.heavy_keys & 0xFFFFFFFF
+        self.rows, self.heavy_rows = np.unique(self.heavy_x, return_inverse=True)
+        self.cols, self.heavy_cols = np.unique(self.heavy_y, return_inverse=True)
+        self.heavy_counts = np.zeros(len(self.heavy_keys), dtype=np.int64)
+        self.row_counts = np.zeros(len(self.rows), dtype=np.int64)
+        self.col_counts = np.zeros(len(self.cols), dtype=np.int64)
+
+    def _finish_warmup(self):
+        """
+        Choose the heavy pairs from the summary, if they are not chosen yet, and read the
+        warmup items.
+        """
+        if self.heavy_keys is not None:
+            return
+        top = np.argsort(self.summary_counts, kind="stable")[::-1][:self.heavy]
+        self._set_heavy(self.summary_keys[top])
+        buffer, self.buffer = self.buffer, []
+        self.summary_keys, self.summary_counts = self.summary_keys[:0], self.summary_counts[:0]
+        for xs, ys in buffer:
+            self._route(xs, ys)
+
+    @staticmethod
+    def _count(values: np.ndarray, samples: np.ndarray):
+        """
+        Count the samples equal to each of the sorted values.
+        """
+        if not len(values):
+            return np.zeros(0, dtype=np.int64), np.zeros(len(samples), dtype=bool)
+        position = np.minimum(np.searchsorted(values, samples), len(values) - 1)
+        hit = values[position] == samples
+        return np.bincount(position[hit], minlength=len(values)), hit
+
+    def _route(self, xs, ys):
+        """
+        Count the heavy pairs and the marginals of their values, and read the other items
+        into the signed counter matrices.
+        """
+        counts, heavy_row = self._count(self.rows, xs)
+        self.row_counts += counts
+        self.col_counts += self._count(self.cols, ys)[0]
+        # Only the items with a heavy value of X can be heavy pairs
+        counts, heavy = self._count(self.heavy_keys, _pair_keys(xs[heavy_row], ys[heavy_row]))
+        self.heavy_counts += counts
+        if heavy.any():
+            heavy_row[heavy_row] = heavy
+            xs, ys = xs[~heavy_row], ys[~heavy_row]
+
+        # Count the positive and negative items of each place apart, as 2 x + sign
+        step = max(1, BATCH_ELEMENTS // self.B)
+        offset = (np.arange(self.B) * 2 * self.A).reshape(self.B, 1)
+        for start in range(0, len(xs), step):
+            x, y = self._calculate_hash_functions(xs[start:start + step], ys[start:start + step])
+            x += offset
+            y += offset
+            D = np.bincount(x.ravel(), minlength=2 * self.row.size).reshape(self.B, self.A, 2)
+            self.row += D[..., 0] - D[..., 1]
+            D = np.bincount(y.ravel(), minlength=2 * self.col.size).reshape(self.B, self.A, 2)
+            self.col += D[..., 0] - D[..., 1]
+            cells = ((x >> 1) * self.A + ((y - offset) >> 1)) * 2 + ((x ^ y) & 1)
+            D = np.bincount(cells.ravel(), minlength=2 * self.C.size).reshape(self.C.shape + (2,))
+            self.C += D[..., 0] - D[..., 1]
+
+    def _read_item(self, i, j):
+        # Same as a batch of one item (read_batch counts N)
+        self.read_batch(np.array([i]), np.array([j]))
+
+    def read_batch(self, xs, ys):
+        xs, ys = self._to_arrays(xs, ys)
+        _check_range(xs, ys)
+        self.N += len(xs)
+        if self.heavy_keys is not None:
+            self._route(xs, ys)
+            return
+        self.buffer.append((xs.copy(), ys.copy()))
+        self.summary_keys, self.summary_counts = misra_gries_update(
+            self.summary_keys, self.summary_counts, _pair_keys(xs, ys), self.capacity)
+        if self.N >= self.warmup:
+            self._finish_warmup()
+
+    def _learns_hash_state(self) -> bool:
+        # The heavy pairs are chosen from the warmup prefix of the stream
+        return self.heavy_keys is None
+
+    def is_compatible(self, other) -> bool:
+        # The counters only have a meaning once the heavy pairs are chosen
+        return self.heavy_keys is not None and super().is_compatible(other)
+
+    def reset(self):
+        super().reset()
+        # The warmup starts over, without the pairs seen before the reset
+        self.buffer = []
+        self.summary_keys, self.summary_counts = self.summary_keys[:0], self.summary_counts[:0]
+
+    def statistics(self) -> np.ndarray:
+        """
+        Return the estimate of the squared L2 difference given by each counter matrix.
+        During the warmup, the heavy pairs are chosen on a copy of the estimator, so that
+        queries do not end the warmup.
+
+        Returns:
+            np.array of shape (B,).
+        """
+        if self.heavy_keys is None:
+            estimator = copy.deepcopy(self)
+            estimator._finish_warmup()
+            return estimator.statistics()
+        N = float(self.N)
+        b = np.arange(self.B).reshape(self.B, 1)
+
+        # Exact part: the differences of the heavy cells
+        n_i = self.row_counts[self.heavy_rows].astype(float)
+        n_j = self.col_counts[self.heavy_cols].astype(float)
+        D = self.heavy_counts / N - n_i * n_j / N ** 2
+
+        # Signed hashed marginals of the whole stream, and M (see the module documentation)
+        x, y = self._calculate_hash_functions(self.heavy_x, self.heavy_y)
+        x, y, s_x, s_y = x >> 1, y >> 1, 1 - 2 * (x & 1), 1 - 2 * (y & 1)
+        row, col = self.row.astype(float), self.col.astype(float)
+        np.add.at(row, (b, x), s_x * self.heavy_counts)
+        np.add.at(col, (b, y), s_y * self.heavy_counts)
+        M = self.C / N - row[:, :, None] * col[:, None, :] / N ** 2
+        np.add.at(M, (b, x, y), s_x * s_y * n_i * n_j / N ** 2)
+        return np.sum(D ** 2) + np.sum(M ** 2, axis=(1, 2))
+
+    def compute(self) -> float:
+        res = self.statistics()
+        if self.verbose:
+            print("variance:", np.var(res))
+        return np.sqrt(np.median(res))
@@ -0,0 +1,216 @@
+import copy
+import time
+import numpy as np
+from mini_project.utils import Estimator, _resolve_stream
+from mini_project.stream import StreamReader, DEFAULT_CHUNK_SIZE, sample_positions
+
+
+class SampledEstimator(Estimator):
+    """
+    Estimator that only reads a Bernoulli sample of the stream, to trade accuracy for
+    throughput. The items are chosen with geometric skips, so the cost of a skipped item
+    is close to nothing, and when reading from a file the skipped lines are never parsed
+    (see stream.StreamReader).
+
+    The sampled items are spread at random over `groups` copies of the wrapped estimator
+    (which is possible since their state is linear in the stream). compute() combines the
+    groups and scales N and the counters by 1 / rate, so that they estimate those of the
+    whole stream. sampling_error() estimates the variance added by the sampling from the
+    spread of the estimates of the groups.
+
+    The rate can be fixed, or adapted so that the stream is read at `target` items per
+    second. The throughput is measured over windows of at least `adapt_items` items or
+    `adapt_seconds` seconds, so that reading items one by one or in small batches does
+    not change the rate on every call. Counters sampled at different rates are combined
+    by scaling them to the current rate whenever it changes, which makes them floats
+    until reset() restores the initial rate and types.
+
+    The wrapped estimator should have dense counters (any estimator except
+    SparseExactEstimator).
+
+    Args:
+        estimator (utils.Estimator): an empty estimator to compute the metric with.
+        rate (float): probability of reading each item, the initial one if target is set.
+        target (float): number of items of the stream to go through per second, or None
+            to keep the rate fixed.
+        groups (int): number of copies of the estimator the sample is spread over, at
+            least 2 for sampling_error(). The memory is that many times the estimator's.
+        rescale (bool): whether compute() sees the counters scaled by 1 / rate, or those
+            of the sample (e.g. for tests on the counts such as ChiSquareEstimator).
+        min_rate (float): lowest rate when target is set.
+        adapt_items (int): number of items after which the rate is adapted.
+        adapt_seconds (float): time after which the rate is adapted, even if fewer than
+            adapt_items items were read.
+        seed (int or np.random.Generator): seed of the sampling.
+    """
+    _hash_state = ("rate", "groups")
+
+    def __init__(self, estimator: Estimator, rate: float = 1.0, target: float = None, groups: int = 4,
+                 rescale: bool = True, min_rate: float = 1e-3, adapt_items: int = 1 << 12,
+                 adapt_seconds: float = 0.1, seed=None) -> None:
+        assert 0 < rate <= 1, "the rate should be in (0, 1]."
+        assert groups >= 1, "there should be at least one group."
+        super().__init__(input_type=estimator.input_type)
+        self.columns = estimator.columns
+        self.estimators = [estimator] + [copy.deepcopy(estimator) for _ in range(groups - 1)]
+        self.rate = rate
+        self.initial_rate = rate
+        self.target = target
+        self.groups = groups
+        self.rescale = rescale
+        self.min_rate = min_rate
+        self.adapt_items = adapt_items
+        self.adapt_seconds = adapt_seconds
+        self.rng = np.random.default_rng(seed)
+        self.skip = None          # Number of items to skip before the next sampled one
+        self.sampled = 0          # Number of items read by the estimators
+        self.window = [0, 0.0]    # Items and seconds since the rate was last adapted
+
+        # Types of the counter arrays, restored by reset()
+        self.dtypes = [np.asarray(c).dtype for c in self.counters()]
+
+    def _children(self):
+        return self.estimators
+
+    def _learns_hash_state(self) -> bool:
+        # The rate is adapted to the speed of reading the stream
+        return self.target is not None or super()._learns_hash_state()
+
+    def _set_rate(self, rate: float):
+        """
+        Change the rate, and scale the counters to the new rate.
+        """
+        rate = float(np.clip(rate, self.min_rate, 1.0))
+        if rate == self.rate:
+            return
+        for estimator in self.estimators:
+            estimator._load_counters([c * (rate / self.rate) for c in estimator.counters()])
+        self.rate = rate
+        self.skip = None
+
+    def _adapt(self, items: int, seconds: float):
+        """
+        Add the last `items` items read in `seconds` to the window, and once it is full,
+        adapt the rate to the throughput of the window, by at most a factor 2 at a time.
+        """
+        if self.target is None:
+            return
+        self.window[0] += items
+        self.window[1] += seconds
+        items, seconds = self.window
+        if (items < self.adapt_items and seconds < self.adapt_seconds) or seconds <= 0:
+            return
+        self.window = [0, 0.0]
+        self._set_rate(self.rate * min(items / seconds / self.target, 2.0))
+
+    def _read_sample(self, *columns):
+        """
+        Spread sampled items over the groups.
+        """
+        self.sampled += len(columns[0])
+        if self.groups == 1:
+            self.estimators[0].read_batch(*columns)
+            return
+        group = self.rng.integers(self.groups, size=len(columns[0]))
+        order = np.argsort(group, kind="stable")
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(group, minlength=self.groups))])
+        for g, estimator in enumerate(self.estimators):
+            index = order[bounds[g]:bounds[g + 1]]
+            estimator.read_batch(*[c[index] for c in columns])
+
+    def _read_item(self, *values):
+        # Same as a batch of one item (read_batch counts N)
+        self.read_batch(*[[v] for v in values])
+
+    def read_batch(self, *columns):
+        assert len(columns) == self.columns, f"expected {self.columns} columns but got {len(columns)}."
+        start = time.perf_counter()
+        dtype = np.int64 if self.input_type is int else np.float64
+        columns = [np.asarray(c, dtype=dtype).ravel() for c in columns]
+        items = len(columns[0])
+        self.N += items
+        if self.rate < 1:
+            positions, self.skip = sample_positions(self.rng, self.rate, items, self.skip)
+            columns = [c[positions] for c in columns]
+        self._read_sample(*columns)
+        self._adapt(items, time.perf_counter() - start)
+
+    def read_from_file(self, file_name, chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+        """
+        Read a sample of the stream from a file, see utils.Estimator.read_from_file. The
+        skipped lines are not parsed, and the rate is adapted after every chunk if a
+        target is set.
+        """
+        start = time.perf_counter()
+        dtype = np.int64 if self.input_type is int else np.float64
+        reader = StreamReader(_resolve_stream(file_name), columns=self.columns, dtype=dtype,
+                              chunk_size=chunk_size, rate=self.rate, seed=self.rng)
+        reader.skip = self.skip
+        lines, last = 0, time.perf_counter()
+        for batch in reader:
+            self.N += reader.lines - lines
+            self._read_sample(*batch)
+            now = time.perf_counter()
+            self._adapt(reader.lines - lines, now - last)
+            lines, last = reader.lines, now
+            if reader.rate != self.rate:
+                reader.rate, reader.skip = self.rate, None
+        # Lines of the last chunks, where none was sampled
+        self.N += reader.lines - lines
+        self.skip = reader.skip
+
+        stats = reader.stats()
+        stats["total_seconds"] = time.perf_counter() - start
+        if self.stats is not None:
+            self.stats.add_time("read", stats["read_seconds"])
+            self.stats.add_time("parse", stats["parse_seconds"])
+            self.stats.add("bytes_parsed", stats["bytes"])
+        return stats
+
+    def _compute_with(self, counters: list):
+        """
+        Compute the wrapped estimator with the given counters in place of its own.
+        """
+        estimator = self.estimators[0]
+        saved = estimator.counters()
+        estimator._load_counters(counters)
+        try:
+            return estimator.compute()
+        finally:
+            estimator._load_counters(saved)
+
+    def compute(self):
+        scale = 1 / self.rate if self.rescale else 1
+        total = [sum(counters) * scale for counters in zip(*[e.counters() for e in self.estimators])]
+        return self._compute_with(total)
+
+    def sampling_error(self) -> dict:
+        """
+        Estimate the variance that the sampling adds to compute(), with the random groups
+        method: each group is a Bernoulli sample of the stream with rate rate / groups, and
+        the variance of an estimate from a Bernoulli sample with rate s is proportional to
+        (1 - s) / s, so
+
+            Var[estimate] = Var[estimate of a group] * (1 - rate) / (groups - rate)
+
+        where the variance of the estimates of the groups is their sample variance.
+
+        Returns:
+            A dict with the current "rate", the number of items "sampled" and the
+            "variance" and standard deviation ("std") of the estimate due to sampling
+            (arrays if the estimate is an array).
+        """
+        assert self.groups >= 2, "the variance needs at least 2 groups."
+        scale = self.groups / self.rate if self.rescale else 1
+        values = np.array([self._compute_with([c * scale for c in e.counters()]) for e in self.estimators],
+                          dtype=float)
+        variance = np.var(values, axis=0, ddof=1) * (1 - self.rate) / (self.groups - self.rate)
+        return {"rate": self.rate, "sampled": self.sampled, "variance": variance, "std": np.sqrt(variance)}
+
+    def reset(self):
+        self._load_counters([np.zeros(np.shape(c), dtype=d) if isinstance(c, np.ndarray) else 0
+                             for c, d in zip(self.counters(), self.dtypes)])
+        self.rate = self.initial_rate
+        self.skip = None
+        self.sampled = 0
+        self.window = [0, 0.0]
@@ -2,6 +2,23 @@ from typing import overload
 from mini_project.utils import Estimator, _choose_prime
 import numpy as np
 
+# Maximum number of elements in the (batch, A, B) temporaries used by read_batch
+BATCH_ELEMENTS = 2 ** 20
+
+# Bit 0 of each byte of a 64-bit word, see L2Estimator._count_ones
+LANE_BITS = np.uint64(0x0101010101010101)
+
+
+def sign_table_bytes(A: int, B: int, n: int) -> int:
+    """
+    Memory used by the precomputed sign tables of L2Estimator(A, B, n, precompute=True).
+
+    Returns:
+        The number of bytes of the two bit-packed tables of shape (n + 1, ceil(A * B / 8)).
+    """
+    return 2 * (n + 1) * ((A * B + 7) // 8)
+
+
 class L2Estimator(Estimator):
     """
     The class for estimating L2 difference of two distributions. We use the property
@@ -9,23 +26,35 @@ class L2Estimator(Estimator):
     ||r-s||. Here, instead of storing the vectors, we use random hash functions to map
     a pair (i, j) to either -1 or 1, so that we can save space.
     """
-    def __init__(self, A: int, B: int, n: int = 10000) -> None:
+    _linear_state = ("t_1", "t_2", "t_3")
+    _hash_state = ("A", "B", "p", "param_x", "param_y")
+    _tables = ("sign_x", "sign_y")
+
+    def __init__(self, A: int, B: int, n: int = 10000, seed=None, precompute: bool = False) -> None:
         """
         To reduce error, the user should specify A=O(ε^(-2)) and B=O(log(1/δ))
         so that we can achive an (1+ε)-multiplicative error with probability at least
         1-δ.
 
+        If precompute is set, the signs of all the values in [1, n] are computed once and
+        stored in bit-packed tables, so that reading an item is a table lookup instead of
+        evaluating the polynomials. The tables take sign_table_bytes(A, B, n) bytes.
+
         Args:
             A (int): number of experiments in each group. We take the mean in each group.
             B (int): number of groups we run. We take the median of the mean of the groups.
-            n (int): Range of X and Y should be [1, n]. Not very important in our implementation,
-                only used to determine the prime used in hash functions.
+            n (int): Range of X and Y should be [1, n]. Only used to determine the prime used
+                in hash functions, unless precompute is set.
+            seed (int or np.random.Generator): seed of the hash functions. Estimators
+                constructed with the same seed can be merged.
+            precompute (bool): whether to precompute bit-packed tables of the signs.
         """
         super().__init__(input_type=int)
 
         # Number of experience run
         self.A = A
         self.B = B
+        self.n = n
 
         # Number of items in the stream
         self.N = 0
@@ -36,12 +65,18 @@ class L2Estimator(Estimator):
         self.t_3 = np.zeros((A, B), dtype=int)
 
         # Use polynomial of degree 3 to generate 4-independent hash functions
+        rng = np.random.default_rng(seed)
         self.p = _choose_prime(10 * n)
-        self.param_x = self._generate_random_hash_parameters()
-        self.param_y = self._generate_random_hash_parameters()
+        self.param_x = self._generate_random_hash_parameters(rng)
+        self.param_y = self._generate_random_hash_parameters(rng)
+
+        # Bit-packed signs of shape (n + 1, ceil(A * B / 8)), where bit 1 stands for 1
+        self.sign_x, self.sign_y = None, None
+        if precompute:
+            self.sign_x, self.sign_y = self._precompute_signs()
 
     
-    def _generate_random_hash_parameters(self):
+    def _generate_random_hash_parameters(self, rng):
         """
         Generate random parameters for the hash functions. To generate 4-wise independent
         hash functions, we use polynomial of degree 3 
@@ -51,13 +86,16 @@ class L2Estimator(Estimator):
             h(x) = {[(x_3 * x^3 + x_2 * x^2 + x_1 * x + x_0) mod p] mod 2} * 2 - 1
         
         where x_3, x_2, x_1 and x_0 are generate separately for each experiment.
+
+        Args:
+            rng (np.random.Generator): the random number generator to use.
         """
         parameters = {}
         for i in range(4):
             if i == 0:
-                parameters["x_" + str(i)] = np.random.randint(0, self.p, size=(self.A, self.B))
+                parameters["x_" + str(i)] = rng.integers(0, self.p, size=(self.A, self.B))
             else:
-                parameters["x_" + str(i)] = np.random.randint(1, self.p, size=(self.A, self.B))
+                parameters["x_" + str(i)] = rng.integers(1, self.p, size=(self.A, self.B))
         
         return parameters
     
@@ -77,12 +115,92 @@ class L2Estimator(Estimator):
             x_i (np.array): shape (A, B), containing either -1 or 1.
             y_j (np.array): shape (A, B), containing either -1 or 1.
         """
+        if self.sign_x is not None and np.ndim(i) == 0:
+            # Look up the precomputed signs
+            x_i = np.unpackbits(self.sign_x[i], count=self.A * self.B, bitorder="little").astype(int)
+            y_j = np.unpackbits(self.sign_y[j], count=self.A * self.B, bitorder="little").astype(int)
+            return x_i.reshape(self.A, self.B) * 2 - 1, y_j.reshape(self.A, self.B) * 2 - 1
+
         x_i = (self.param_x["x_3"] * (i ** 3) + self.param_x["x_2"] * (i ** 2) +\
               self.param_x["x_1"] * i + self.param_x["x_0"]) % self.p % 2 * 2 - 1
         y_j = (self.param_y["x_3"] * (j ** 3) + self.param_y["x_2"] * (j ** 2) +\
               self.param_y["x_1"] * j + self.param_y["x_0"]) % self.p % 2 * 2 - 1
             
         return x_i, y_j
+
+
+    def _precompute_signs(self):
+        """
+        Evaluate the hash functions on all the values in [0, n].
+
+        Returns:
+            sign_x, sign_y (np.array): shape (n + 1, ceil(A * B / 8)) of dtype uint8. Bit
+                a * B + b (little bit order) of row i is 1 if h_x(i) (resp. h_y(i)) is 1 in
+                experiment (a, b), and 0 if it is -1.
+        """
+        values = np.arange(self.n + 1)
+        return self._packed_signs(values, values)
+
+    def _packed_signs(self, xs, ys):
+        """
+        Evaluate the hash functions on a batch, into bit-packed signs.
+
+        Returns:
+            packed_x, packed_y (np.array): shape (k, ceil(A * B / 8)) of dtype uint8, the
+                signs of xs and ys packed as in _precompute_signs.
+        """
+        packed_x = np.zeros((len(xs), (self.A * self.B + 7) // 8), dtype=np.uint8)
+        packed_y = np.zeros_like(packed_x)
+        step = max(1, BATCH_ELEMENTS // (self.A * self.B))
+        for start in range(0, len(xs), step):
+            x_i, y_j = self._calculate_hash_functions(xs[start:start + step, None, None],
+                                                      ys[start:start + step, None, None])
+            packed_x[start:start + step] = np.packbits(x_i.reshape(len(x_i), -1) > 0, axis=1, bitorder="little")
+            packed_y[start:start + step] = np.packbits(y_j.reshape(len(y_j), -1) > 0, axis=1, bitorder="little")
+        return packed_x, packed_y
+
+    def _hash_key(self):
+        # The tables hold the values of the same hash functions, so estimators with and
+        # without them can share their signs
+        return ("signs", self.A, self.B, self.p, *(self.param_x[k].tobytes() for k in sorted(self.param_x)),
+                *(self.param_y[k].tobytes() for k in sorted(self.param_y)))
+
+    def _batch_hash_functions(self, xs, ys):
+        """
+        Bit-packed signs of a batch (see _packed_signs), looked up in the tables if they
+        are precomputed.
+        """
+        if self.sign_x is not None:
+            return self.sign_x[xs], self.sign_y[ys]
+        return self._packed_signs(xs, ys)
+
+
+    def _count_ones(self, packed):
+        """
+        Count the number of 1 bits in each position over the rows of bit-packed signs,
+        without unpacking them. Groups of 8 rows are read as words of 8 bytes per column
+        of bytes, so that bit b of each byte of a word is a lane counting the bits b of
+        one column: masking the other bits, up to 255 words can be added before a lane
+        overflows. The few remaining rows are unpacked.
+
+        Returns:
+            np.array of shape (A, B).
+        """
+        k, width = packed.shape
+        rows = 8 * 255
+        m = k // rows * rows
+        words = np.ascontiguousarray(packed[:m]).reshape(m // 8, 8 * width).view(np.uint64)
+        words = words.reshape(-1, 255, width)
+        lanes = np.empty_like(words)
+        counts = np.empty((width, 8), dtype=np.int64)
+        for b in range(8):
+            np.right_shift(words, np.uint64(b), out=lanes)
+            np.bitwise_and(lanes, LANE_BITS, out=lanes)
+            sums = np.add.reduce(lanes, axis=1).view(np.uint8).reshape(-1, 8, width)
+            counts[:, b] = np.sum(sums, axis=(0, 1), dtype=np.int64)
+        bits = np.unpackbits(packed[m:], axis=1, bitorder="little")
+        counts = counts.ravel() + np.sum(bits, axis=0, dtype=np.int64)
+        return counts[:self.A * self.B].reshape(self.A, self.B)
     
 
     def _read_item(self, i: int, j: int):
@@ -91,6 +209,45 @@ class L2Estimator(Estimator):
         self.t_1 += x_i * y_j
         self.t_2 += x_i
         self.t_3 += y_j
+
+    def read_batch(self, xs, ys):
+        xs, ys = self._to_arrays(xs, ys)
+        packed_step = max(1, 8 * BATCH_ELEMENTS // (self.A * self.B))
+        if self.sign_x is not None or (self._hash_cache is not None and len(xs) <= packed_step):
+            return self._read_batch_packed(xs, ys, packed_step)
+        self.N += len(xs)
+        step = max(1, BATCH_ELEMENTS // (self.A * self.B))
+        for start in range(0, len(xs), step):
+            # Hash values of shape (batch, A, B)
+            x_i, y_j = self._calculate_hash_functions(xs[start:start + step, None, None],
+                                                      ys[start:start + step, None, None])
+            self.t_1 += np.sum(x_i * y_j, axis=0)
+            self.t_2 += np.sum(x_i, axis=0)
+            self.t_3 += np.sum(y_j, axis=0)
+
+    def _read_batch_packed(self, xs, ys, step: int):
+        """
+        Read a batch from its bit-packed signs, looked up in the precomputed tables or
+        computed once for all the estimators with the same hash functions (see
+        engine.FanOut), `step` items at a time. The signs are only shared for batches of at
+        most `step` items, so that the temporaries stay bounded. With bits b_x, b_y standing
+        for the signs, x_i * y_j is 1 exactly when b_x XOR b_y is 0, so all three sums
+        reduce to counting 1 bits.
+        """
+        if self.sign_x is not None:
+            assert len(xs) == 0 or (min(xs.min(), ys.min()) >= 0 and max(xs.max(), ys.max()) <= self.n), \
+                f"samples should be within [1, {self.n}] when the signs are precomputed."
+        self.N += len(xs)
+        for start in range(0, len(xs), step):
+            if len(xs) <= step:
+                # The signs may be shared with other estimators, see engine.FanOut
+                packed_x, packed_y = self._hash_batch(xs, ys)
+            else:
+                packed_x, packed_y = self._batch_hash_functions(xs[start:start + step], ys[start:start + step])
+            k = len(packed_x)
+            self.t_1 += k - 2 * self._count_ones(packed_x ^ packed_y)
+            self.t_2 += 2 * self._count_ones(packed_x) - k
+            self.t_3 += 2 * self._count_ones(packed_y) - k
     
 
     def compute(self) -> float:
@@ -99,39 +256,81 @@ class L2Estimator(Estimator):
 
         # Calculate mean of each group
         means = np.mean(Upsilon, axis=0)
-        print("variance:", np.var(means))
+        if self.verbose:
+            print("variance:", np.var(means))
 
         # Calculate the median of all means
         med = np.median(means)
         return np.sqrt(med)
 
 
+def _hash_cauchy(seed: int, index):
+    """
+    Derive standard Cauchy variables deterministically from a seed and an array of indices,
+    using the splitmix64 generator (ref: https://prng.di.unimi.it/splitmix64.c), i.e. the
+    variable of index k is computed from the k-th output of splitmix64 seeded with seed.
+
+    Args:
+        seed (int): a 64-bit seed.
+        index (np.array): non-negative integers.
+
+    Returns:
+        np.array of the same shape as index, following the standard Cauchy distribution.
+    """
+    z = np.uint64(seed) + (index.astype(np.uint64) + np.uint64(1)) * np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z = z ^ (z >> np.uint64(31))
+
+    # Uniform variable in (0, 1) from the highest 53 bits, then inverse CDF of Cauchy
+    u = ((z >> np.uint64(11)).astype(float) + 0.5) / 2.0 ** 53
+    return np.tan(np.pi * (u - 0.5))
+
+
 class L1Estimator(Estimator):
     """
     The class for estimating L1 difference of two distributions. We use the s number of distributions
     x_1 ... x_s following Cauchy distribution that are independent, and one distribution following
     T-truncated-Cauchy for the estimation.
     """
-
-    def __init__(self, delta: float, s: int, n: int = 10000) -> None:
+    _linear_state = ("t_1", "t_2", "t_3")
+    # The Cauchy variables are derived from cauchy_seeds in both modes, so comparing the
+    # seeds is enough to compare the variables
+    _hash_state = ("A", "B", "n", "T", "cauchy", "cauchy_seeds")
+    _tables = ("x_cauchy", "y_cauchy")
+
+    def __init__(self, delta: float, s: int, n: int = 10000, seed=None,
+                 cauchy: str = "table", dtype=float) -> None:
         """
         To reduce error, the user should specify A=O(ε^(-2)) and B=O(log(1/δ))
         so that we can achive an (1+ε)-multiplicative error with probability at least
         1-δ.
 
+        By default the Cauchy variables of all the values in [0, n] are drawn up front and
+        stored in a table of shape (A, B, n + 1). With cauchy="hash", they are instead
+        derived from a hash of (experiment, value) whenever they are needed, so the memory
+        is O(A * B) and there is no startup cost.
+
         Args:
             delta (float): params for (O(ln n), δ)-approx. Determines number of experiments in each
                            group (also space usage). We take the mean in each group.
             s (int): number of groups we run. We take the median values of |t_1_r/m - t_2_r*t_3_r/m^2|
                      for all r in each group
             n (int): Range of X and Y should be [1, n].
+            seed (int or np.random.Generator): seed of the Cauchy variables. Estimators
+                constructed with the same seed can be merged.
+            cauchy (str): "table" or "hash", how the Cauchy variables are generated.
+            dtype: dtype of the accumulators, float (float64) or np.float32.
         """
         super().__init__(input_type=int)
+        assert cauchy in ["table", "hash"], f"the cauchy mode '{cauchy}' is not supported."
 
         # Number of experience run
         self.A = int(np.ceil(np.log(1/delta)))
         self.B = s
         self.n = n + 1
+        self.cauchy = cauchy
+        self.dtype = np.dtype(dtype)
 
         # Define T for T-truncated-cauchy
         self.T = 100 * self.n
@@ -140,27 +339,32 @@ class L1Estimator(Estimator):
         self.N = 0
 
         # Matrices to store intermediate values
-        self.t_1 = np.zeros((self.A, self.B), dtype=float)
-        self.t_2 = np.zeros((self.A, self.B), dtype=float)
-        self.t_3 = np.zeros(self.A, dtype=float)
+        self.t_1 = np.zeros((self.A, self.B), dtype=self.dtype)
+        self.t_2 = np.zeros((self.A, self.B), dtype=self.dtype)
+        self.t_3 = np.zeros(self.A, dtype=self.dtype)
 
         # Get cauchy
-        (self.x_cauchy, self.y_cauchy) = self._get_cauchy()
-
-    def _get_cauchy(self):
+        rng = np.random.default_rng(seed)
+        self.cauchy_seeds = [int(x) for x in rng.integers(0, 2 ** 63, size=2)]
+        if cauchy == "table":
+            (self.x_cauchy, self.y_cauchy) = self._get_cauchy(np.random.default_rng(self.cauchy_seeds))
+        else:
+            (self.x_cauchy, self.y_cauchy) = (None, None)
+
+    def _get_cauchy(self, rng):
         x_cauchy = np.zeros((self.A, self.B, self.n), dtype=float)
         y_t_cauchy = np.zeros((self.A, self.n), dtype=float)
 
         for i in range(self.A):
-            x_cauchy[i] = self._get_x_cauchy()
-            y_t_cauchy[i] = self._get_t_trukcated_cauchy()
+            x_cauchy[i] = self._get_x_cauchy(rng)
+            y_t_cauchy[i] = self._get_t_trukcated_cauchy(rng)
 
         return (x_cauchy, y_t_cauchy)
 
-    def _get_x_cauchy(self):
+    def _get_x_cauchy(self, rng):
         x_cauchy = np.zeros((self.B, self.n))
         for i in range(self.B):
-            x_cauchy[i] = np.random.standard_cauchy(self.n)
+            x_cauchy[i] = rng.standard_cauchy(self.n)
         return x_cauchy
 
     def _truncate(self, x):
@@ -168,16 +372,56 @@ class L1Estimator(Estimator):
             + np.where((x > -self.T) & (x < self.T), x, 0) \
             + np.where(x >= self.T, self.T, 0)
 
-    def _get_t_trukcated_cauchy(self):
-        y_cauchy = np.random.standard_cauchy(self.n)
+    def _get_t_trukcated_cauchy(self, rng):
+        y_cauchy = rng.standard_cauchy(self.n)
 
         return self._truncate(y_cauchy)
 
+    def _get_values(self, xs, ys):
+        """
+        Get the Cauchy variables of a batch of samples.
+
+        Args:
+            xs (np.array): samples in the stream that follow distribution X.
+            ys (np.array): samples in the stream that follow distribution Y.
+
+        Returns:
+            x_i (np.array): shape (batch, A, B), the Cauchy variables of xs.
+            y_j (np.array): shape (batch, A), the truncated Cauchy variables of ys.
+        """
+        assert len(xs) == 0 or (min(xs.min(), ys.min()) >= 0 and max(xs.max(), ys.max()) < self.n), \
+            f"samples should be within [1, {self.n - 1}]."
+        if self.cauchy == "table":
+            return np.moveaxis(self.x_cauchy[:, :, xs], 2, 0), self.y_cauchy[:, ys].T
+
+        x_i = _hash_cauchy(self.cauchy_seeds[0], xs[:, None] * (self.A * self.B) + np.arange(self.A * self.B))
+        y_j = _hash_cauchy(self.cauchy_seeds[1], ys[:, None] * self.A + np.arange(self.A))
+        return x_i.reshape(len(xs), self.A, self.B), self._truncate(y_j)
+
     def _read_item(self, i: int, j: int) -> None:
         super()._read_item(i, j)
-        self.t_1 += self.x_cauchy[:, :, i] * np.dot(self.y_cauchy[:, j].reshape(self.A, 1), np.ones((1, self.B)))
-        self.t_2 += self.x_cauchy[:, :, i]
-        self.t_3 += self.y_cauchy[:, j]
+        if self.cauchy == "table":
+            x_i, y_j = self.x_cauchy[:, :, i], self.y_cauchy[:, j]
+        else:
+            x_i, y_j = self._get_values(np.array([i]), np.array([j]))
+            x_i, y_j = x_i[0], y_j[0]
+        self.t_1 += x_i * np.dot(y_j.reshape(self.A, 1), np.ones((1, self.B)))
+        self.t_2 += x_i
+        self.t_3 += y_j
+
+    def read_batch(self, xs, ys):
+        xs, ys = self._to_arrays(xs, ys)
+        self.N += len(xs)
+        step = max(1, BATCH_ELEMENTS // (self.A * self.B))
+        for start in range(0, len(xs), step):
+            # Values of shape (batch, A, B) and (batch, A)
+            x_i, y_j = self._get_values(xs[start:start + step], ys[start:start + step])
+
+            # Reduce along the batch axis starting from the current value, so that the
+            # floating point additions happen in the same order as in _read_item.
+            self.t_1 = np.add.reduce(np.concatenate([self.t_1[None], x_i * y_j[:, :, None]]), axis=0, dtype=self.dtype)
+            self.t_2 = np.add.reduce(np.concatenate([self.t_2[None], x_i]), axis=0, dtype=self.dtype)
+            self.t_3 = np.add.reduce(np.concatenate([self.t_3[None], y_j]), axis=0, dtype=self.dtype)
 
     def compute(self) -> float:
         # Calculate estimator Upsilon
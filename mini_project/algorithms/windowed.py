@@ -0,0 +1,228 @@
+import collections
+import time
+from mini_project.utils import Estimator
+import numpy as np
+
+
+class WindowedEstimator(Estimator):
+    """
+    Base class for estimators that only answer for the recent part of the stream. The
+    stream is cut into blocks, either of a fixed number of items or of a fixed duration.
+    The current block is read by the wrapped estimator, and when a block is complete its
+    counters are handed to _add_block and the wrapped estimator is reset. Since the state
+    of the estimators is linear in the stream, compute() only needs the combined counters
+    of the previous blocks plus the counters of the current block, without rescanning.
+
+    The wrapped estimator should have dense counters (any estimator except
+    SparseExactEstimator).
+
+    Args:
+        estimator (utils.Estimator): an empty estimator to compute the metric with.
+        block (int or float): number of items in each block, or its duration in seconds if
+            time_based is set.
+        time_based (bool): whether the blocks are cut by time instead of number of items.
+        clock (function): returns the current time in seconds, used if time_based is set.
+    """
+    def __init__(self, estimator: Estimator, block, time_based: bool = False,
+                 clock=time.monotonic) -> None:
+        super().__init__(input_type=estimator.input_type)
+        self.estimator = estimator
+        self.block = block
+        self.time_based = time_based
+        self.clock = clock
+
+        self.block_items = 0                                      # Items in the current block
+        self.block_start = clock() if time_based else None        # Start time of the current block
+        self.window = [np.zeros_like(c) if isinstance(c, np.ndarray) else 0
+                       for c in estimator.counters()]             # Combined counters of the previous blocks
+
+
+    def _add_block(self, counters: list):
+        """
+        Combine the counters of a complete block into self.window.
+        """
+        pass
+
+
+    def _seal(self):
+        """
+        Complete the current block and start a new one.
+        """
+        counters = self.estimator.counters()
+        self.estimator.reset()
+        self.block_items = 0
+        self._add_block(counters)
+
+
+    def _advance_clock(self):
+        """
+        Complete the blocks whose time is over. After a long pause, only as many empty
+        blocks are completed as needed for all the data to expire.
+        """
+        elapsed = int((self.clock() - self.block_start) // self.block)
+        for _ in range(min(elapsed, self._max_empty_blocks() + 1)):
+            self._seal()
+        self.block_start += elapsed * self.block
+
+
+    def _max_empty_blocks(self) -> int:
+        """
+        Number of empty blocks after which all the data has expired.
+        """
+        return 1
+
+
+    def _update_N(self):
+        self.N = self.window[0] + self.estimator.N
+
+
+    def _read_item(self, i, j):
+        if self.time_based:
+            self._advance_clock()
+        self.estimator._read_item(i, j)
+        self.block_items += 1
+        if not self.time_based and self.block_items >= self.block:
+            self._seal()
+        self._update_N()
+
+
+    def read_batch(self, xs, ys):
+        xs, ys = self._to_arrays(xs, ys)
+        if self.time_based:
+            self._advance_clock()
+            self.estimator.read_batch(xs, ys)
+            self.block_items += len(xs)
+        else:
+            # Split the batch at the block boundaries
+            start = 0
+            while start < len(xs):
+                end = start + min(len(xs) - start, self.block - self.block_items)
+                self.estimator.read_batch(xs[start:end], ys[start:end])
+                self.block_items += end - start
+                if self.block_items >= self.block:
+                    self._seal()
+                start = end
+        self._update_N()
+
+
+    def compute(self) -> float:
+        if self.time_based:
+            self._advance_clock()
+            self._update_N()
+        current = self.estimator.counters()
+        self.estimator._load_counters([w + c for w, c in zip(self.window, current)])
+        try:
+            return self.estimator.compute()
+        finally:
+            self.estimator._load_counters(current)
+
+
+    def enable_stats(self, stats=None):
+        stats = super().enable_stats(stats)
+        self.estimator.enable_stats(stats)
+        return stats
+
+
+    def disable_stats(self):
+        super().disable_stats()
+        self.estimator.disable_stats()
+
+
+    def _set_hash_cache(self, cache):
+        super()._set_hash_cache(cache)
+        self.estimator._set_hash_cache(cache)
+
+
+    def set_verbose(self, verbose: bool):
+        super().set_verbose(verbose)
+        self.estimator.set_verbose(verbose)
+
+
+    def reset(self):
+        self.estimator.reset()
+        self.window = [np.zeros_like(c) if isinstance(c, np.ndarray) else 0 for c in self.window]
+        self.block_items = 0
+        self.block_start = self.clock() if self.time_based else None
+        self._update_N()
+
+
+class SlidingWindowEstimator(WindowedEstimator):
+    """
+    Estimator over the last `window` items (or seconds) of the stream. The window is made
+    of `blocks` blocks: the counters of the complete blocks are kept, and when a block
+    falls out of the window its counters are subtracted from the window. The answer covers
+    between window * (1 - 1 / blocks) and window items (or seconds).
+
+    Memory is `blocks` copies of the counters, and the update cost is one update of the
+    wrapped estimator plus O(counters / block) amortized.
+
+    Args:
+        estimator (utils.Estimator): an empty estimator to compute the metric with.
+        window (int or float): size of the window in number of items, or in seconds if
+            time_based is set.
+        blocks (int): number of blocks in the window.
+        time_based (bool): whether the window is measured in seconds.
+        clock (function): returns the current time in seconds, used if time_based is set.
+    """
+    def __init__(self, estimator: Estimator, window, blocks: int = 10,
+                 time_based: bool = False, clock=time.monotonic) -> None:
+        block = window / blocks if time_based else max(1, window // blocks)
+        super().__init__(estimator, block, time_based=time_based, clock=clock)
+        self.blocks = blocks
+        self.sealed = collections.deque()    # Counters of the complete blocks in the window
+
+    def _add_block(self, counters: list):
+        self.sealed.append(counters)
+        self.window = [w + c for w, c in zip(self.window, counters)]
+        # Keep blocks - 1 complete blocks, plus the current one
+        while len(self.sealed) >= self.blocks:
+            expired = self.sealed.popleft()
+            self.window = [w - c for w, c in zip(self.window, expired)]
+
+    def _max_empty_blocks(self) -> int:
+        return self.blocks
+
+    def reset(self):
+        self.sealed.clear()
+        super().reset()
+
+
+class DecayedEstimator(WindowedEstimator):
+    """
+    Estimator where the weight of each item decays exponentially with its age, with the
+    given half life in items (or seconds). The decay is applied per block: when a block is
+    complete, the combined counters are multiplied by 0.5 ** (block / half_life) before
+    adding the counters of the block, so the counters become floats. The items of the
+    current block have weight 1.
+
+    Memory is one extra copy of the counters, and the update cost is one update of the
+    wrapped estimator plus O(counters / block) amortized.
+
+    Args:
+        estimator (utils.Estimator): an empty estimator to compute the metric with.
+        half_life (int or float): number of items (or seconds) after which the weight of
+            an item is halved.
+        block (int or float): number of items (or seconds) in each block, defaults to a
+            tenth of the half life.
+        time_based (bool): whether the half life is measured in seconds.
+        clock (function): returns the current time in seconds, used if time_based is set.
+    """
+    def __init__(self, estimator: Estimator, half_life, block=None,
+                 time_based: bool = False, clock=time.monotonic) -> None:
+        if block is None:
+            block = half_life / 10 if time_based else max(1, int(half_life) // 10)
+        super().__init__(estimator, block, time_based=time_based, clock=clock)
+        self.half_life = half_life
+        self.decay = 0.5 ** (block / half_life)
+        self.window = [w * 1.0 for w in self.window]
+
+    def _add_block(self, counters: list):
+        self.window = [w * self.decay + c for w, c in zip(self.window, counters)]
+
+    def _max_empty_blocks(self) -> int:
+        # The weight is below 1e-12 after this many blocks
+        return int(np.ceil(np.log(1e-12) / np.log(self.decay)))
+
+    def reset(self):
+        super().reset()
+        self.window = [w * 1.0 for w in self.window]
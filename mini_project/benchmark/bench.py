@@ -0,0 +1,227 @@
+"""
+Throughput, memory and accuracy benchmark of the estimators.
+
+For each dataset (random/zipfian, dependent/independent streams generated in memory) and
+each estimator setting, the benchmark measures the items/sec ingested through read_batch,
+the latency of compute(), the peak RSS of the process, the bytes used by the sketch, and
+the multiplicative error against the exact answer. The results are written as JSON.
+
+Usage:
+
+    python -m mini_project.benchmark.bench --output results.json
+    python -m mini_project.benchmark.bench --baseline results.json --tolerance 0.1
+
+With --baseline, the throughput of every case is compared with the same case in the
+baseline file, and the script exits with status 1 if any case is slower by more than the
+tolerance.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from mini_project.algorithms.exact import SparseExactEstimator
+from mini_project.data import DiscreteSampleGenerator
+from mini_project.registry import ESTIMATORS
+from mini_project.stream import StreamReader
+import numpy as np
+
+# Number of items given to read_batch at a time
+BATCH_SIZE = 1 << 16
+
+
+def _peak_rss() -> int:
+    """
+    Peak resident set size of the current process in bytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def make_dataset(n: int, N: int, independent: bool, distribution: str, seed: int = 0):
+    """
+    Generate a stream in memory, together with the exact l1 and l2 difference.
+
+    Returns:
+        xs, ys (np.array): the stream.
+        answer (dict): the exact "l1" and "l2" difference of the stream.
+    """
+    generator = DiscreteSampleGenerator(n=n, N=N, independent=independent,
+                                        distribution=distribution, seed=seed)
+    xs, ys = generator._generate_batch(N)
+    exact = SparseExactEstimator(n, metric=["l1", "l2"])
+    exact.read_batch(xs, ys)
+    l1, l2 = exact.compute()
+    return xs, ys, {"l1": float(l1), "l2": float(l2)}
+
+
+def run_case(name: str, n: int, xs, ys, answer: dict, seed: int = 0, repeats: int = 5) -> dict:
+    """
+    Benchmark one estimator setting on a stream.
+    """
+    metric, build = ESTIMATORS[name]
+    start = time.perf_counter()
+    estimator = build(n, seed)
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for k in range(0, len(xs), BATCH_SIZE):
+        estimator.read_batch(xs[k:k + BATCH_SIZE], ys[k:k + BATCH_SIZE])
+    ingest_seconds = time.perf_counter() - start
+
+    compute_seconds = []
+    estimator.set_verbose(False)
+    for _ in range(repeats):
+        start = time.perf_counter()
+        estimate = estimator.compute()
+        compute_seconds.append(time.perf_counter() - start)
+    # The exact estimators return a list of metrics
+    estimate = float(np.ravel(estimate)[0])
+
+    return {
+        "estimator": name,
+        "metric": metric,
+        "build_seconds": build_seconds,
+        "ingest_seconds": ingest_seconds,
+        "items_per_sec": len(xs) / ingest_seconds if ingest_seconds > 0 else float("inf"),
+        "compute_seconds": float(np.median(compute_seconds)),
+        "peak_rss_bytes": _peak_rss(),
+        "sketch_bytes": estimator.memory_bytes(),
+        "estimate": estimate,
+        "answer": answer[metric],
+        "error": abs(1 - estimate / answer[metric]) if answer[metric] != 0 else None,
+    }
+
+
+def measure_parsing(xs, ys) -> dict:
+    """
+    Measure the throughput of parsing the stream from a text file.
+    """
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+        samples = np.column_stack([xs, ys]).ravel().tolist()
+        f.write(("%s %s\n" * len(xs)) % tuple(samples))
+    try:
+        reader = StreamReader(f.name)
+        for _ in reader:
+            pass
+        return reader.stats()
+    finally:
+        os.remove(f.name)
+
+
+def run(n: int, N: int, estimators: list, datasets: list, isolate: bool = True,
+        seed: int = 0) -> dict:
+    """
+    Run the benchmark.
+
+    Args:
+        n (int): range of the samples.
+        N (int): length of each stream.
+        estimators (list): names of the estimator settings in ESTIMATORS.
+        datasets (list): (independent, distribution) pairs.
+        isolate (bool): run each case in a fresh process, so that the peak RSS only
+            includes that case.
+        seed (int): seed of the datasets and estimators.
+
+    Returns:
+        A dict of the benchmark settings and results.
+    """
+    results = []
+    for independent, distribution in datasets:
+        dataset = f"{n}-{N}-{'independent' if independent else 'dependent'}-{distribution}"
+        xs, ys, answer = make_dataset(n, N, independent, distribution, seed)
+        parse = measure_parsing(xs, ys)
+        for name in estimators:
+            if isolate:
+                context = multiprocessing.get_context("spawn")
+                with ProcessPoolExecutor(1, mp_context=context) as pool:
+                    result = pool.submit(run_case, name, n, xs, ys, answer, seed).result()
+            else:
+                result = run_case(name, n, xs, ys, answer, seed)
+            result["dataset"] = dataset
+            result["parse_items_per_sec"] = parse["items_per_sec"]
+            results.append(result)
+            print(f"{dataset:40s} {name:50s} {result['items_per_sec']:12.0f} items/s "
+                  f"{result['compute_seconds'] * 1e3:9.3f} ms {result['sketch_bytes']:12d} B "
+                  f"error {result['error']}", file=sys.stderr)
+
+    return {
+        "meta": {
+            "n": n, "N": N, "seed": seed, "time": time.time(),
+            "python": platform.python_version(), "numpy": np.__version__,
+            "machine": platform.machine(), "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.1) -> list:
+    """
+    Compare the throughput of the results with a baseline.
+
+    Args:
+        results (dict): output of run().
+        baseline (dict): output of run() to compare with.
+        tolerance (float): relative slowdown allowed before flagging a regression.
+
+    Returns:
+        A list of dicts describing each case that is slower than the baseline by more
+        than the tolerance.
+    """
+    previous = {(r["dataset"], r["estimator"]): r for r in baseline["results"]}
+    regressions = []
+    for r in results["results"]:
+        old = previous.get((r["dataset"], r["estimator"]))
+        if old is None:
+            continue
+        ratio = r["items_per_sec"] / old["items_per_sec"]
+        if ratio < 1 - tolerance:
+            regressions.append({"dataset": r["dataset"], "estimator": r["estimator"],
+                                "items_per_sec": r["items_per_sec"],
+                                "baseline_items_per_sec": old["items_per_sec"], "ratio": ratio})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--n", type=int, default=1000, help="range of the samples")
+    parser.add_argument("--N", type=int, default=100000, help="length of each stream")
+    parser.add_argument("--estimators", nargs="*", default=list(ESTIMATORS),
+                        help="estimator settings to run, among: " + ", ".join(ESTIMATORS))
+    parser.add_argument("--distributions", nargs="*", default=["random", "zipfian"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-isolate", action="store_true", help="run all cases in this process")
+    parser.add_argument("--output", help="path of the JSON output, defaults to the standard output")
+    parser.add_argument("--baseline", help="JSON output of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="relative throughput loss allowed compared with the baseline")
+    args = parser.parse_args(argv)
+
+    datasets = [(independent, distribution) for distribution in args.distributions
+                for independent in [False, True]]
+    results = run(args.n, args.N, args.estimators, datasets, isolate=not args.no_isolate, seed=args.seed)
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            results["regressions"] = compare(results, json.load(f), args.tolerance)
+        for r in results["regressions"]:
+            print(f"REGRESSION {r['dataset']} {r['estimator']}: {r['items_per_sec']:.0f} items/s, "
+                  f"baseline {r['baseline_items_per_sec']:.0f} items/s", file=sys.stderr)
+        status = 1 if results["regressions"] else 0
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""
+Compact binary snapshots of estimators, so that a long ingestion can be resumed after a
+restart.
+
+A checkpoint file is laid out as
+
+    magic (8 bytes) | version (uint16) | reserved (uint16) | header length (uint32) |
+    header (JSON, utf-8) | padding | array 0 | padding | array 1 | ...
+
+where all the integers are little-endian. The header describes the estimator: its class,
+all its attributes (hash parameters, seeds, N, ...) and the offset of the stream the
+estimator has read up to. Every numpy array (counters, hash parameters, tables) is stored
+as a raw little-endian C-order buffer aligned to ALIGNMENT bytes, so that loading can map
+the file into memory instead of reading it.
+"""
+import collections
+import importlib
+import json
+import os
+import struct
+import time
+from mini_project.utils import Estimator, _resolve_stream
+from mini_project.stream import StreamReader, DEFAULT_CHUNK_SIZE
+import numpy as np
+
+MAGIC = b"MPSKETCH"
+VERSION = 1
+ALIGNMENT = 64
+_PREAMBLE = struct.Struct("<8sHHI")
+
+
+def _qualified_name(obj) -> str:
+    return obj.__module__ + ":" + obj.__qualname__
+
+
+def _import(name: str):
+    module, qualname = name.split(":")
+    obj = importlib.import_module(module)
+    for attr in qualname.split("."):
+        obj = getattr(obj, attr)
+    return obj
+
+
+def _encode(value, arrays: list):
+    """
+    Encode a value into a JSON-compatible object. Arrays are appended to `arrays` and
+    replaced by their index.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.ndarray):
+        assert value.dtype != object, "arrays of python objects cannot be saved."
+        arrays.append(value)
+        return {"__array__": len(arrays) - 1}
+    if isinstance(value, np.generic):
+        return {"__scalar__": value.dtype.str, "value": value.item()}
+    if isinstance(value, np.dtype):
+        return {"__dtype__": value.str}
+    if isinstance(value, Estimator):
+        return {"__estimator__": _qualified_name(type(value)),
+                "state": {k: _encode(v, arrays) for k, v in value.__getstate__().items() if k != "stats"}}
+    if isinstance(value, dict):
+        return {"__dict__": [[_encode(k, arrays), _encode(v, arrays)] for k, v in value.items()]}
+    if isinstance(value, collections.deque):
+        return {"__deque__": [_encode(v, arrays) for v in value]}
+    if isinstance(value, tuple):
+        return {"__tuple__": [_encode(v, arrays) for v in value]}
+    if isinstance(value, list):
+        return [_encode(v, arrays) for v in value]
+    if isinstance(value, type) or callable(value):
+        # Classes (e.g. the input type) and module-level functions (e.g. clocks)
+        name = _qualified_name(value)
+        if "<" in name:
+            raise ValueError(f"{value} cannot be saved, use a module-level function instead.")
+        return {"__object__": name}
+    raise ValueError(f"values of type {type(value).__name__} cannot be saved.")
+
+
+def _decode(value, arrays: list):
+    """
+    Decode an object produced by _encode.
+    """
+    if isinstance(value, list):
+        return [_decode(v, arrays) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if "__array__" in value:
+        return arrays[value["__array__"]]
+    if "__scalar__" in value:
+        return np.dtype(value["__scalar__"]).type(value["value"])
+    if "__dtype__" in value:
+        return np.dtype(value["__dtype__"])
+    if "__estimator__" in value:
+        cls = _import(value["__estimator__"])
+        estimator = cls.__new__(cls)
+        estimator.__dict__.update({k: _decode(v, arrays) for k, v in value["state"].items()})
+        return estimator
+    if "__dict__" in value:
+        return {_decode(k, arrays): _decode(v, arrays) for k, v in value["__dict__"]}
+    if "__deque__" in value:
+        return collections.deque(_decode(v, arrays) for v in value["__deque__"])
+    if "__tuple__" in value:
+        return tuple(_decode(v, arrays) for v in value["__tuple__"])
+    if "__object__" in value:
+        return _import(value["__object__"])
+    raise ValueError(f"unknown value in checkpoint header: {value}")
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def save_checkpoint(estimator: Estimator, path: str, offset: int = 0):
+    """
+    Save the estimator to a checkpoint file. The file is written to a temporary file first
+    and then renamed, so an existing checkpoint is never left half-written.
+
+    Args:
+        estimator (utils.Estimator): the estimator to save.
+        path (str): path to the checkpoint file.
+        offset (int): byte offset of the stream the estimator has read up to, to resume
+            reading from.
+    """
+    # Make sure buffered state (e.g. in SparseExactEstimator) is in the counters
+    estimator.counters()
+
+    arrays = []
+    state = _encode(estimator, arrays)
+
+    # Lay out the arrays after the header. The offsets are relative to the end of the
+    # header, so that they do not depend on the length of the header itself.
+    layout, position = [], 0
+    for array in arrays:
+        position = _align(position)
+        dtype = array.dtype.newbyteorder("<") if array.dtype.byteorder != "|" else array.dtype
+        layout.append({"dtype": dtype.str, "shape": list(array.shape), "offset": position})
+        position += array.nbytes
+
+    header = json.dumps({"estimator": state, "arrays": layout, "offset": offset,
+                         "time": time.time()}).encode("utf-8")
+    data_start = _align(_PREAMBLE.size + len(header))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, VERSION, 0, len(header)))
+        f.write(header)
+        for array, meta in zip(arrays, layout):
+            f.seek(data_start + meta["offset"])
+            f.write(np.ascontiguousarray(array, dtype=np.dtype(meta["dtype"])).tobytes())
+        f.truncate(data_start + position)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path: str, mmap: bool = True):
+    """
+    Load an estimator from a checkpoint file.
+
+    Args:
+        path (str): path to the checkpoint file.
+        mmap (bool): if set, the arrays are memory-mapped copy-on-write, so that loading
+            is nearly instant regardless of their size and the file is never modified.
+            Otherwise they are read into memory.
+
+    Returns:
+        estimator (utils.Estimator): the loaded estimator.
+        offset (int): byte offset of the stream the estimator has read up to.
+    """
+    with open(path, "rb") as f:
+        magic, version, _, header_length = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a checkpoint file.")
+        if version > VERSION:
+            raise ValueError(f"{path} has checkpoint version {version}, but only versions up to "
+                             f"{VERSION} are supported.")
+        header = json.loads(f.read(header_length).decode("utf-8"))
+
+    data_start = _align(_PREAMBLE.size + header_length)
+    arrays = []
+    for meta in header["arrays"]:
+        dtype, shape = np.dtype(meta["dtype"]), tuple(meta["shape"])
+        if int(np.prod(shape)) == 0:
+            arrays.append(np.zeros(shape, dtype=dtype))
+        elif mmap:
+            arrays.append(np.memmap(path, dtype=dtype, mode="c", offset=data_start + meta["offset"], shape=shape))
+        else:
+            arrays.append(np.fromfile(path, dtype=dtype, count=int(np.prod(shape)),
+                                      offset=data_start + meta["offset"]).reshape(shape))
+    return _decode(header["estimator"], arrays), header["offset"]
+
+
+def read_with_checkpoints(estimator: Estimator, file_name, checkpoint_path: str,
+                          every: int = 1 << 28, offset: int = 0,
+                          chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+    """
+    Read a stream from a file, saving a checkpoint of the estimator after roughly every
+    `every` bytes and at the end. If the ingestion is interrupted, it can be continued
+    with resume_from_checkpoint.
+
+    Args:
+        estimator (utils.Estimator): the estimator to read the stream with.
+        file_name (string): the name of a stream in TEST_DATA_DIR, or a path to a file
+            (possibly ending with ".gz").
+        checkpoint_path (str): path to the checkpoint file.
+        every (int): number of bytes read between checkpoints.
+        offset (int): byte offset to start reading from, at the beginning of a line.
+        chunk_size (int): number of bytes parsed at a time.
+
+    Returns:
+        A dict of the reading statistics (see stream.StreamReader.stats).
+    """
+    dtype = np.int64 if estimator.input_type is int else np.float64
+    reader = StreamReader(_resolve_stream(file_name), columns=estimator.columns, dtype=dtype,
+                          chunk_size=chunk_size, start=offset)
+    saved = offset
+    for batch in reader:
+        estimator.read_batch(*batch)
+        if reader.position - saved >= every:
+            save_checkpoint(estimator, checkpoint_path, offset=reader.position)
+            saved = reader.position
+    save_checkpoint(estimator, checkpoint_path, offset=reader.position)
+    return reader.stats()
+
+
+def resume_from_checkpoint(checkpoint_path: str, file_name, every: int = 1 << 28,
+                           chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Load an estimator from a checkpoint and continue reading the stream from where the
+    checkpoint was saved.
+
+    Returns:
+        The estimator after reading the rest of the stream.
+    """
+    estimator, offset = load_checkpoint(checkpoint_path)
+    read_with_checkpoints(estimator, file_name, checkpoint_path, every=every,
+                          offset=offset, chunk_size=chunk_size)
+    return estimator
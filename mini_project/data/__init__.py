@@ -1 +1,2 @@
-from .generate_dataset import DiscreteSampleGenerator
\ No newline at end of file
+from .generate_dataset import DiscreteSampleGenerator
+from .structured import LowRankSampleGenerator, BandedSampleGenerator, PlantedSampleGenerator
@@ -1,16 +1,53 @@
 from mini_project.utils import DataGenerator, ANSWER_DIR
-from mini_project.algorithms.exact import ExactEstimator
+from mini_project.algorithms.exact import SparseExactEstimator
 import pickle
 import os
 import numpy as np
 
-class DiscreteSampleGenerator(DataGenerator):
+class SampleGenerator(DataGenerator):
+    """
+    Base class for the generators of samples of X and Y between 1 and n, whose answer is
+    computed while the stream is generated.
+    """
+    def _generate_item(self):
+        """
+        Randomly generate a sample (i, j).
+        """
+        i, j = self._generate_batch(1)
+        return int(i[0]), int(j[0])
+
+    def write_file(self, file_name: str, stream: bool = True):
+        """
+        Write the stream and the ground truth, and the answer (the l1 and l2 difference and
+        the independence of the empirical distribution of the stream). The answer is
+        computed from the samples as they are generated, without reading the file again.
+
+        Args:
+            file_name (string): the name of the stream.
+            stream (bool): whether to write the stream, or only the ground truth and the
+                answer for streams that are too large to store.
+        """
+        estimator = SparseExactEstimator(self.n, metric=["l1", "l2", "independent"])
+        if not super().write_file(file_name, estimator=estimator, stream=stream):
+            if os.path.exists(os.path.join(ANSWER_DIR, file_name + '.pickle')) or not stream:
+                return
+            # The stream already exists but not its answer
+            estimator.read_from_file(file_name)
+        l1, l2, independent = estimator.compute()
+        answer = {"l1": l1, "l2": l2, "independent": independent}
+        print(answer)
+
+        with open(os.path.join(ANSWER_DIR, file_name + '.pickle'), 'wb') as p:
+            pickle.dump(answer, p, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+class DiscreteSampleGenerator(SampleGenerator):
     """
     A data generator that generates discrete distributed samples of X and Y.
     Both X and Y should take values between 1 and n.
     """
     def __init__(self, n: int = 1000, N: int = 100000, 
-                 independent: bool = False, distribution: str = "random") -> None:
+                 independent: bool = False, distribution: str = "random", seed=None) -> None:
         """
         Create a discrete sample generator.
 
@@ -21,15 +58,19 @@ class DiscreteSampleGenerator(DataGenerator):
             distribution (str): The distribution of X and Y. Currently support "random" and "zipfian". "random" distribution
                 means the joint probability is randomly generated, and "zipfian" means that the probability follows a Zipf's
                 law (https://en.wikipedia.org/wiki/Zipf%27s_law).
+            seed (int or np.random.Generator): seed of the random number generator used for
+                both the probability table and the samples.
         """
         super().__init__(output_type=int, N=N)
         self.n = n
         self.independent = independent
         self.distribution = distribution
         assert distribution in ["random", "zipfian"], f"the distribution '{distribution}' is not supported."
+        self.rng = np.random.default_rng(seed)
 
         self.p_x, self.p_y, self.prob_table = self._initialize_probability_table()
         self.ground_truth = self._compute_ground_truth()
+        self.cdf_x, self.cdf_y = self._initialize_cumulative_distributions()
         
     
     def _initialize_probability_table(self):
@@ -46,13 +87,13 @@ class DiscreteSampleGenerator(DataGenerator):
         if self.independent:
             # Randomly generate marginal distribution
             if self.distribution == "random":
-                p_x = np.random.random((self.n, 1))
-                p_y = np.random.random((1, self.n))
+                p_x = self.rng.random((self.n, 1))
+                p_y = self.rng.random((1, self.n))
             elif self.distribution == "zipfian":
                 p_x = 1/(np.arange(self.n) + 1)
                 p_y = 1/(np.arange(self.n) + 1)
-                np.random.shuffle(p_x)
-                np.random.shuffle(p_y)
+                self.rng.shuffle(p_x)
+                self.rng.shuffle(p_y)
                 p_x = np.reshape(p_x, (self.n, 1))
                 p_y = np.reshape(p_y, (1, self.n))
             
@@ -65,10 +106,10 @@ class DiscreteSampleGenerator(DataGenerator):
         else:
             # Randomly generate the whole matrix, then normalize
             if self.distribution == "random":
-                prob_table = np.random.random((self.n, self.n))
+                prob_table = self.rng.random((self.n, self.n))
             elif self.distribution == "zipfian":
                 prob_table = 1/(np.arange(self.n ** 2) + 1)
-                np.random.shuffle(prob_table)
+                self.rng.shuffle(prob_table)
                 prob_table = np.reshape(prob_table, (self.n, self.n))
 
             
@@ -95,30 +136,45 @@ class DiscreteSampleGenerator(DataGenerator):
         return ground_truth
 
     
-    def _generate_item(self):
+    def _initialize_cumulative_distributions(self):
         """
-        Randomly generate a sample (i, j) based on self.prob_table.
+        Precompute the cumulative distributions used for sampling, so that each sample
+        only costs a binary search.
+
+        Returns:
+            cdf_x (np.array): shape (self.n,), cumulative distribution of X.
+            cdf_y (np.array): shape (self.n,), cumulative distribution of Y, if X and Y
+                are independent. Otherwise shape (self.n * self.n,), where the entries
+                [i * n, (i+1) * n) are i plus the cumulative distribution of p(y|x=i),
+                so that all the conditionals can be searched at once.
         """
-        i = np.random.choice(np.arange(self.n), p=self.p_x.flatten())
-        # Calculate conditional probability p(y|x=i)
-        py_x = self.prob_table[i, :]
-        py_x /= np.sum(py_x)
-        j =np.random.choice(np.arange(self.n), p=py_x.flatten())
-        
-        return i + 1, j + 1
-    
-    def write_file(self, file_name: str):
-        super().write_file(file_name)
-        estimator = ExactEstimator(self.n, metric=["l1", "l2", "independent"])
-        estimator.read_from_file(file_name)
-        l1, l2, independent = estimator.compute()
-        answer = {"l1": l1, "l2": l2, "independent": independent}
-        print(answer)
+        cdf_x = np.cumsum(self.p_x.flatten())
+        cdf_x /= cdf_x[-1]
+        if self.independent:
+            cdf_y = np.cumsum(self.p_y.flatten())
+            cdf_y /= cdf_y[-1]
+        else:
+            cdf_y = np.cumsum(self.prob_table, axis=1)
+            cdf_y /= cdf_y[:, -1:]
+            cdf_y += np.arange(self.n).reshape(self.n, 1)
+            cdf_y = cdf_y.flatten()
+        return cdf_x, cdf_y
 
-        with open(os.path.join(ANSWER_DIR, file_name + '.pickle'), 'wb') as p:
-            pickle.dump(answer, p, protocol=pickle.HIGHEST_PROTOCOL)
 
+    def _generate_batch(self, size: int):
+        """
+        Randomly generate a batch of samples (i, j) based on self.prob_table.
+        """
+        i = np.searchsorted(self.cdf_x, self.rng.random(size), side="right")
+        i = np.minimum(i, self.n - 1)
+        if self.independent:
+            j = np.searchsorted(self.cdf_y, self.rng.random(size), side="right")
+        else:
+            # Search in the cumulative distribution of p(y|x=i)
+            j = np.searchsorted(self.cdf_y, self.rng.random(size) + i, side="right") - i * self.n
+        j = np.clip(j, 0, self.n - 1)
 
+        return i + 1, j + 1
 
 
 if __name__ == "__main__":
@@ -0,0 +1,291 @@
+"""
+Generators of structured joint distributions for large ranges n, which never build the
+n * n probability table: they need O(n) memory (O(n + k^2) for the mixtures), draw each
+sample in O(1) with alias tables, and compute the ground truth from the structure. Let P
+be the joint distribution, p and q its marginals and D = P - p q^T.
+
+LowRankSampleGenerator: a mixture of k independent components with disjoint supports.
+The values of X are split into k blocks S_c, and those of Y into k blocks T_c; component c
+has weight w_c and draws X from u_c on S_c and Y from v_c on T_c. Then
+
+    D = sum_{c, d} M_cd u_c v_d^T,    M = diag(w) - w w^T
+
+and since the blocks are disjoint, D is M_cd u_c v_d^T on the block S_c x T_d, so
+
+    ||D||_1 = sum_{c, d} |M_cd|,    ||D||_2^2 = sum_{c, d} M_cd^2 ||u_c||^2 ||v_d||^2
+
+BandedSampleGenerator: X follows u, and with probability rho Y = X + o (mod n) with an
+offset o in [-b, b] following kappa, otherwise Y follows q0 independently of X. The joint
+is (1 - rho) u q0^T + rho K with K_ij = u_i kappa_(j - i), and D = rho (K - u c^T) where c is
+the circular convolution of u and kappa. D is computed one band (one offset) at a time,
+in O(n b).
+
+PlantedSampleGenerator: X follows p0 and Y follows q0 independently, except for the values
+of X in a subset S of m values, where with probability rho Y = pi(X) for a fixed injective
+map pi. Let t be the distribution of pi(X) on S and p0(S) the mass of S, then
+q = (1 - rho p0(S)) q0 + rho t, and with delta = q0 - q and w = delta - rho q0 the row i of D is
+p0_i delta outside S and p0_i (w + rho e_pi(i)) in S, so both norms are O(n).
+"""
+import numpy as np
+from mini_project.data.generate_dataset import SampleGenerator
+
+
+def alias_table(p: np.ndarray):
+    """
+    Build the alias table of a distribution (Walker's method), to draw from it in O(1).
+    Cell k is drawn uniformly, and gives k with probability prob[k] or alias[k] otherwise.
+
+    The small cells (probability below the average) are filled by the large ones in bulk:
+    the deficits of the small cells are laid end to end and each one is filled by the
+    large cell whose surplus covers its start. A large cell can be overdrawn by one
+    deficit, in which case it becomes small and is filled in the next round.
+
+    Args:
+        p (np.array): the probabilities, or weights, of the values.
+
+    Returns:
+        prob (np.array of float64), alias (np.array of int64): the alias table.
+    """
+    m = len(p)
+    q = np.asarray(p, dtype=np.float64) * m / np.sum(p)
+    prob = np.ones(m)
+    alias = np.arange(m)
+    small, large = np.flatnonzero(q < 1), np.flatnonzero(q >= 1)
+    while len(small) and len(large):
+        deficit = 1 - q[small]
+        start = np.cumsum(deficit) - deficit
+        donor = np.searchsorted(np.cumsum(q[large] - 1), start, side="right")
+        # Deficits beyond all surplus are rounding errors
+        filled = donor < len(large)
+        prob[small[filled]] = q[small[filled]]
+        alias[small[filled]] = large[donor[filled]]
+        q[large] -= np.bincount(donor[filled], weights=deficit[filled], minlength=len(large))
+        small, large = large[q[large] < 1], large[q[large] >= 1]
+    return prob, alias
+
+
+def alias_sample(rng: np.random.Generator, prob: np.ndarray, alias: np.ndarray, size: int,
+                 start=0, length=None) -> np.ndarray:
+    """
+    Draw from alias tables, see alias_table().
+
+    Args:
+        rng (np.random.Generator): the random number generator.
+        prob, alias (np.array): the alias table, or several tables laid end to end with
+            the alias of each table shifted by its start.
+        size (int): number of draws.
+        start, length (int or np.array of shape (size,)): the start and length of the
+            table of each draw, the whole table by default.
+
+    Returns:
+        np.array of int64: the drawn positions in prob.
+    """
+    length = len(prob) if length is None else length
+    u = rng.random(size) * length
+    cell = np.minimum(u.astype(np.int64), np.asarray(length) - 1)
+    cell += start
+    return np.where(u - np.floor(u) < prob[cell], cell, alias[cell])
+
+
+class StructuredSampleGenerator(SampleGenerator):
+    """
+    Base class for the generators of structured joint distributions of X and Y between 1
+    and n, see the module documentation.
+
+    Args:
+        n (int): range of the random variables X and Y.
+        N (int): length of the stream.
+        distribution (str): "random" or "zipfian", the distribution of the weights the
+            distributions of the structure are made of, as in DiscreteSampleGenerator.
+        seed (int or np.random.Generator): seed of the structure and of the samples.
+    """
+    def __init__(self, n: int, N: int, distribution: str = "random", seed=None) -> None:
+        super().__init__(output_type=int, N=N)
+        assert distribution in ["random", "zipfian"], f"the distribution '{distribution}' is not supported."
+        self.n = n
+        self.distribution = distribution
+        self.rng = np.random.default_rng(seed)
+
+    def _weights(self, size: int) -> np.ndarray:
+        """
+        Draw a distribution over `size` values.
+        """
+        if self.distribution == "random":
+            weights = self.rng.random(size)
+        else:
+            weights = 1 / (np.arange(size) + 1)
+            self.rng.shuffle(weights)
+        return weights / np.sum(weights)
+
+    def _compute_ground_truth(self) -> dict:
+        """
+        Compute the l1 and l2 difference from the structure.
+
+        Returns:
+            dict: the l1 and l2 difference and whether X and Y are independent.
+        """
+        pass
+
+
+class LowRankSampleGenerator(StructuredSampleGenerator):
+    """
+    Mixture of k independent components with disjoint supports, see the module
+    documentation. X and Y are independent if k = 1.
+
+    The components are restricted to disjoint blocks of values: D is then constant up to
+    scaling on each block S_c x T_d, which gives the l1 difference in closed form. With
+    overlapping supports, the blocks would mix the terms of several components and the
+    l1 difference would need the n * n table, so overlapping components are not supported.
+
+    Args:
+        n (int): range of the random variables X and Y.
+        N (int): length of the stream.
+        k (int): number of components, at most n.
+        distribution (str): "random" or "zipfian", the distribution of the weights of the
+            components and of the values inside each block.
+        seed (int or np.random.Generator): seed of the structure and of the samples.
+    """
+    def __init__(self, n: int = 1000, N: int = 100000, k: int = 4, distribution: str = "random",
+                 seed=None) -> None:
+        super().__init__(n, N, distribution=distribution, seed=seed)
+        assert 1 <= k <= n, "the number of components should be in [1, n]."
+        self.k = k
+        self.weights = self._weights(k)
+        self.weight_prob, self.weight_alias = alias_table(self.weights)
+
+        # Block c holds the values perm[bounds[c]:bounds[c + 1]] of each variable
+        self.bounds = np.arange(k + 1) * n // k
+        self.lengths = np.diff(self.bounds)
+        self.perm_x, self.perm_y = self.rng.permutation(n), self.rng.permutation(n)
+        self.u, self.v = [np.concatenate([self._weights(length) for length in self.lengths])
+                          for _ in range(2)]
+        self.table_x, self.table_y = self._block_tables(self.u), self._block_tables(self.v)
+        self.ground_truth = self._compute_ground_truth()
+
+    def _block_tables(self, p: np.ndarray):
+        """
+        Alias tables of the distribution of each block, laid end to end.
+        """
+        prob, alias = np.ones(self.n), np.arange(self.n)
+        for start, end in zip(self.bounds[:-1], self.bounds[1:]):
+            prob[start:end], alias[start:end] = alias_table(p[start:end])
+            alias[start:end] += start
+        return prob, alias
+
+    def _compute_ground_truth(self) -> dict:
+        M = np.diag(self.weights) - np.outer(self.weights, self.weights)
+        norms_u = np.add.reduceat(self.u ** 2, self.bounds[:-1])
+        norms_v = np.add.reduceat(self.v ** 2, self.bounds[:-1])
+        return {"l1": np.sum(np.abs(M)), "l2": np.sqrt(np.sum(M ** 2 * np.outer(norms_u, norms_v))),
+                "independent": self.k == 1}
+
+    def _generate_batch(self, size: int):
+        c = alias_sample(self.rng, self.weight_prob, self.weight_alias, size)
+        start, length = self.bounds[c], self.lengths[c]
+        i = self.perm_x[alias_sample(self.rng, *self.table_x, size, start=start, length=length)]
+        j = self.perm_y[alias_sample(self.rng, *self.table_y, size, start=start, length=length)]
+        return i + 1, j + 1
+
+
+class BandedSampleGenerator(StructuredSampleGenerator):
+    """
+    Y is X shifted by a small random offset (mod n) with probability rho, and independent
+    of X otherwise, so that the dependence is on a band around the (circular) diagonal.
+    See the module documentation. X and Y are independent if rho = 0.
+
+    Args:
+        n (int): range of the random variables X and Y.
+        N (int): length of the stream.
+        bandwidth (int): largest offset b, with 2 b + 1 <= n.
+        rho (float): probability of the dependent part, in [0, 1].
+        distribution (str): "random" or "zipfian", the distribution of the weights of X,
+            of the independent Y and of the offsets.
+        seed (int or np.random.Generator): seed of the structure and of the samples.
+    """
+    def __init__(self, n: int = 1000, N: int = 100000, bandwidth: int = 2, rho: float = 0.5,
+                 distribution: str = "random", seed=None) -> None:
+        super().__init__(n, N, distribution=distribution, seed=seed)
+        assert 2 * bandwidth + 1 <= n, "the band should be narrower than n."
+        assert 0 <= rho <= 1, "rho should be in [0, 1]."
+        self.bandwidth = bandwidth
+        self.rho = rho
+        self.u, self.q0 = self._weights(n), self._weights(n)
+        self.kappa = self._weights(2 * bandwidth + 1)   # Probabilities of the offsets -b, ..., b
+        self.table_u, self.table_q0 = alias_table(self.u), alias_table(self.q0)
+        self.table_kappa = alias_table(self.kappa)
+        self.ground_truth = self._compute_ground_truth()
+
+    def _compute_ground_truth(self) -> dict:
+        offsets = np.arange(-self.bandwidth, self.bandwidth + 1)
+        c = np.zeros(self.n)
+        for o, kappa in zip(offsets, self.kappa):
+            c += kappa * np.roll(self.u, o)
+
+        # Row i of K - u c^T is u_i (kappa_o - c_(i + o)) in the band, and u_i c_j outside
+        l1, l2 = np.ones(self.n), np.full(self.n, np.sum(c ** 2))
+        for o, kappa in zip(offsets, self.kappa):
+            band = np.roll(c, -o)
+            l1 += np.abs(kappa - band) - band
+            l2 += (kappa - band) ** 2 - band ** 2
+        return {"l1": self.rho * np.sum(self.u * l1), "l2": self.rho * np.sqrt(np.sum(self.u ** 2 * l2)),
+                "independent": self.rho == 0}
+
+    def _generate_batch(self, size: int):
+        i = alias_sample(self.rng, *self.table_u, size)
+        offset = alias_sample(self.rng, *self.table_kappa, size) - self.bandwidth
+        j = alias_sample(self.rng, *self.table_q0, size)
+        j = np.where(self.rng.random(size) < self.rho, (i + offset) % self.n, j)
+        return i + 1, j + 1
+
+
+class PlantedSampleGenerator(StructuredSampleGenerator):
+    """
+    X and Y are independent except on a random subset of m values of X, where Y is a
+    fixed function of X with probability rho. See the module documentation. X and Y are
+    independent if rho = 0.
+
+    Args:
+        n (int): range of the random variables X and Y.
+        N (int): length of the stream.
+        m (int): size of the subset, at most n.
+        rho (float): probability that Y = pi(X) when X is in the subset, in [0, 1].
+        distribution (str): "random" or "zipfian", the distribution of the weights of X
+            and of the independent Y.
+        seed (int or np.random.Generator): seed of the structure and of the samples.
+    """
+    def __init__(self, n: int = 1000, N: int = 100000, m: int = 10, rho: float = 0.5,
+                 distribution: str = "random", seed=None) -> None:
+        super().__init__(n, N, distribution=distribution, seed=seed)
+        assert 1 <= m <= n, "the size of the subset should be in [1, n]."
+        assert 0 <= rho <= 1, "rho should be in [0, 1]."
+        self.m = m
+        self.rho = rho
+        self.p0, self.q0 = self._weights(n), self._weights(n)
+        self.subset = self.rng.choice(n, size=m, replace=False)
+        self.target = np.full(n, -1)   # pi(i) for i in the subset, -1 elsewhere
+        self.target[self.subset] = self.rng.choice(n, size=m, replace=False)
+        self.table_p0, self.table_q0 = alias_table(self.p0), alias_table(self.q0)
+        self.ground_truth = self._compute_ground_truth()
+
+    def _compute_ground_truth(self) -> dict:
+        p_S, target = self.p0[self.subset], self.target[self.subset]
+        t = np.zeros(self.n)
+        t[target] = p_S
+        q = (1 - self.rho * np.sum(p_S)) * self.q0 + self.rho * t
+        delta = self.q0 - q
+        w = delta - self.rho * self.q0
+
+        w_l1, w_l2 = np.sum(np.abs(w)), np.sum(w ** 2)
+        w_pi = w[target]
+        l1 = (1 - np.sum(p_S)) * np.sum(np.abs(delta)) \
+            + np.sum(p_S * (w_l1 - np.abs(w_pi) + np.abs(w_pi + self.rho)))
+        l2 = (np.sum(self.p0 ** 2) - np.sum(p_S ** 2)) * np.sum(delta ** 2) \
+            + np.sum(p_S ** 2 * (w_l2 + 2 * self.rho * w_pi + self.rho ** 2))
+        return {"l1": l1, "l2": np.sqrt(l2), "independent": self.rho == 0}
+
+    def _generate_batch(self, size: int):
+        i = alias_sample(self.rng, *self.table_p0, size)
+        j = alias_sample(self.rng, *self.table_q0, size)
+        target = self.target[i]
+        j = np.where((target >= 0) & (self.rng.random(size) < self.rho), target, j)
+        return i + 1, j + 1
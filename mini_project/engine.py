@@ -0,0 +1,175 @@
+"""
+Read a stream once and feed it to several estimators.
+
+Comparing estimators with check_error re-reads and re-parses the file for each of them.
+FanOut parses each chunk of the stream once and hands the same arrays to every registered
+estimator. Counter matrices with the same hash functions (e.g. counter_matrix.L2Estimator
+and counter_matrix.L1Estimator built with the same seed and size A) also share the hash
+values of each batch, so they are evaluated once per batch instead of once per estimator.
+"""
+import os
+import pickle
+import time
+from mini_project.utils import Estimator, ANSWER_DIR, _resolve_stream
+from mini_project.stream import StreamReader, DEFAULT_CHUNK_SIZE
+import numpy as np
+
+
+class FanOut:
+    """
+    Feed each batch of a stream to several estimators.
+
+    Args:
+        estimators (dict): estimators to read the stream with, by name.
+    """
+    def __init__(self, estimators: dict = None) -> None:
+        self.estimators = {}
+        for name, estimator in (estimators or {}).items():
+            self.add(name, estimator)
+
+
+    def add(self, name: str, estimator: Estimator):
+        """
+        Register an estimator under a name.
+        """
+        assert name not in self.estimators, f"an estimator named {name} is already registered."
+        if self.estimators:
+            input_type = next(iter(self.estimators.values())).input_type
+            assert estimator.input_type is input_type, \
+                f"all the estimators should have the same input type {input_type.__name__}."
+            assert estimator.columns == self.columns, \
+                f"all the estimators should read streams of {self.columns} columns."
+        self.estimators[name] = estimator
+        return estimator
+
+
+    @property
+    def input_type(self):
+        return next(iter(self.estimators.values())).input_type if self.estimators else int
+
+
+    @property
+    def columns(self):
+        return next(iter(self.estimators.values())).columns if self.estimators else 2
+
+
+    def read_batch(self, *columns):
+        """
+        Read a batch of items with every estimator.
+
+        Args:
+            columns (np.array): the samples of each column, e.g. xs and ys, the samples
+                in the stream that follow distributions X and Y.
+        """
+        if not self.estimators:
+            return
+        if len(columns) != 2:
+            # The hash values are only shared between estimators of pairs, see
+            # utils.Estimator._hash_batch
+            for estimator in self.estimators.values():
+                estimator.read_batch(*columns)
+            return
+        xs, ys = next(iter(self.estimators.values()))._to_arrays(*columns)
+        cache = {"xs": xs, "ys": ys, "values": {}}
+        for estimator in self.estimators.values():
+            estimator._set_hash_cache(cache)
+        try:
+            for estimator in self.estimators.values():
+                estimator.read_batch(xs, ys)
+        finally:
+            for estimator in self.estimators.values():
+                estimator._set_hash_cache(None)
+
+
+    def read_from_file(self, file_name, chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+        """
+        Read the stream from a file, parsing it only once for all the estimators.
+
+        Args:
+            file_name (string or file object): see utils.Estimator.read_from_file.
+            chunk_size (int): number of bytes parsed at a time.
+
+        Returns:
+            A dict of the reading statistics (see stream.StreamReader.stats), together with
+            the total time spent in "total_seconds".
+        """
+        start = time.perf_counter()
+        dtype = np.int64 if self.input_type is int else np.float64
+        reader = StreamReader(_resolve_stream(file_name), columns=self.columns, dtype=dtype,
+                              chunk_size=chunk_size)
+        for batch in reader:
+            self.read_batch(*batch)
+
+        stats = reader.stats()
+        stats["total_seconds"] = time.perf_counter() - start
+        return stats
+
+
+    def read_batches(self, batches) -> dict:
+        """
+        Read a stream given as an iterable of batches with every estimator, see
+        utils.Estimator.read_batches.
+        """
+        start = time.perf_counter()
+        items = 0
+        for batch in batches:
+            self.read_batch(*batch)
+            items += len(batch[0])
+        return {"items": items, "total_seconds": time.perf_counter() - start}
+
+
+    def compute(self) -> dict:
+        """
+        Compute the metric of every estimator.
+
+        Returns:
+            A dict of the results, by name.
+        """
+        return {name: estimator.compute() for name, estimator in self.estimators.items()}
+
+
+    def snapshot(self):
+        """
+        Copy the estimators to compute their results while they go on reading, see
+        utils.Estimator.snapshot.
+        """
+        return FanOut({name: estimator.snapshot() for name, estimator in self.estimators.items()})
+
+
+    def reset(self):
+        for estimator in self.estimators.values():
+            estimator.reset()
+
+
+def check_errors(estimators: dict, file_name: str) -> dict:
+    """
+    Evaluate several estimators on a stream read once, like utils.check_error for each.
+
+    Args:
+        estimators (dict): (estimator, metric) pairs by name, where metric is the metric
+            the estimator computes.
+        file_name (string): the name of a stream in TEST_DATA_DIR.
+
+    Returns:
+        A dict by name of (result, answer, multiplicative error) triples, or of 0/1 for
+        the metric "independent" (see utils.check_error).
+    """
+    with open(os.path.join(ANSWER_DIR, file_name + '.pickle'), 'rb') as p:
+        answer = pickle.load(p)
+    for name, (_, metric) in estimators.items():
+        assert metric in answer, f"the metric {metric} of {name} is not computed in the "\
+            f"specified ground truth file {ANSWER_DIR}{file_name}.pickle."
+
+    engine = FanOut({name: estimator for name, (estimator, _) in estimators.items()})
+    engine.read_from_file(file_name)
+    results = engine.compute()
+
+    errors = {}
+    for name, (_, metric) in estimators.items():
+        res = results[name]
+        print(f"{name}: estimator result {res}, answer {answer[metric]}")
+        if metric != "independent":
+            errors[name] = (res, answer[metric], abs(1 - res/answer[metric]))
+        else:
+            errors[name] = int(res != answer[metric])
+    return errors
@@ -0,0 +1,165 @@
+import collections
+import functools
+import time
+import numpy as np
+
+
+class Stats:
+    """
+    Per-phase timers and counters of an estimator, see Estimator.enable_stats.
+
+    The time of each phase is exclusive: when a phase runs inside another one (e.g.
+    "hash" inside "update"), its time is only counted in the inner phase.
+
+    Phases:
+        read: reading the stream from the file.
+        parse: parsing the stream into arrays.
+        hash: evaluating the hash functions.
+        update: updating the counters (excluding hashing).
+        compute: computing the metric.
+
+    Counters:
+        items: number of items read.
+        bytes_parsed: number of bytes of the stream parsed.
+        hash_evaluations: number of hash values computed (or looked up), i.e. the size
+            of the values returned by the hash functions. An estimator made of B counter
+            matrices computes 2 B values per item, one of X and one of Y in each matrix.
+        compute_calls: number of calls to compute().
+    """
+    def __init__(self) -> None:
+        self.seconds = collections.defaultdict(float)   # Exclusive time of each phase
+        self.counts = collections.defaultdict(int)      # Counters
+        self.created = time.time()
+        self._stack = []                                # [phase, start time, time of inner phases]
+        self._callbacks = []                            # [function, interval, last call]
+
+
+    @property
+    def depth(self) -> int:
+        """
+        Number of phases currently running.
+        """
+        return len(self._stack)
+
+
+    def start(self, phase: str):
+        self._stack.append([phase, time.perf_counter(), 0.0])
+
+
+    def stop(self):
+        phase, start, inner = self._stack.pop()
+        elapsed = time.perf_counter() - start
+        self.seconds[phase] += elapsed - inner
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+
+    def add(self, counter: str, value=1):
+        self.counts[counter] += value
+
+
+    def add_time(self, phase: str, seconds: float):
+        self.seconds[phase] += seconds
+
+
+    def add_callback(self, function, interval: float = 0.0):
+        """
+        Register a function to be called with a snapshot of the stats (see
+        Estimator.stats_snapshot) at most every `interval` seconds, after a top-level call
+        to read_batch or compute.
+        """
+        self._callbacks.append([function, interval, time.perf_counter()])
+
+
+    def export(self, estimator, force: bool = False):
+        """
+        Call the callbacks whose interval has passed.
+        """
+        now = time.perf_counter()
+        snapshot = None
+        for callback in self._callbacks:
+            function, interval, last = callback
+            if force or now - last >= interval:
+                snapshot = snapshot or estimator.stats_snapshot()
+                callback[2] = now
+                function(snapshot)
+
+
+    def snapshot(self) -> dict:
+        """
+        Return a copy of the timers and counters.
+        """
+        seconds = dict(self.seconds)
+        total = sum(seconds.values())
+        return {
+            "seconds": seconds,
+            "counts": dict(self.counts),
+            "items_per_sec": self.counts["items"] / total if total > 0 else 0.0,
+            "uptime_seconds": time.time() - self.created,
+        }
+
+
+    def reset(self):
+        self.seconds.clear()
+        self.counts.clear()
+
+
+    def __getstate__(self):
+        # Callbacks may not be picklable, and should not be copied along with estimators
+        state = self.__dict__.copy()
+        state["_callbacks"] = []
+        state["_stack"] = []
+        return state
+
+
+# Instrumented methods of the estimators: name -> phase. _read_item is left out, since
+# timing each item would cost more than reading it; read_batch and the hash functions are
+# timed instead.
+INSTRUMENTED_METHODS = {
+    "read_batch": "update",
+    "_calculate_hash_functions": "hash",
+    "_get_values": "hash",
+    "compute": "compute",
+}
+
+
+def _size(values) -> int:
+    """
+    Count the values returned by a hash function (an array, or a tuple or list of them).
+    """
+    if isinstance(values, (tuple, list)):
+        return sum(_size(v) for v in values)
+    return int(np.size(values))
+
+
+def instrumented(method, phase: str):
+    """
+    Wrap a method of an estimator to time it with the estimator's stats, see
+    Estimator.enable_stats.
+    """
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        stats = self.stats
+        if stats is None:
+            return method(self, *args, **kwargs)
+
+        top = stats.depth == 0
+        stats.start(phase)
+        try:
+            result = method(self, *args, **kwargs)
+            if phase == "hash":
+                stats.add("hash_evaluations", _size(result))
+            return result
+        finally:
+            stats.stop()
+            # Only count the calls from outside, not the ones of the estimator itself
+            if top:
+                if name == "read_batch":
+                    stats.add("items", len(args[0]))
+                elif name == "compute":
+                    stats.add("compute_calls")
+                stats.export(self)
+
+    return wrapper
@@ -0,0 +1,89 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from mini_project.utils import Estimator, _resolve_stream
+from mini_project.stream import StreamReader, split_file, DEFAULT_CHUNK_SIZE
+import numpy as np
+
+# Estimator used by the current worker process
+_worker_estimator = None
+
+
+def _init_worker(estimator: Estimator):
+    """
+    Store an empty copy of the estimator in the worker process.
+    """
+    global _worker_estimator
+    _worker_estimator = estimator
+    _worker_estimator.reset()
+
+
+def _read_range(path, start: int, end: int, chunk_size: int):
+    """
+    Read the lines in the byte range [start, end) of the file with the worker's estimator.
+
+    Returns:
+        counters (list): the state of the estimator after reading the range.
+        stats (dict): the reading statistics.
+    """
+    dtype = np.int64 if _worker_estimator.input_type is int else np.float64
+    reader = StreamReader(path, columns=_worker_estimator.columns, dtype=dtype, chunk_size=chunk_size,
+                          start=start, end=end)
+    for batch in reader:
+        _worker_estimator.read_batch(*batch)
+    counters = _worker_estimator.counters()
+    _worker_estimator.reset()
+    return counters, reader.stats()
+
+
+def read_file_parallel(estimator: Estimator, file_name, workers: int = None,
+                       chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+    """
+    Read a stream from a file with multiple processes. The file is split into byte ranges
+    aligned to lines, each range is read by an identically seeded copy of the estimator,
+    and the partial states are merged into the estimator. The result is the same as
+    estimator.read_from_file(file_name).
+
+    Compressed files and the standard input cannot be split, so they are read by the
+    current process instead.
+
+    Estimators that choose their hash state from the stream (e.g. the heavy pairs of
+    heavy_hitters.HybridL2Estimator during its warmup) are refused, since each copy would
+    choose its own from its part of the stream.
+
+    Args:
+        estimator (utils.Estimator): an estimator that supports merging.
+        file_name (string): the name of a stream in TEST_DATA_DIR, or a path to a file.
+        workers (int): number of processes, defaults to the number of CPUs.
+        chunk_size (int): number of bytes parsed at a time by each process.
+
+    Returns:
+        A dict of the number of items read, the time spent and the throughput.
+    """
+    path = _resolve_stream(file_name)
+    if not isinstance(path, (str, os.PathLike)) or path == "-" or str(path).endswith(".gz"):
+        return estimator.read_from_file(path, chunk_size=chunk_size)
+
+    assert not estimator._learns_hash_state(), "the estimator chooses its hash state from the "\
+        "stream, so copies reading parts of the stream cannot be merged."
+
+    start = time.perf_counter()
+    workers = workers or os.cpu_count()
+    # Use more ranges than workers to balance the load
+    ranges = split_file(path, 4 * workers)
+
+    items = 0
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(estimator,)) as pool:
+        futures = [pool.submit(_read_range, path, s, e, chunk_size) for s, e in ranges]
+        for future in futures:
+            counters, stats = future.result()
+            estimator._add_counters(counters)
+            items += stats["items"]
+
+    seconds = time.perf_counter() - start
+    return {
+        "items": items,
+        "workers": workers,
+        "total_seconds": seconds,
+        "items_per_sec": items / seconds if seconds > 0 else float("inf"),
+    }
@@ -0,0 +1,102 @@
+"""
+In-memory streaming from data generators to estimators.
+
+Instead of generating a file and reading it back, a generator's batches can be fed to an
+estimator directly:
+
+    estimator.read_batches(generator.iter_batches())
+
+prefetch runs the producer of the batches in a background thread or process, so that
+generating the next batches overlaps with estimating the current one. The batches go
+through a bounded queue, so the memory stays bounded by `depth` batches whatever the
+length of the stream.
+"""
+import multiprocessing
+import queue
+import threading
+from mini_project.utils import DataGenerator, GENERATE_BATCH_SIZE
+
+# Marks the end of the stream in the queue
+_END = "end"
+
+
+class _ProducerError:
+    """
+    An exception raised by the producer, to be raised again in the consumer.
+    """
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+def _produce(batches, out, stop):
+    """
+    Put the batches into the queue until they are exhausted or the consumer stops.
+    """
+    try:
+        for batch in batches:
+            while not stop.is_set():
+                try:
+                    out.put(batch, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            if stop.is_set():
+                return
+        out.put(_END)
+    except BaseException as error:
+        out.put(_ProducerError(error))
+
+
+def _produce_generated(generator: DataGenerator, batch_size: int, out, stop):
+    _produce(generator.iter_batches(batch_size), out, stop)
+
+
+def prefetch(batches, depth: int = 4, process: bool = False,
+             batch_size: int = GENERATE_BATCH_SIZE):
+    """
+    Produce the batches in the background while they are consumed.
+
+    Args:
+        batches (iterable or utils.DataGenerator): the batches to produce. A generator
+            object is turned into its iter_batches(); with process set it must be a
+            DataGenerator, which is copied to the new process, so the random state of the
+            generator in this process does not advance.
+        depth (int): maximum number of batches waiting in the queue.
+        process (bool): run the producer in a separate process instead of a thread, for
+            producers that hold the GIL.
+        batch_size (int): number of pairs in each batch, if batches is a DataGenerator.
+
+    Yields:
+        The batches, in order.
+    """
+    assert depth >= 1, "the depth of the queue should be at least 1."
+    if process:
+        assert isinstance(batches, DataGenerator), "only a DataGenerator can be produced in a process."
+        context = multiprocessing.get_context()
+        out, stop = context.Queue(maxsize=depth), context.Event()
+        worker = context.Process(target=_produce_generated, args=(batches, batch_size, out, stop),
+                                 daemon=True)
+    else:
+        if isinstance(batches, DataGenerator):
+            batches = batches.iter_batches(batch_size)
+        out, stop = queue.Queue(maxsize=depth), threading.Event()
+        worker = threading.Thread(target=_produce, args=(batches, out, stop), daemon=True)
+
+    worker.start()
+    try:
+        while True:
+            batch = out.get()
+            if isinstance(batch, str) and batch == _END:
+                break
+            if isinstance(batch, _ProducerError):
+                raise batch.error
+            yield batch
+    finally:
+        # Unblock the producer if the consumer stopped early
+        stop.set()
+        while worker.is_alive():
+            try:
+                out.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        worker.join()
@@ -0,0 +1,289 @@
+"""
+Choose the parameters of the estimators from a target accuracy and a memory budget.
+
+plan() takes a target multiplicative error ε, a failure probability δ, the range n of the
+samples and an optional budget in bytes, and for each estimator family returns the
+parameters derived from its error bound, with the predicted memory, per-item cost and
+error. Every family is a median of B groups, each a mean of A experiments (or a single
+experiment), with a variance bound of the form
+
+    Var[one experiment] <= c * F ** 2
+
+where F is the squared L2 difference (or the scale of the Cauchy variables for L1). The
+mean of A experiments is then within (1 ± ε') of F with probability 3/4 when
+A >= 4 c / ε'^2 (Chebyshev), and the median of B such means is within (1 ± ε') with
+probability 1 - δ when B >= 8 ln(1/δ) (Chernoff). The square root in compute() halves
+the error, so ε' = (1 + ε)^2 - 1.
+
+The per-item cost is predicted with a linear model of the work per item (number of
+hash values and counters touched), whose coefficients can be measured on the current
+machine with calibrate().
+
+read_until_stable() is an early-stop mode: it ends the ingestion once the standard error
+of the estimate, measured on disjoint segments of the stream, is small enough.
+"""
+import time
+import numpy as np
+from mini_project.algorithms import counter_matrix, sketching_sketches
+
+# Constant of the Chernoff bound for the median of groups that fail with probability 1/4
+MEDIAN_CONSTANT = 8
+
+# Variance constants c of one experiment, relative to the squared quantity estimated
+SIGN_VARIANCE = 2            # Products of 4-wise independent signs
+COUNTER_VARIANCE = 2         # Collisions in a counter matrix, divided by A
+CAUCHY_VARIANCE = np.pi ** 2 / 4
+
+# Default cost model: seconds per item = FIXED + PER_UNIT * work units of the family,
+# measured with calibrate() on a reference machine with batches of 2^16 items
+DEFAULT_COST_MODEL = {
+    "counter_matrix.L2": (2.4e-7, 3.1e-8),
+    "sketching_sketches.L2": (1.2e-7, 7.5e-8),
+    "sketching_sketches.L2(precompute)": (1.3e-7, 3.7e-9),
+    "sketching_sketches.L1": (3.2e-7, 5.1e-8),
+}
+
+
+def _groups(delta: float) -> int:
+    return max(1, int(np.ceil(MEDIAN_CONSTANT * np.log(1 / delta))))
+
+
+def _squared(epsilon: float) -> float:
+    """
+    Error on the squared quantity that gives an error epsilon on its square root.
+    """
+    return (1 + epsilon) ** 2 - 1
+
+
+def _unsquared(epsilon: float) -> float:
+    return np.sqrt(1 + epsilon) - 1
+
+
+# Estimator families. For each:
+#   params(epsilon, delta, n): the parameters achieving the error bound.
+#   accuracy: the parameter that controls the error, reduced to fit a budget.
+#   epsilon(params): the error bound of the parameters.
+#   memory(params, n): the bytes of the estimator.
+#   work(params): the work units per item of the cost model.
+#   build(params, n, seed): the estimator.
+FAMILIES = {
+    "counter_matrix.L2": {
+        "params": lambda epsilon, delta, n: {
+            "A": int(np.ceil(4 * COUNTER_VARIANCE / _squared(epsilon) ** 2)), "B": _groups(delta)},
+        "accuracy": "A",
+        "epsilon": lambda params: _unsquared(np.sqrt(4 * COUNTER_VARIANCE / params["A"])),
+        "memory": lambda params, n: params["B"] * (2 * params["A"] ** 2 + 32),
+        "work": lambda params: params["B"],
+        "build": lambda params, n, seed: counter_matrix.L2Estimator(params["A"], params["B"], seed=seed),
+    },
+    "sketching_sketches.L2": {
+        "params": lambda epsilon, delta, n: {
+            "A": int(np.ceil(4 * SIGN_VARIANCE / _squared(epsilon) ** 2)), "B": _groups(delta)},
+        "accuracy": "A",
+        "epsilon": lambda params: _unsquared(np.sqrt(4 * SIGN_VARIANCE / params["A"])),
+        "memory": lambda params, n: 3 * 8 * params["A"] * params["B"] + 2 * 8 * 4 * params["A"] * params["B"],
+        "work": lambda params: params["A"] * params["B"],
+        "build": lambda params, n, seed: sketching_sketches.L2Estimator(params["A"], params["B"], n=n, seed=seed),
+    },
+    "sketching_sketches.L2(precompute)": {
+        "params": lambda epsilon, delta, n: {
+            "A": int(np.ceil(4 * SIGN_VARIANCE / _squared(epsilon) ** 2)), "B": _groups(delta)},
+        "accuracy": "A",
+        "epsilon": lambda params: _unsquared(np.sqrt(4 * SIGN_VARIANCE / params["A"])),
+        "memory": lambda params, n: 3 * 8 * params["A"] * params["B"] + 2 * 8 * 4 * params["A"] * params["B"]
+            + sketching_sketches.sign_table_bytes(params["A"], params["B"], n),
+        "work": lambda params: params["A"] * params["B"],
+        "build": lambda params, n, seed: sketching_sketches.L2Estimator(params["A"], params["B"], n=n, seed=seed,
+                                                                        precompute=True),
+    },
+    "sketching_sketches.L1": {
+        # The median of s Cauchy variables has relative variance pi^2 / (4 s); the answer
+        # is an O(log n) approximation of the l1 difference, see L1Estimator.
+        "params": lambda epsilon, delta, n: {
+            "delta": delta, "s": int(np.ceil(4 * CAUCHY_VARIANCE / epsilon ** 2))},
+        "accuracy": "s",
+        "epsilon": lambda params: np.sqrt(4 * CAUCHY_VARIANCE / params["s"]),
+        "memory": lambda params, n: 8 * int(np.ceil(np.log(1 / params["delta"]))) * (2 * params["s"] + 1),
+        "work": lambda params: int(np.ceil(np.log(1 / params["delta"]))) * params["s"],
+        "build": lambda params, n, seed: sketching_sketches.L1Estimator(params["delta"], params["s"], n=n,
+                                                                        seed=seed, cauchy="hash"),
+    },
+}
+
+
+def plan(epsilon: float, delta: float, n: int, budget: int = None, families: list = None,
+         cost_model: dict = None) -> list:
+    """
+    Choose the parameters of each estimator family.
+
+    Args:
+        epsilon (float): target multiplicative error.
+        delta (float): target failure probability.
+        n (int): range of the samples.
+        budget (int): maximum number of bytes of the estimator. If the parameters of a
+            family do not fit, its accuracy parameter is reduced until they do, and the
+            predicted error is that of the reduced parameters. Families that do not fit
+            even with the smallest accuracy parameter are given with it, and flagged.
+        families (list): names of the families in FAMILIES, all by default.
+        cost_model (dict): (fixed, per unit) seconds per item by family, see calibrate().
+
+    Returns:
+        A list of dicts, one per family, sorted by predicted cost per item, with the
+        "family", the "params", the "memory_bytes", "seconds_per_item" and "epsilon"
+        predicted, whether the target error is met ("meets_target") and whether the
+        memory fits in the budget ("fits_budget"). The plans that fit come first, then
+        those that meet the target.
+    """
+    assert 0 < epsilon and 0 < delta < 1, "epsilon should be positive and delta in (0, 1)."
+    cost_model = {**DEFAULT_COST_MODEL, **(cost_model or {})}
+    plans = []
+    for name in families or list(FAMILIES):
+        family = FAMILIES[name]
+        params = family["params"](epsilon, delta, n)
+        if budget is not None and family["memory"](params, n) > budget:
+            # Largest accuracy parameter that fits in the budget
+            key, low, high = family["accuracy"], 0, params[family["accuracy"]]
+            while low < high:
+                middle = (low + high + 1) // 2
+                if family["memory"]({**params, key: middle}, n) <= budget:
+                    low = middle
+                else:
+                    high = middle - 1
+            params[key] = max(low, 1)
+
+        fixed, per_unit = cost_model[name]
+        predicted = family["epsilon"](params)
+        plans.append({
+            "family": name,
+            "params": params,
+            "memory_bytes": int(family["memory"](params, n)),
+            "seconds_per_item": fixed + per_unit * family["work"](params),
+            "epsilon": float(predicted),
+            "delta": delta,
+            "meets_target": bool(predicted <= epsilon * (1 + 1e-9)),
+            "fits_budget": budget is None or family["memory"](params, n) <= budget,
+        })
+    return sorted(plans, key=lambda p: (not p["fits_budget"], not p["meets_target"], p["seconds_per_item"]))
+
+
+def build(plan: dict, n: int, seed=None):
+    """
+    Build the estimator of a plan returned by plan().
+    """
+    return FAMILIES[plan["family"]]["build"](plan["params"], n, seed)
+
+
+def calibrate(families: list = None, n: int = 1000, items: int = 1 << 16, seed: int = 0) -> dict:
+    """
+    Measure the cost model on the current machine: each family is timed with two sizes
+    of its accuracy parameter, and a line is fitted through the seconds per item.
+
+    Returns:
+        A dict of (fixed, per unit) seconds per item by family, to give to plan().
+    """
+    rng = np.random.default_rng(seed)
+    xs, ys = rng.integers(1, n + 1, size=(2, items))
+    model = {}
+    for name in families or list(FAMILIES):
+        family = FAMILIES[name]
+        points = []
+        for epsilon in [1.0, 0.5]:
+            params = family["params"](epsilon, 0.1, n)
+            estimator = family["build"](params, n, seed)
+            start = time.perf_counter()
+            estimator.read_batch(xs, ys)
+            points.append((family["work"](params), (time.perf_counter() - start) / items))
+        (w_1, t_1), (w_2, t_2) = points
+        per_unit = max((t_2 - t_1) / (w_2 - w_1), 0.0) if w_2 != w_1 else t_2 / max(w_2, 1)
+        model[name] = (max(t_1 - per_unit * w_1, 0.0), per_unit)
+    return model
+
+
+def _median_of_means(values: np.ndarray, groups: int) -> float:
+    """
+    Median of the means of `groups` groups of consecutive values.
+    """
+    return float(np.median([np.mean(group) for group in np.array_split(values, min(groups, len(values)))]))
+
+
+def _copy_counters(counters: list) -> list:
+    """
+    Copy the arrays of a list of counters (see utils.Estimator.counters).
+    """
+    return [np.copy(c) if isinstance(c, np.ndarray) else c for c in counters]
+
+
+def read_until_stable(estimator, batches, tolerance: float = 0.01, patience: int = 3,
+                      check_every: int = 1 << 16, min_items: int = 0, groups: int = 3) -> dict:
+    """
+    Read batches until the estimate is precise enough.
+
+    Every `check_every` items, the estimate of the items read since the previous check is
+    computed from the difference of the counters, which are linear (see
+    utils.Estimator.subtract): only a copy of the counters is kept from one check to the
+    next, and loaded into a snapshot of the estimator (see utils.Estimator.snapshot) to
+    compute the estimate. The estimates of these disjoint segments of the stream are
+    independent, so the standard error of the estimate of the whole stream is about their
+    standard deviation divided by the square root of their number. Their variance is the
+    median of the means of `groups` groups of their squared deviations, so that a few
+    outlying segments do not hide or fake the convergence. The segments share the bias of
+    their length, so the estimate should also have moved by less than `tolerance`
+    (relatively) since the previous check, which catches its drift as the bias vanishes.
+    The ingestion stops once both hold for `patience` checks in a row.
+    The segments start over when the hash state of the estimator changes (e.g. when the
+    heavy pairs of heavy_hitters.HybridL2Estimator are chosen).
+
+    Args:
+        estimator (utils.Estimator): the estimator to read the batches with, which should
+            return a single value.
+        batches (iterable): tuples of estimator.columns arrays, e.g. (xs, ys) pairs from
+            DataGenerator.iter_batches or a stream.StreamReader.
+        tolerance (float): relative standard error and change under which the estimate
+            is precise.
+        patience (int): number of consecutive precise checks before stopping.
+        check_every (int): number of items between two checks, i.e. in a segment.
+        min_items (int): number of items to read before stopping is allowed.
+        groups (int): number of groups of the median of means.
+
+    Returns:
+        A dict with the "estimate", the number of "items" read, whether the ingestion
+        "stopped_early", and the "history" of (items, estimate, standard error) at each
+        check.
+    """
+    verbose = estimator.verbose
+    estimator.set_verbose(False)
+    try:
+        history, segments, stable, next_check = [], [], 0, check_every
+        segment, previous = estimator.snapshot(), _copy_counters(estimator.counters())
+        for batch in batches:
+            estimator.read_batch(*batch)
+            if estimator.N < next_check:
+                continue
+            next_check = estimator.N + check_every
+            value = float(estimator.compute())
+            counters = _copy_counters(estimator.counters())
+            if estimator.is_compatible(segment):
+                segment._load_counters(counters)
+                segment._add_counters(previous, sign=-1)
+                segments.append(float(segment.compute()))
+            else:
+                segments, segment = [], estimator.snapshot()
+            previous = counters
+
+            error = np.inf
+            if len(segments) >= max(groups, 2):
+                deviations = (np.array(segments) - np.median(segments)) ** 2
+                error = np.sqrt(_median_of_means(deviations, groups) / len(segments))
+            moved = abs(value - history[-1][1]) if history else np.inf
+            if error <= tolerance * abs(value) and moved <= tolerance * abs(history[-1][1]):
+                stable += 1
+            else:
+                stable = 0
+            history.append((estimator.N, value, float(error)))
+            if stable >= patience and estimator.N >= min_items:
+                return {"estimate": value, "items": estimator.N, "stopped_early": True, "history": history}
+
+        value = float(estimator.compute())
+        return {"estimate": value, "items": estimator.N, "stopped_early": False, "history": history}
+    finally:
+        estimator.set_verbose(verbose)
@@ -0,0 +1,20 @@
+"""
+Named estimator settings, shared by the benchmark and the ingestion server.
+"""
+from mini_project.algorithms import counter_matrix, heavy_hitters, sketching_sketches
+from mini_project.algorithms.exact import SparseExactEstimator
+
+
+# Estimator settings: name -> (metric, function building the estimator from n and seed)
+ESTIMATORS = {
+    "counter_matrix.L2(A=10,B=10)": ("l2", lambda n, seed: counter_matrix.L2Estimator(10, 10, seed=seed)),
+    "heavy_hitters.HybridL2(A=4,B=10,heavy=64)":
+        ("l2", lambda n, seed: heavy_hitters.HybridL2Estimator(4, 10, heavy=64, seed=seed)),
+    "counter_matrix.L1(A=100,B=10)": ("l1", lambda n, seed: counter_matrix.L1Estimator(100, 10, n=n, seed=seed)),
+    "sketching_sketches.L2(A=4,B=100)": ("l2", lambda n, seed: sketching_sketches.L2Estimator(4, 100, n=n, seed=seed)),
+    "sketching_sketches.L2(A=4,B=100,precompute)":
+        ("l2", lambda n, seed: sketching_sketches.L2Estimator(4, 100, n=n, seed=seed, precompute=True)),
+    "sketching_sketches.L1(delta=0.01,s=100,hash)":
+        ("l1", lambda n, seed: sketching_sketches.L1Estimator(0.01, 100, n=n, seed=seed, cauchy="hash")),
+    "exact.SparseExact": ("l2", lambda n, seed: SparseExactEstimator(n, metric="l2")),
+}
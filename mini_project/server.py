@@ -0,0 +1,467 @@
+"""
+Ingestion service: estimators fed over a Unix or TCP socket and queried while they read.
+
+Clients send frames made of a 5-byte header, the frame type (1 byte) and the length of
+the payload in bytes (uint32, little-endian), followed by the payload:
+
+    b"B"  binary batch: the items as interleaved little-endian int64 (or float64 for
+          float estimators) values x_0 y_0 x_1 y_1 ..., with one value per column of
+          the estimators (e.g. k values per item for counter_matrix.AllPairsL2Estimator).
+    b"T"  text batch: lines "i j" as in the stream files, with one sample per column.
+    b"Q"  query (empty payload): the server answers with a b"R" frame whose payload is the
+          JSON {"N": ..., "results": {name: result}} of all the estimators, reflecting all
+          the batches the client sent before the query.
+    b"S"  server statistics (empty payload), answered with a b"R" frame of JSON.
+
+Malformed frames and failed queries are answered with a b"E" frame holding the error
+message, and the connection is closed. A batch that the estimators fail to read (e.g. with
+samples out of range) is dropped, and answered with a b"E" frame after which the server
+ignores the frames of the connection until the client closes it; the other connections
+go on.
+
+The batches of all the connections go through a bounded queue to a single consumer, which
+coalesces consecutive small batches of a connection into one read_batch call and runs the
+estimators in a worker thread, so the event loop keeps receiving while the estimators
+update. When the queue is full, the connections stop reading from their sockets, which
+pushes back on the clients. Queries go through the same queue: the consumer snapshots the
+counters of the estimators between two batches (see utils.Estimator.snapshot), and the
+snapshot is computed in a second worker thread while the ingestion goes on.
+
+Usage:
+
+    python -m mini_project.server serve --unix /tmp/sketch.sock --n 10000
+    python -m mini_project.server bench --unix /tmp/sketch.sock --n 10000 --N 10000000
+"""
+import argparse
+import asyncio
+import json
+import socket
+import struct
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from mini_project.engine import FanOut
+from mini_project.registry import ESTIMATORS
+from mini_project.stream import StreamReader
+import numpy as np
+
+HEADER = struct.Struct("<cI")
+
+# Maximum payload of a frame
+MAX_FRAME_BYTES = 1 << 28
+
+
+def _to_json(value):
+    """
+    Convert the numpy values in the results of compute() for JSON.
+    """
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"values of type {type(value).__name__} cannot be converted to JSON.")
+
+
+class _Connection:
+    """
+    A client connection, which stops being served once one of its batches failed.
+    """
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self.writer = writer
+        self.failed = False
+
+
+    def fail(self, error: Exception):
+        """
+        Send the error of a batch to the client, and stop sending anything else.
+        """
+        if self.failed:
+            return
+        self.failed = True
+        message = (str(error) or type(error).__name__).encode("utf-8")
+        self.writer.write(HEADER.pack(b"E", len(message)) + message)
+        if self.writer.can_write_eof():
+            self.writer.write_eof()
+
+
+class IngestionServer:
+    """
+    Serve estimators over a socket, see the module documentation for the protocol.
+
+    Args:
+        estimators (dict): estimators to feed the batches to, by name.
+        max_pending (int): maximum number of batches waiting for the estimators before
+            the connections stop reading.
+        coalesce (int): number of items up to which consecutive batches are combined into
+            one call to read_batch.
+    """
+    def __init__(self, estimators: dict, max_pending: int = 64, coalesce: int = 1 << 16) -> None:
+        self.engine = FanOut(estimators)
+        self.max_pending = max_pending
+        self.coalesce = coalesce
+        self.dtype = np.dtype("<i8") if self.engine.input_type is int else np.dtype("<f8")
+        self.columns = self.engine.columns
+
+        self.items = 0             # Number of items read by the estimators
+        self.batches = 0           # Number of batches received
+        self.updates = 0           # Number of calls to read_batch after coalescing
+        self.queries = 0           # Number of queries answered
+        self.errors = 0            # Number of updates that the estimators failed to read
+        self.connections = 0       # Number of open connections
+
+        self._queue = None
+        self._servers = []
+        self._consumer = None
+        self._queries = set()      # Queries being computed
+        self._executor = ThreadPoolExecutor(1)
+        self._query_executor = ThreadPoolExecutor(1)
+
+
+    async def start(self, path: str = None, host: str = None, port: int = None):
+        """
+        Start listening on a Unix socket at `path`, and/or on a TCP socket at `host` and
+        `port` (port 0 picks a free port, see self.port).
+        """
+        assert path is not None or port is not None, "either a path or a port should be given."
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._consumer = asyncio.create_task(self._consume())
+        if path is not None:
+            self._servers.append(await asyncio.start_unix_server(self._handle, path=path))
+        if port is not None:
+            server = await asyncio.start_server(self._handle, host=host or "127.0.0.1", port=port)
+            self.port = server.sockets[0].getsockname()[1]
+            self._servers.append(server)
+
+
+    async def close(self):
+        """
+        Stop listening, and wait until the estimators have read the pending batches and the
+        pending queries are answered.
+        """
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._servers = []
+        if self._consumer is not None and not self._consumer.done():
+            await self._queue.put(None)
+            await self._consumer
+        self._consumer = None
+        if self._queries:
+            await asyncio.wait(self._queries)
+        self._executor.shutdown()
+        self._query_executor.shutdown()
+
+
+    async def query(self) -> dict:
+        """
+        Compute the results of the estimators after the batches received so far.
+        """
+        if self._consumer is None or self._consumer.done():
+            raise RuntimeError("the server is not reading batches.")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(future)
+        return await future
+
+
+    def stats(self) -> dict:
+        return {"items": self.items, "batches": self.batches, "updates": self.updates,
+                "queries": self.queries, "errors": self.errors, "connections": self.connections,
+                "pending": self._queue.qsize() if self._queue is not None else 0}
+
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Read the frames of one connection.
+        """
+        self.connections += 1
+        connection = _Connection(writer)
+        parser = StreamReader("connection", columns=self.columns, dtype=self.dtype)
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(HEADER.size)
+                except asyncio.IncompleteReadError:
+                    break
+                kind, length = HEADER.unpack(header)
+                if length > MAX_FRAME_BYTES:
+                    raise ValueError(f"frames should be at most {MAX_FRAME_BYTES} bytes.")
+                payload = await reader.readexactly(length)
+                if connection.failed:
+                    # The error of a batch was sent, the rest is ignored
+                    continue
+
+                if kind == b"B":
+                    if length % (self.columns * self.dtype.itemsize) != 0:
+                        raise ValueError("binary batches should contain complete items.")
+                    items = np.frombuffer(payload, dtype=self.dtype).reshape(-1, self.columns)
+                    await self._queue.put((tuple(items.T), connection))
+                elif kind == b"T":
+                    await self._queue.put((tuple(parser._parse(payload).T), connection))
+                elif kind == b"Q":
+                    result = await self.query()
+                    if not connection.failed:
+                        await self._reply(writer, b"R", result)
+                elif kind == b"S":
+                    await self._reply(writer, b"R", self.stats())
+                else:
+                    raise ValueError(f"unknown frame type {kind!r}.")
+                if kind in (b"B", b"T"):
+                    self.batches += 1
+        except ConnectionError:
+            pass
+        except Exception as e:
+            if not connection.failed:
+                message = str(e).encode("utf-8")
+                writer.write(HEADER.pack(b"E", len(message)) + message)
+        finally:
+            self.connections -= 1
+            writer.close()
+
+
+    async def _reply(self, writer: asyncio.StreamWriter, kind: bytes, value):
+        payload = json.dumps(value, default=_to_json).encode("utf-8")
+        writer.write(HEADER.pack(kind, len(payload)) + payload)
+        await writer.drain()
+
+
+    async def _consume(self):
+        """
+        Feed the queued batches to the estimators and answer the queued queries, in order.
+        """
+        loop = asyncio.get_running_loop()
+        item, held = None, False
+        try:
+            while True:
+                if held is False:
+                    item = await self._queue.get()
+                else:
+                    item, held = held, False
+
+                # Coalesce the batches of a connection waiting in the queue, up to a query
+                batches, size = [], 0
+                while isinstance(item, tuple):
+                    batches.append(item[0])
+                    connection = item[1]
+                    size += len(item[0][0])
+                    if size >= self.coalesce or self._queue.empty():
+                        item = False
+                        break
+                    item = self._queue.get_nowait()
+                    if isinstance(item, tuple) and item[1] is not connection:
+                        held, item = item, False
+                        break
+                if batches:
+                    await self._read(batches, connection)
+
+                if item is None:
+                    # The end of the stream
+                    break
+                if isinstance(item, asyncio.Future):
+                    # Copy the counters after the batches read so far, and go on reading
+                    # while the copy is computed
+                    try:
+                        snapshot = await loop.run_in_executor(self._executor, self.engine.snapshot)
+                    except Exception as e:
+                        item.set_exception(e)
+                        continue
+                    task = asyncio.ensure_future(self._answer(item, snapshot, self.items))
+                    self._queries.add(task)
+                    task.add_done_callback(self._queries.discard)
+        except BaseException as e:
+            # Fail the queries waiting in the queue instead of leaving them hanging
+            error = e if isinstance(e, Exception) else RuntimeError("the server stopped reading batches.")
+            pending = [item, held]
+            while not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+            for future in pending:
+                if isinstance(future, asyncio.Future) and not future.done():
+                    future.set_exception(error)
+            raise
+
+
+    async def _read(self, batches: list, connection: _Connection):
+        """
+        Read coalesced batches of a connection with the estimators. If an estimator fails
+        to read them, they are dropped and the error is sent to the connection (the
+        estimators registered before the failing one have read them already).
+        """
+        columns = [np.concatenate(c) for c in zip(*batches)] if len(batches) > 1 else batches[0]
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self.engine.read_batch,
+                                                             *columns)
+        except Exception as e:
+            self.errors += 1
+            connection.fail(e)
+            return
+        self.items += len(columns[0])
+        self.updates += 1
+
+
+    async def _answer(self, future: asyncio.Future, snapshot: FanOut, items: int):
+        """
+        Answer a query with a copy of the estimators.
+        """
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self._query_executor,
+                                                                       snapshot.compute)
+            future.set_result({"N": items, "results": results})
+        except Exception as e:
+            future.set_exception(e)
+        self.queries += 1
+
+
+class Client:
+    """
+    Blocking client of the ingestion server.
+
+    Args:
+        path (str): path of the Unix socket, or None to connect with TCP.
+        host (str): host of the TCP socket.
+        port (int): port of the TCP socket.
+        input_type (class): int or float, the input type of the estimators.
+    """
+    def __init__(self, path: str = None, host: str = "127.0.0.1", port: int = None,
+                 input_type=int) -> None:
+        if path is not None:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(path)
+        else:
+            self.socket = socket.create_connection((host, port))
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.dtype = np.dtype("<i8") if input_type is int else np.dtype("<f8")
+
+
+    def send_batch(self, *columns):
+        """
+        Send a batch in binary, given as the samples of each column (e.g. xs and ys).
+        """
+        items = np.empty((len(columns[0]), len(columns)), dtype=self.dtype)
+        for c, samples in enumerate(columns):
+            items[:, c] = samples
+        self.socket.sendall(HEADER.pack(b"B", items.nbytes) + items.tobytes())
+
+
+    def send_text(self, text: str):
+        """
+        Send a batch as text lines "i j", with one sample per column.
+        """
+        payload = text.encode("utf-8")
+        self.socket.sendall(HEADER.pack(b"T", len(payload)) + payload)
+
+
+    def _request(self, kind: bytes) -> dict:
+        self.socket.sendall(HEADER.pack(kind, 0))
+        kind, length = HEADER.unpack(self._receive(HEADER.size))
+        payload = self._receive(length).decode("utf-8")
+        if kind == b"E":
+            raise ValueError(payload)
+        return json.loads(payload)
+
+
+    def _receive(self, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.socket.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("the server closed the connection.")
+            data += chunk
+        return bytes(data)
+
+
+    def query(self) -> dict:
+        """
+        Return the results of the estimators after all the batches sent so far.
+        """
+        return self._request(b"Q")
+
+
+    def stats(self) -> dict:
+        return self._request(b"S")
+
+
+    def close(self):
+        self.socket.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def run_client_benchmark(N: int, n: int, path: str = None, host: str = "127.0.0.1",
+                         port: int = None, batch_size: int = 1 << 14, text: bool = False,
+                         queries: int = 10, seed: int = 0) -> dict:
+    """
+    Send N random pairs in [1, n] to a server, querying it `queries` times along the way.
+
+    Returns:
+        A dict of the throughput and the latency of the queries.
+    """
+    rng = np.random.default_rng(seed)
+    xs, ys = rng.integers(1, n + 1, size=(2, batch_size))
+    if text:
+        lines = "".join(f"{i} {j}\n" for i, j in zip(xs.tolist(), ys.tolist()))
+    query_every = max(1, N // batch_size // max(queries, 1))
+
+    latencies = []
+    with Client(path=path, host=host, port=port) as client:
+        start = time.perf_counter()
+        for k, sent in enumerate(range(0, N, batch_size)):
+            size = min(batch_size, N - sent)
+            if text:
+                client.send_text(lines if size == batch_size else "".join(lines.splitlines(True)[:size]))
+            else:
+                client.send_batch(xs[:size], ys[:size])
+            if queries and (k + 1) % query_every == 0:
+                query_start = time.perf_counter()
+                client.query()
+                latencies.append(time.perf_counter() - query_start)
+        result = client.query()
+        seconds = time.perf_counter() - start
+
+    return {"items": N, "seconds": seconds, "items_per_sec": N / seconds,
+            "query_seconds_median": float(np.median(latencies)) if latencies else None,
+            "query_seconds_max": float(np.max(latencies)) if latencies else None,
+            "results": result["results"]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=["serve", "bench"])
+    parser.add_argument("--unix", help="path of the Unix socket")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, help="port of the TCP socket")
+    parser.add_argument("--n", type=int, default=1000, help="range of the samples")
+    parser.add_argument("--estimators", nargs="*", default=["counter_matrix.L2(A=10,B=10)"],
+                        help="estimator settings to serve, among: " + ", ".join(ESTIMATORS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--N", type=int, default=1000000, help="number of pairs sent by bench")
+    parser.add_argument("--batch-size", type=int, default=1 << 14, help="pairs per batch sent by bench")
+    parser.add_argument("--text", action="store_true", help="send text batches instead of binary")
+    args = parser.parse_args(argv)
+    assert args.unix is not None or args.port is not None, "either --unix or --port should be given."
+
+    if args.command == "serve":
+        estimators = {name: ESTIMATORS[name][1](args.n, args.seed) for name in args.estimators}
+        server = IngestionServer(estimators)
+
+        async def serve():
+            await server.start(path=args.unix, host=args.host, port=args.port)
+            print(f"serving {', '.join(estimators)}", file=sys.stderr)
+            await asyncio.gather(*(s.serve_forever() for s in server._servers))
+        try:
+            asyncio.run(serve())
+        except KeyboardInterrupt:
+            pass
+    else:
+        result = run_client_benchmark(args.N, args.n, path=args.unix, host=args.host, port=args.port,
+                                      batch_size=args.batch_size, text=args.text, seed=args.seed)
+        json.dump(result, sys.stdout, indent=2, default=_to_json)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+import gzip
+import os
+import sys
+import time
+import warnings
+import numpy as np
+
+# Number of bytes read from the source at a time
+DEFAULT_CHUNK_SIZE = 1 << 24
+
+
+class StreamReader:
+    """
+    Read a stream of samples in large chunks and parse each chunk into numpy arrays at
+    once, instead of splitting every line in python. Only one chunk is held in memory at
+    a time, so memory usage is bounded no matter how large the stream is.
+
+    Iterating over the reader yields one tuple of arrays per chunk, one array per column,
+    e.g. (xs, ys) for a stream of pairs.
+
+    Args:
+        source (str or file object): a path to a text file (gzip-compressed if it ends
+            with ".gz"), "-" for the standard input, or a file object opened for reading.
+        columns (int): number of samples in each line.
+        dtype: dtype of the parsed samples, usually np.int64 or np.float64.
+        chunk_size (int): number of bytes read from the source at a time.
+        start (int): byte offset to start reading from. Only supported for uncompressed
+            files, and should be at the beginning of a line.
+        end (int): byte offset to stop reading at (exclusive), or None to read to the end.
+        rate (float): probability of keeping each line. The kept lines are chosen with
+            geometric skips, and the skipped lines are never parsed. The rate can be
+            changed between two chunks.
+        seed (int or np.random.Generator): seed of the sampling.
+    """
+    def __init__(self, source, columns: int = 2, dtype=np.int64,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, start: int = 0, end: int = None,
+                 rate: float = 1.0, seed=None) -> None:
+        self.source = source
+        self.columns = columns
+        self.dtype = dtype
+        self.chunk_size = chunk_size
+        self.start = start
+        self.end = end
+        self.rate = rate
+        self.rng = np.random.default_rng(seed)
+        self.skip = None            # Number of lines to skip before the next kept one
+
+        # Statistics of the reading
+        self.lines = 0              # Number of lines read, kept or not
+        self.items = 0              # Number of lines parsed
+        self.bytes = 0              # Number of bytes read
+        self.read_seconds = 0.0     # Time spent reading from the source
+        self.parse_seconds = 0.0    # Time spent parsing the chunks
+        self.position = start       # Byte offset right after the last line yielded
+
+
+    def _open(self):
+        """
+        Open the source.
+
+        Returns:
+            f (file object): the opened source.
+            close (bool): whether the file object should be closed by the reader.
+        """
+        if hasattr(self.source, "read"):
+            return self.source, False
+        if self.source == "-":
+            return sys.stdin.buffer, False
+        if str(self.source).endswith(".gz"):
+            return gzip.open(self.source, "rb"), True
+        return open(self.source, "rb"), True
+
+
+    def _parse(self, data):
+        """
+        Parse a chunk of complete lines into an array of shape (lines, columns).
+        """
+        start = time.perf_counter()
+        if len(data.strip()) == 0:
+            values = np.zeros(0, dtype=self.dtype)
+        else:
+            with warnings.catch_warnings():
+                # Older numpy versions only warn on malformed data
+                warnings.simplefilter("error", DeprecationWarning)
+                try:
+                    values = np.fromstring(data, dtype=self.dtype, sep=" ")
+                except (ValueError, DeprecationWarning) as e:
+                    raise ValueError(f"malformed data in stream {self.source}: {e}") from None
+        if not self._complete_lines(data, len(values)):
+            raise ValueError(f"each line of stream {self.source} should contain {self.columns} samples.")
+        self.parse_seconds += time.perf_counter() - start
+        return values.reshape(-1, self.columns)
+
+
+    def _complete_lines(self, data, samples: int) -> bool:
+        """
+        Check that each line of a chunk holds self.columns of its samples. fromstring does
+        not see the ends of lines, so a line with too few samples and a line with too many
+        would otherwise be paired up silently.
+        """
+        buffer = np.frombuffer(data.encode() if isinstance(data, str) else data, dtype=np.uint8)
+        separator = buffer <= ord(" ")
+        # Positions of the first byte of each sample, and of the end of each line
+        starts = np.flatnonzero(separator[:-1] > separator[1:]) + 1
+        if len(buffer) and not separator[0]:
+            starts = np.concatenate([[0], starts])
+        ends = np.flatnonzero(buffer == ord("\n"))
+        lines = len(ends) + (len(buffer) > 0 and buffer[-1] != ord("\n"))
+        return samples == len(starts) == lines * self.columns and \
+            np.array_equal(np.searchsorted(starts, ends), self.columns * np.arange(1, len(ends) + 1))
+
+
+    def _sample(self, data):
+        """
+        Keep the lines of a chunk chosen with geometric skips, without parsing them.
+        """
+        text = isinstance(data, str)
+        buffer = np.frombuffer(data.encode() if text else data, dtype=np.uint8)
+        ends = np.flatnonzero(buffer == ord("\n")) + 1
+        if len(buffer) and buffer[-1] != ord("\n"):
+            ends = np.append(ends, len(buffer))
+        self.lines += len(ends)
+        if self.rate >= 1:
+            return data
+
+        kept, self.skip = sample_positions(self.rng, self.rate, len(ends), self.skip)
+        starts = np.concatenate([[0], ends[:-1]])[kept]
+        lengths = ends[kept] - starts
+        # Indices of the bytes of the kept lines
+        index = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        data = buffer[index].tobytes()
+        return data.decode() if text else data
+
+
+    def __iter__(self):
+        f, close = self._open()
+        try:
+            if self.start:
+                f.seek(self.start)
+            remaining = float("inf") if self.end is None else self.end - self.start
+            rest = None
+            while True:
+                start = time.perf_counter()
+                chunk = f.read(int(min(self.chunk_size, remaining)))
+                remaining -= len(chunk)
+                self.read_seconds += time.perf_counter() - start
+                if rest is None:
+                    rest = chunk[:0]
+                if not chunk:
+                    break
+                self.bytes += len(chunk)
+
+                # Only parse complete lines, keep the rest for the next chunk
+                data = rest + chunk
+                end = data.rfind(b"\n" if isinstance(data, bytes) else "\n") + 1
+                rest = data[end:]
+                if end == 0:
+                    continue
+                block = self._parse(self._sample(data[:end]))
+                self.position = self.start + self.bytes - len(rest)
+                if len(block) > 0:
+                    self.items += len(block)
+                    yield tuple(np.ascontiguousarray(block.T))
+
+            if rest:
+                block = self._parse(self._sample(rest))
+                self.position = self.start + self.bytes
+                if len(block) > 0:
+                    self.items += len(block)
+                    yield tuple(np.ascontiguousarray(block.T))
+        finally:
+            if close:
+                f.close()
+
+
+    def stats(self) -> dict:
+        """
+        Report the throughput of reading and parsing the stream.
+
+        Returns:
+            A dict of the number of items and bytes read, the time spent, and the
+            throughput in items/sec and MB/sec of reading plus parsing.
+        """
+        seconds = self.read_seconds + self.parse_seconds
+        return {
+            "lines": self.lines,
+            "items": self.items,
+            "bytes": self.bytes,
+            "read_seconds": self.read_seconds,
+            "parse_seconds": self.parse_seconds,
+            "items_per_sec": self.items / seconds if seconds > 0 else float("inf"),
+            "mb_per_sec": self.bytes / seconds / 1e6 if seconds > 0 else float("inf"),
+        }
+
+
+def sample_positions(rng, rate: float, size: int, skip: int = None):
+    """
+    Choose the positions of a Bernoulli sample with the given rate among `size` items,
+    with geometric skip lengths, so that the cost is proportional to the number of
+    positions chosen rather than to `size`.
+
+    Args:
+        rng (np.random.Generator): the random number generator.
+        rate (float): probability of choosing each item, in (0, 1].
+        size (int): number of items.
+        skip (int): number of items to skip before the first chosen one, carried over
+            from the previous call, or None to draw it.
+
+    Returns:
+        positions (np.array): the chosen positions, increasing.
+        skip (int): number of items to skip after these, for the next call.
+    """
+    assert 0 < rate <= 1, "the rate should be in (0, 1]."
+    if skip is None:
+        skip = int(rng.geometric(rate)) - 1
+    positions, position = [], skip
+    while True:
+        # Enough skips for the rest of the items on average
+        steps = np.cumsum(rng.geometric(rate, size=int(max(size - position, 0) * rate * 1.1) + 16))
+        chosen = position + np.concatenate([[0], steps[:-1]])
+        inside = chosen < size
+        positions.append(chosen[inside])
+        if not inside.all():
+            return np.concatenate(positions), int(chosen[~inside][0]) - size
+        position += int(steps[-1])
+
+
+def split_file(path, parts: int):
+    """
+    Split an uncompressed file into byte ranges of roughly equal size, each starting at
+    the beginning of a line.
+
+    Args:
+        path (str): path to the file.
+        parts (int): number of ranges.
+
+    Returns:
+        A list of (start, end) byte offsets, covering the whole file.
+    """
+    size = os.path.getsize(path)
+    boundaries = [0]
+    with open(path, "rb") as f:
+        for k in range(1, parts):
+            offset = max(size * k // parts, boundaries[-1])
+            if offset == 0:
+                # Files of fewer bytes than parts
+                continue
+            if offset >= size:
+                break
+            # Move to the beginning of the line after the byte at offset - 1
+            f.seek(offset - 1)
+            f.readline()
+            boundaries.append(min(f.tell(), size))
+    boundaries.append(size)
+    return [(s, e) for s, e in zip(boundaries[:-1], boundaries[1:]) if e > s]
@@ -0,0 +1,37 @@
+"""
+Estimators shared by the tests, on samples in [1, 100]. Each builder takes the seed of the
+hash functions, so that estimators built with the same seed can be merged.
+"""
+from mini_project.algorithms import counter_matrix, sketching_sketches
+from mini_project.algorithms.exact import ExactEstimator, SparseExactEstimator
+from mini_project.algorithms.windowed import SlidingWindowEstimator
+import numpy as np
+
+BUILDERS = {
+    "counter_matrix.CounterMatrix": lambda seed=1: counter_matrix.CounterMatrix(10, seed=seed),
+    "counter_matrix.L2": lambda seed=1: counter_matrix.L2Estimator(10, 5, seed=seed),
+    "counter_matrix.L1": lambda seed=1: counter_matrix.L1Estimator(10, 5, n=100, seed=seed),
+    "counter_matrix.L2(incremental)": lambda seed=1: counter_matrix.L2Estimator(10, 5, seed=seed, incremental=True),
+    "counter_matrix.L1(uint8)": lambda seed=1: counter_matrix.L1Estimator(10, 5, n=100, seed=seed, dtype=np.uint8),
+    "counter_matrix.AllPairsL2": lambda seed=1: counter_matrix.AllPairsL2Estimator(2, 10, 5, seed=seed),
+    "counter_matrix.AllPairsL2(k=3)": lambda seed=1: counter_matrix.AllPairsL2Estimator(3, 10, 5, seed=seed),
+    "sketching_sketches.L2": lambda seed=1: sketching_sketches.L2Estimator(4, 10, n=100, seed=seed),
+    "sketching_sketches.L2(precompute)": lambda seed=1: sketching_sketches.L2Estimator(4, 10, n=100, seed=seed,
+                                                                                       precompute=True),
+    "sketching_sketches.L1": lambda seed=1: sketching_sketches.L1Estimator(0.01, 20, n=100, seed=seed),
+    "sketching_sketches.L1(hash)": lambda seed=1: sketching_sketches.L1Estimator(0.01, 20, n=100, seed=seed,
+                                                                                 cauchy="hash"),
+    "sketching_sketches.L1(hash,float32)": lambda seed=1: sketching_sketches.L1Estimator(
+        0.01, 20, n=100, seed=seed, cauchy="hash", dtype=np.float32),
+    "exact.Exact": lambda seed=1: ExactEstimator(100, metric=["l1", "l2"]),
+    "exact.SparseExact": lambda seed=1: SparseExactEstimator(100, metric=["l1", "l2"]),
+    "windowed.SlidingWindow": lambda seed=1: SlidingWindowEstimator(counter_matrix.L2Estimator(10, 5, seed=seed),
+                                                                    window=1000),
+}
+
+
+def builders(*names) -> list:
+    """
+    Return the builders of the given names, in the same order.
+    """
+    return [BUILDERS[name] for name in names]
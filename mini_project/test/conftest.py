@@ -0,0 +1,38 @@
+"""
+Fixtures shared by the tests. The stream "sample" read through check_error is generated
+once per session from a seeded generator, in temporary directories.
+"""
+from mini_project import utils, engine
+from mini_project.data import DiscreteSampleGenerator, generate_dataset
+import pytest
+
+
+def _patch_directories(monkeypatch, root):
+    """
+    Point the directories of the streams, ground truths and answers to root.
+    """
+    for module, names in [(utils, ["TEST_DATA_DIR", "GROUND_TRUTH_DIR", "ANSWER_DIR"]),
+                          (generate_dataset, ["ANSWER_DIR"]), (engine, ["ANSWER_DIR"])]:
+        for name in names:
+            monkeypatch.setattr(module, name, str(root / name.lower()))
+
+
+@pytest.fixture(scope="session")
+def sample_root(tmp_path_factory):
+    """
+    Generate the stream "sample": 100000 dependent samples in [1, 1000].
+    """
+    root = tmp_path_factory.mktemp("sample")
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        _patch_directories(monkeypatch, root)
+        DiscreteSampleGenerator(n=1000, N=100000, seed=0).write_file("sample")
+    return root
+
+
+@pytest.fixture
+def sample(sample_root, monkeypatch):
+    """
+    The name of the generated stream, readable by name during the test.
+    """
+    _patch_directories(monkeypatch, sample_root)
+    return "sample"
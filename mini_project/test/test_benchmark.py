@@ -0,0 +1,16 @@
+from mini_project.benchmark.bench import run, compare
+
+
+def test_benchmark():
+    """
+    The benchmark should report every case, and flag throughput regressions.
+    """
+    results = run(50, 2000, ["counter_matrix.L2(A=10,B=10)", "exact.SparseExact"],
+                  [(False, "random")], isolate=False)
+    assert len(results["results"]) == 2
+    for r in results["results"]:
+        assert r["items_per_sec"] > 0 and r["sketch_bytes"] > 0 and r["peak_rss_bytes"] > 0
+    assert compare(results, results) == []
+
+    faster = {"results": [dict(r, items_per_sec=2 * r["items_per_sec"]) for r in results["results"]]}
+    assert len(compare(results, faster, tolerance=0.1)) == 2
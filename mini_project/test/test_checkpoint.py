@@ -0,0 +1,92 @@
+import os
+import pytest
+from mini_project.checkpoint import save_checkpoint, load_checkpoint, read_with_checkpoints, resume_from_checkpoint
+from mini_project.algorithms import counter_matrix
+from mini_project.test.builders import builders
+import numpy as np
+
+
+BUILDERS = builders("counter_matrix.L2", "counter_matrix.L1", "sketching_sketches.L2(precompute)",
+                    "sketching_sketches.L1", "sketching_sketches.L1(hash,float32)", "exact.Exact",
+                    "exact.SparseExact", "windowed.SlidingWindow")
+
+
+def _write_stream(path, xs, ys):
+    with open(path, "w") as f:
+        f.write("".join(f"{i} {j}\n" for i, j in zip(xs, ys)))
+
+
+def test_save_load(tmp_path):
+    """
+    A loaded estimator should have the same state as the saved one, and continue reading
+    the stream in the same way.
+    """
+    rng = np.random.default_rng(0)
+    xs, ys = rng.integers(1, 101, size=(2, 4000))
+    path = os.path.join(tmp_path, "checkpoint")
+    for build in BUILDERS:
+        estimator = build()
+        estimator.read_batch(xs[:2000], ys[:2000])
+        save_checkpoint(estimator, path, offset=123)
+        for mmap in [True, False]:
+            loaded, offset = load_checkpoint(path, mmap=mmap)
+            assert type(loaded) == type(estimator) and offset == 123
+            assert loaded.is_compatible(estimator)
+            loaded.read_batch(xs[2000:], ys[2000:])
+            expected = build()
+            expected.read_batch(xs, ys)
+            for a, b in zip(loaded.counters(), expected.counters()):
+                assert np.allclose(a, b)
+            assert np.allclose(loaded.compute(), expected.compute())
+
+
+def test_resume(tmp_path):
+    """
+    Resuming from a checkpoint should give the same result as reading the whole stream.
+    """
+    rng = np.random.default_rng(0)
+    xs, ys = rng.integers(1, 101, size=(2, 5000))
+    stream = os.path.join(tmp_path, "stream.txt")
+    _write_stream(stream, xs, ys)
+    path = os.path.join(tmp_path, "checkpoint")
+
+    # Simulate a crash after the first checkpoint by reading only part of the file
+    partial = os.path.join(tmp_path, "partial.txt")
+    _write_stream(partial, xs[:3000], ys[:3000])
+    read_with_checkpoints(counter_matrix.L2Estimator(10, 5, seed=1), partial, path, every=1000, chunk_size=512)
+    _, offset = load_checkpoint(path)
+    assert offset == os.path.getsize(partial)
+
+    estimator = resume_from_checkpoint(path, stream)
+    expected = counter_matrix.L2Estimator(10, 5, seed=1)
+    expected.read_from_file(stream)
+    assert estimator.N == expected.N
+    for a, b in zip(estimator.counters(), expected.counters()):
+        assert np.array_equal(a, b)
+
+
+def test_resume_columns(tmp_path):
+    """
+    Streams with more than 2 columns should be read with checkpoints and resumed.
+    """
+    columns = np.random.default_rng(0).integers(1, 101, size=(3, 5000))
+    stream, partial = os.path.join(tmp_path, "stream.txt"), os.path.join(tmp_path, "partial.txt")
+    np.savetxt(stream, columns.T, fmt="%d")
+    np.savetxt(partial, columns[:, :3000].T, fmt="%d")
+    path = os.path.join(tmp_path, "checkpoint")
+
+    build, = builders("counter_matrix.AllPairsL2(k=3)")
+    read_with_checkpoints(build(), partial, path, every=1000, chunk_size=512)
+    estimator = resume_from_checkpoint(path, stream)
+    expected = build()
+    expected.read_from_file(stream)
+    assert estimator.N == expected.N
+    assert np.array_equal(estimator.C, expected.C)
+
+
+def test_invalid_checkpoint(tmp_path):
+    path = os.path.join(tmp_path, "checkpoint")
+    with open(path, "wb") as f:
+        f.write(b"not a checkpoint file")
+    with pytest.raises(ValueError):
+        load_checkpoint(path)
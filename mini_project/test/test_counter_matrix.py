@@ -1,7 +1,14 @@
-from mini_project.algorithms.counter_matrix import L2Estimator, L1Estimator
+import os
+import tempfile
+from mini_project.algorithms.counter_matrix import CounterMatrix, L2Estimator, L1Estimator, \
+    AllPairsL2Estimator, CounterTensor, ChiSquareEstimator
 from mini_project.utils import check_error
+import numpy as np
+import pytest
 
+# The stream generated by conftest.sample
 TEST_FILE = "sample"
+pytestmark = pytest.mark.usefixtures("sample")
 
 
 def test_l2_estimator():
@@ -19,6 +26,135 @@ def test_l1_estimator():
     print("multiplicative error:", error)
 
 
+def test_independence():
+    estimator = ChiSquareEstimator(100, 10, seed=0)
+    assert check_error(estimator, TEST_FILE, metric="independent") == 0
+
+
+def test_incremental():
+    """
+    The incrementally maintained statistics should give the same result as computing them
+    from the counter matrix, after reading items, batches, merging and resetting.
+    """
+    rng = np.random.default_rng(0)
+    xs = rng.integers(1, 101, size=5000)
+    ys = (xs + rng.integers(0, 10, size=5000)) % 100 + 1
+    for A in [2, 10]:
+        dense, incremental = CounterMatrix(A, seed=1), CounterMatrix(A, seed=1, incremental=True)
+        for estimator in [dense, incremental]:
+            estimator.read_batch(xs[:3000], ys[:3000])
+            for i, j in zip(xs[3000:3500].tolist(), ys[3000:3500].tolist()):
+                estimator._read_item(i, j)
+        assert np.isclose(incremental.compute(), dense.compute(), rtol=1e-9)
+
+        merged = incremental - CounterMatrix(A, seed=1, incremental=True) + dense
+        dense.merge(dense)
+        assert np.isclose(merged.compute(), dense.compute(), rtol=1e-9)
+        assert np.array_equal(merged.row, np.sum(dense.C, axis=1))
+
+        incremental.reset()
+        assert incremental.sum_squares == 0 and not incremental.cross.any()
+
+    # C @ col and the sums of squares exceed int64 from N = 3e9
+    counters = [6 * 10 ** 9, np.array([[4, 1], [1, 0]]) * 10 ** 9]
+    dense, incremental = CounterMatrix(2, seed=1), CounterMatrix(2, seed=1, incremental=True)
+    for estimator in [dense, incremental]:
+        estimator._load_counters(counters)
+    assert np.isclose(incremental.compute(), dense.compute(), rtol=1e-9)
+
+    dense, incremental = L2Estimator(10, 5, seed=1), L2Estimator(10, 5, seed=1, incremental=True)
+    for estimator in [dense, incremental]:
+        estimator.read_batch(xs[:4000], ys[:4000])
+        for i, j in zip(xs[4000:].tolist(), ys[4000:].tolist()):
+            estimator._read_item(i, j)
+    assert np.allclose(incremental.statistics(), dense.statistics(), rtol=1e-9)
+    merged = incremental + incremental
+    assert np.allclose(merged.statistics(), (dense + dense).statistics(), rtol=1e-9)
+    assert np.array_equal(merged.col, 2 * np.sum(dense.C, axis=1))
+    merged.reset()
+    assert not merged.sum_squares.any() and not merged.cross.any()
+
+
+def test_tensor():
+    """
+    The counter tensors should hold the same counter matrices as B counter matrices built
+    from the same seed, and promote the counters before they overflow.
+    """
+    rng = np.random.default_rng(0)
+    xs, ys = rng.integers(1, 101, size=(2, 5000))
+    for A, B, tensor in [(10, 5, L2Estimator(10, 5, seed=1, dtype=np.uint8)), (3, 4, L1Estimator(3, 4, n=100, seed=1))]:
+        rng = np.random.default_rng(1)
+        matrices = [CounterMatrix(A, seed=rng) for _ in range(B)]
+        for C in matrices:
+            C.read_batch(xs, ys)
+        tensor.read_batch(xs[:4000], ys[:4000])
+        for i, j in zip(xs[4000:].tolist(), ys[4000:].tolist()):
+            tensor._read_item(i, j)
+        assert np.array_equal(np.stack([C.C for C in matrices]), tensor.C)
+        assert np.allclose([C.compute() for C in matrices], tensor.statistics())
+
+    # 5000 items in 3 * 3 cells overflow uint8, but not uint16
+    assert tensor.C.dtype == np.uint16
+    assert (tensor - tensor).C.dtype == np.uint16
+    assert (L1Estimator(3, 4, n=100, seed=1) - tensor).C.min() < 0
+
+
+def test_all_pairs():
+    """
+    The all-pairs estimator should hold, for each pair of columns, the counter matrices of
+    a CounterTensor with the hash functions of the two columns, whether the items are read
+    one by one, in batches or from a file with k columns.
+    """
+    rng = np.random.default_rng(0)
+    columns = rng.integers(1, 101, size=(4, 5000))
+    columns[2] = (columns[0] + rng.integers(0, 5, size=5000)) % 100 + 1
+    estimator = AllPairsL2Estimator(4, 10, 5, seed=1, dtype=np.uint8)
+    estimator.read_batch(*columns[:, :4000])
+    for values in columns[:, 4000:].T.tolist():
+        estimator._read_item(*values)
+
+    for q, (c, d) in enumerate(estimator.pairs):
+        tensor = CounterTensor(10, 5)
+        tensor.param_x, tensor.param_y = estimator.param[c], estimator.param[d]
+        tensor.read_batch(columns[c], columns[d])
+        assert np.array_equal(tensor.C, estimator.C[q * 5:(q + 1) * 5])
+
+    result = estimator.compute()
+    assert result.shape == (4, 4) and np.allclose(result, result.T, equal_nan=True)
+    assert np.isnan(np.diag(result)).all()
+    assert np.nanargmax(result) in [2, 8]
+
+    path = os.path.join(tempfile.mkdtemp(), "columns.txt")
+    np.savetxt(path, columns.T, fmt="%d")
+    from_file = AllPairsL2Estimator(4, 10, 5, seed=1)
+    from_file.read_from_file(path)
+    assert np.array_equal(from_file.C, estimator.C)
+
+
+def test_chi_square():
+    """
+    The test should reject independence at the given level on independent streams, and
+    detect a strong dependence.
+    """
+    rng = np.random.default_rng(0)
+    rejected = 0
+    for seed in range(100):
+        xs, ys = rng.integers(1, 101, size=(2, 2000))
+        estimator = ChiSquareEstimator(5, 5, seed=seed)
+        estimator.read_batch(xs, ys)
+        assert estimator.p_values().shape == (5,)
+        rejected += not estimator.compute()
+    assert rejected <= 10
+
+    ys = xs.copy()
+    for aggregate in ["bonferroni", "median"]:
+        estimator = ChiSquareEstimator(5, 5, metric="chisq", aggregate=aggregate, seed=0)
+        estimator.read_batch(xs, ys)
+        assert estimator.compute() < 1e-6
+    estimator.metric = "independent"
+    assert not estimator.compute()
+
+
 if __name__ == "__main__":
     #test_l1_estimator()
     test_l2_estimator()
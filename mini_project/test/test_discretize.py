@@ -0,0 +1,56 @@
+import copy
+import os
+import tempfile
+from mini_project.algorithms.discretize import DiscretizedEstimator
+from mini_project.algorithms import counter_matrix
+from mini_project.algorithms.exact import SparseExactEstimator
+import numpy as np
+
+
+def test_discretized():
+    """
+    The edges should be the quantiles of the warmup items, the warmup items should be read
+    with the others, and the result should be that of the discretized stream, from
+    batches, items, files with real values and merged estimators.
+    """
+    rng = np.random.default_rng(0)
+    xs = rng.normal(size=20000)
+    ys = xs + rng.normal(size=20000)
+    estimator = DiscretizedEstimator(SparseExactEstimator(10, metric="l2"), bins=10, warmup=5000)
+    estimator.read_batch(xs[:3000], ys[:3000])
+    assert estimator.edges is None and estimator.estimator.N == 0
+    warm = copy.deepcopy(estimator)
+    warm._learn_edges()
+    assert np.isclose(estimator.compute(), warm.compute())
+    assert estimator.edges is None and estimator.estimator.N == 0
+    estimator.read_batch(xs[3000:], ys[3000:])
+    assert estimator.estimator.N == estimator.N == 20000
+    assert np.allclose(estimator.edges[0], np.quantile(xs, np.linspace(0, 1, 11)[1:-1]), atol=0.05)
+
+    expected = SparseExactEstimator(10, metric="l2")
+    expected.read_batch(*estimator.discretize(xs, ys))
+    assert np.isclose(estimator.compute(), expected.compute())
+    assert min(b.min() for b in estimator.discretize(xs, ys)) == 1
+    assert max(b.max() for b in estimator.discretize(xs, ys)) == 10
+
+    # Independent columns give a much smaller difference
+    independent = DiscretizedEstimator(SparseExactEstimator(10, metric="l2"), bins=10, warmup=5000)
+    independent.read_batch(xs, rng.normal(size=20000))
+    assert independent.compute()[0] < estimator.compute()[0] / 5
+
+    path = os.path.join(tempfile.mkdtemp(), "real.txt")
+    np.savetxt(path, np.stack([xs, ys], axis=1))
+    first = DiscretizedEstimator(counter_matrix.L2Estimator(5, 5, seed=1), bins=10, edges=estimator.edges)
+    second, items = copy.deepcopy(first), copy.deepcopy(first)
+    first.read_from_file(path)
+    second.read_batch(xs[:10000], ys[:10000])
+    for i, j in zip(xs[10000:].tolist(), ys[10000:].tolist()):
+        items._read_item(i, j)
+    merged = second + items
+    assert merged.N == first.N == 20000
+    assert np.isclose(merged.compute(), first.compute())
+    assert not DiscretizedEstimator(counter_matrix.L2Estimator(5, 5, seed=1), bins=10).is_compatible(first)
+
+    # Only the estimators with fixed edges can read parts of a stream in parallel
+    assert estimator._learns_hash_state() is False and warm._learns_hash_state() is False
+    assert DiscretizedEstimator(counter_matrix.L2Estimator(5, 5), bins=10)._learns_hash_state()
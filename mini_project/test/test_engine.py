@@ -0,0 +1,79 @@
+import os
+import tempfile
+from mini_project.test.builders import BUILDERS
+from mini_project.engine import FanOut
+from mini_project.algorithms import sketching_sketches
+import numpy as np
+
+
+NAMES = ["counter_matrix.L2", "counter_matrix.L1", "sketching_sketches.L2", "sketching_sketches.L1",
+         "exact.Exact", "windowed.SlidingWindow"]
+
+
+def test_fan_out():
+    """
+    Reading a file once with the engine should give the same results as reading it with
+    each estimator separately.
+    """
+    rng = np.random.default_rng(0)
+    xs, ys = rng.integers(1, 101, size=(2, 2000))
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+        f.write("".join(f"{i} {j}\n" for i, j in zip(xs.tolist(), ys.tolist())))
+    try:
+        engine = FanOut({name: BUILDERS[name]() for name in NAMES})
+        engine.read_from_file(f.name, chunk_size=4096)
+        results = engine.compute()
+    finally:
+        os.remove(f.name)
+
+    for name in NAMES:
+        estimator = BUILDERS[name]()
+        estimator.read_batch(xs, ys)
+        assert np.allclose(results[name], estimator.compute()), name
+
+
+def test_shared_hashes():
+    """
+    Counter matrices with the same hash functions should evaluate them once per batch.
+    """
+    rng = np.random.default_rng(0)
+    xs, ys = rng.integers(1, 101, size=(2, 1000))
+    engine = FanOut({name: BUILDERS[name]() for name in ["counter_matrix.L2", "counter_matrix.L1"]})
+    stats = engine.estimators["counter_matrix.L2"].enable_stats()
+    engine.estimators["counter_matrix.L1"].enable_stats(stats)
+    engine.read_batch(xs, ys)
+
+    # The 5 matrices of L2 are those of L1
+    assert stats.counts["hash_evaluations"] == 2 * 5 * 1000
+    for name, estimator in engine.estimators.items():
+        expected = BUILDERS[name]()
+        expected.read_batch(xs, ys)
+        assert all(np.array_equal(a, b) for a, b in zip(estimator.counters(), expected.counters()))
+
+
+def test_shared_signs():
+    """
+    Sign sketches with the same hash functions should evaluate them once per batch, with
+    or without the precomputed tables.
+    """
+    rng = np.random.default_rng(0)
+    xs, ys = rng.integers(1, 101, size=(2, 1000))
+    engine = FanOut({"table": sketching_sketches.L2Estimator(4, 10, n=100, seed=1, precompute=True),
+                     "first": sketching_sketches.L2Estimator(4, 10, n=100, seed=1),
+                     "second": sketching_sketches.L2Estimator(4, 10, n=100, seed=1)})
+    stats = engine.estimators["first"].enable_stats()
+    engine.estimators["second"].enable_stats(stats)
+    engine.read_batch(xs, ys)
+
+    # The signs are looked up in the tables, then reused by the other two
+    assert stats.counts.get("hash_evaluations", 0) == 0
+    expected = sketching_sketches.L2Estimator(4, 10, n=100, seed=1)
+    expected.read_batch(xs, ys)
+    for name, estimator in engine.estimators.items():
+        assert all(np.array_equal(a, b) for a, b in zip(estimator.counters(), expected.counters())), name
+
+    engine = FanOut({name: sketching_sketches.L2Estimator(4, 10, n=100, seed=1) for name in ["first", "second"]})
+    stats = engine.estimators["first"].enable_stats()
+    engine.estimators["second"].enable_stats(stats)
+    engine.read_batch(xs, ys)
+    assert stats.counts["hash_evaluations"] == 2 * 4 * 10 * 1000
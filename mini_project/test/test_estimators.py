@@ -0,0 +1,61 @@
+import copy
+from mini_project.test.builders import BUILDERS
+import numpy as np
+import pytest
+
+
+def _columns(estimator, size: int = 5000):
+    rng = np.random.default_rng(0)
+    return rng.integers(1, 101, size=(estimator.columns, size))
+
+
+def _assert_close(a, b):
+    # Subtracting float32 accumulators loses the precision of their largest values
+    tolerance = 1e-3 if np.asarray(a).dtype == np.float32 else 1e-8
+    assert np.allclose(a, b, rtol=tolerance, atol=tolerance * np.abs(b).max(initial=0))
+
+
+@pytest.mark.parametrize("name", BUILDERS)
+def test_read_batch(name):
+    """
+    Reading batches should give the same counters as reading the items one by one.
+    """
+    estimator = BUILDERS[name]()
+    columns = _columns(estimator)
+    batched = copy.deepcopy(estimator)
+    for values in columns.T.tolist():
+        estimator._read_item(*values)
+    batched.read_batch(*columns[:, :3000])
+    batched.read_batch(*columns[:, 3000:])
+    assert batched.N == estimator.N
+    for a, b in zip(batched.counters(), estimator.counters()):
+        _assert_close(a, b)
+
+
+# A window only keeps the latest items, so two windows do not add up to the window of the
+# whole stream (see test_windowed)
+@pytest.mark.parametrize("name", [name for name in BUILDERS if not name.startswith("windowed.")])
+def test_merge(name):
+    """
+    Merging sketches of two halves of a stream should give the sketch of the whole
+    stream, and subtracting should give back the sketch of the other half.
+    """
+    build = BUILDERS[name]
+    whole, first, second = build(seed=1), build(seed=1), build(seed=1)
+    columns = _columns(whole)
+    whole.read_batch(*columns)
+    first.read_batch(*columns[:, :2000])
+    second.read_batch(*columns[:, 2000:])
+
+    merged = first + second
+    assert merged.N == whole.N
+    for a, b in zip(merged.counters(), whole.counters()):
+        _assert_close(a, b)
+    for a, b in zip((merged - second).counters(), first.counters()):
+        _assert_close(a, b)
+
+    if not name.startswith("exact."):
+        # The exact estimators have no hash functions
+        assert not whole.is_compatible(build(seed=2))
+    whole.reset()
+    assert whole.N == 0 and whole.is_compatible(first)
@@ -0,0 +1,67 @@
+from mini_project.algorithms.exact import ExactEstimator, SparseExactEstimator
+from mini_project.data import DiscreteSampleGenerator
+from scipy.stats import chi2
+import numpy as np
+
+
+def test_is_compatible():
+    """
+    Tables of different ranges should not be merged.
+    """
+    assert not ExactEstimator(100).is_compatible(ExactEstimator(50))
+
+
+def test_sparse_exact_estimator():
+    """
+    The sparse estimator should give the same metrics as the dense one.
+    """
+    metrics = ["l1", "l2", "chisq", "independent"]
+    for independent in [True, False]:
+        generator = DiscreteSampleGenerator(n=30, N=1, independent=independent, seed=0)
+        xs, ys = generator._generate_batch(3000)
+        dense, sparse = ExactEstimator(30, metric=metrics), SparseExactEstimator(30, metric=metrics)
+        dense.read_batch(xs, ys)
+        sparse.read_batch(xs[:1000], ys[:1000])
+        for i, j in zip(xs[1000:1100].tolist(), ys[1000:1100].tolist()):
+            sparse._read_item(i, j)
+        sparse.read_batch(xs[1100:], ys[1100:])
+        assert np.allclose(sparse.compute(), dense.compute())
+        assert len(sparse.counters()[3]) == np.count_nonzero(dense.C)
+
+        # Merge and subtract
+        first, second = SparseExactEstimator(30, metric=metrics), SparseExactEstimator(30, metric=metrics)
+        first.read_batch(xs[:1000], ys[:1000])
+        second.read_batch(xs[1000:], ys[1000:])
+        assert np.allclose((first + second).compute(), dense.compute())
+        for a, b in zip((sparse - second).counters(), first.counters()):
+            assert np.array_equal(a, b)
+
+
+def test_unseen_values():
+    """
+    The degrees of freedom of the chi-square test should only count the values seen, so
+    that a dependence on a few values of a large range is detected.
+    """
+    rng = np.random.default_rng(0)
+    xs = rng.integers(1, 6, size=1000)
+    for estimator in [ExactEstimator(100, metric=["chisq", "independent"]),
+                      SparseExactEstimator(100, metric=["chisq", "independent"])]:
+        estimator.read_batch(xs, xs)
+        p_value, independent = estimator.compute()
+        assert p_value < 1e-6 and not independent
+    estimator = ExactEstimator(100, metric="independent")
+    estimator.read_batch(xs, np.ones_like(xs))
+    assert estimator.compute() == [True]
+
+
+def test_degrees_of_freedom():
+    """
+    The degrees of freedom should be (rows seen - 1) * (columns seen - 1), not (n - 1)^2.
+    """
+    rng = np.random.default_rng(1)
+    xs, ys = rng.integers(1, 6, size=(2, 1000))
+    for estimator in [ExactEstimator(100, metric="chisq"), SparseExactEstimator(100, metric="chisq")]:
+        estimator.read_batch(xs, ys)
+        statistics = estimator._statistics()
+        assert statistics["dof"] == 4 * 4
+        assert np.isclose(estimator.compute()[0], chi2.sf(statistics["chisq"], 16))
@@ -0,0 +1,103 @@
+import os
+import pickle
+from mini_project.data import DiscreteSampleGenerator, LowRankSampleGenerator, BandedSampleGenerator, \
+    PlantedSampleGenerator
+from mini_project.data.structured import alias_table
+from mini_project.algorithms.exact import ExactEstimator
+from mini_project.utils import TEST_DATA_DIR, GROUND_TRUTH_DIR, ANSWER_DIR
+import numpy as np
+
+
+def test_generate_batch():
+    """
+    The empirical distribution of the samples should match the probability table, and
+    sampling should not modify the table.
+    """
+    for independent in [True, False]:
+        for distribution in ["random", "zipfian"]:
+            generator = DiscreteSampleGenerator(n=20, N=1, independent=independent,
+                                                distribution=distribution, seed=0)
+            prob_table = generator.prob_table.copy()
+            xs, ys = generator._generate_batch(200000)
+            assert xs.min() >= 1 and xs.max() <= 20 and ys.min() >= 1 and ys.max() <= 20
+
+            empirical = np.zeros((20, 20))
+            np.add.at(empirical, (xs - 1, ys - 1), 1 / len(xs))
+            assert np.abs(empirical - prob_table).max() < 0.005
+            assert np.array_equal(generator.prob_table, prob_table)
+
+
+def test_seed():
+    """
+    Generators with the same seed should generate the same stream.
+    """
+    samples = []
+    for _ in range(2):
+        generator = DiscreteSampleGenerator(n=50, N=1, seed=42)
+        samples.append(generator._generate_batch(1000))
+    assert np.array_equal(samples[0][0], samples[1][0])
+    assert np.array_equal(samples[0][1], samples[1][1])
+
+
+def test_write_file():
+    """
+    The answer computed while generating should match the answer computed from the file,
+    and writing only the answer should give the same answer without the stream.
+    """
+    name = "test-write-file"
+    paths = [os.path.join(TEST_DATA_DIR, name + ".txt"), os.path.join(GROUND_TRUTH_DIR, name + ".pickle"),
+             os.path.join(ANSWER_DIR, name + ".pickle")]
+    try:
+        DiscreteSampleGenerator(n=30, N=5000, seed=0).write_file(name)
+        with open(paths[2], "rb") as p:
+            answer = pickle.load(p)
+        estimator = ExactEstimator(30, metric=["l1", "l2", "independent"])
+        estimator.read_from_file(name)
+        assert np.allclose([answer["l1"], answer["l2"]], estimator.compute()[:2])
+        assert answer["independent"] == estimator.compute()[2]
+
+        os.remove(paths[0])
+        DiscreteSampleGenerator(n=30, N=5000, seed=0).write_file(name, stream=False)
+        assert not os.path.exists(paths[0])
+        with open(paths[2], "rb") as p:
+            assert pickle.load(p) == answer
+    finally:
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def test_alias_table():
+    """
+    The alias table should give each value its probability.
+    """
+    rng = np.random.default_rng(0)
+    for p in [rng.random(50), 1 / np.arange(1, 1001), np.r_[100.0, np.ones(999)]]:
+        prob, alias = alias_table(p)
+        drawn = prob.copy()
+        np.add.at(drawn, alias, 1 - prob)
+        assert np.allclose(drawn / len(p), p / np.sum(p))
+
+
+def test_structured():
+    """
+    The ground truth computed from the structure should match the l1 and l2 difference of
+    a long stream, and large ranges should not need an n * n table.
+    """
+    for distribution in ["random", "zipfian"]:
+        for generator in [LowRankSampleGenerator(n=12, k=3, distribution=distribution, seed=0),
+                          BandedSampleGenerator(n=12, bandwidth=2, distribution=distribution, seed=0),
+                          PlantedSampleGenerator(n=12, m=4, rho=0.8, distribution=distribution, seed=0)]:
+            xs, ys = generator._generate_batch(1000000)
+            assert xs.min() >= 1 and xs.max() <= 12 and ys.min() >= 1 and ys.max() <= 12
+            estimator = ExactEstimator(12, metric=["l1", "l2"])
+            estimator.read_batch(xs, ys)
+            l1, l2 = estimator.compute()
+            assert np.isclose(l1, generator.ground_truth["l1"], rtol=0.05)
+            assert np.isclose(l2, generator.ground_truth["l2"], rtol=0.05)
+
+    assert LowRankSampleGenerator(n=12, k=1, seed=0).ground_truth["l1"] < 1e-12
+    assert BandedSampleGenerator(n=12, rho=0, seed=0).ground_truth["independent"]
+    generator = PlantedSampleGenerator(n=10 ** 6, m=1000, rho=1.0, seed=0)
+    xs, ys = generator._generate_batch(100000)
+    assert xs.min() >= 1 and xs.max() <= 10 ** 6 and ys.min() >= 1 and ys.max() <= 10 ** 6
@@ -0,0 +1,97 @@
+import copy
+import os
+import pytest
+from mini_project.algorithms.heavy_hitters import HybridL2Estimator, misra_gries_update
+from mini_project.algorithms.counter_matrix import L2Estimator
+from mini_project.algorithms.exact import SparseExactEstimator
+from mini_project.data import DiscreteSampleGenerator
+from mini_project.parallel import read_file_parallel
+import numpy as np
+
+
+def test_misra_gries():
+    """
+    The summary should keep at most `capacity` keys, and underestimate each frequency by
+    at most N / (capacity + 1).
+    """
+    rng = np.random.default_rng(0)
+    stream = rng.zipf(1.5, size=20000) % 1000
+    keys, counts = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    for start in range(0, len(stream), 1000):
+        keys, counts = misra_gries_update(keys, counts, stream[start:start + 1000], 20)
+        assert len(keys) <= 20
+
+    exact = np.bincount(stream)
+    assert np.all(counts <= exact[keys])
+    assert np.all(counts >= exact[keys] - len(stream) / 21)
+    assert set(np.argsort(exact)[-5:]) <= set(keys.tolist())
+
+
+def test_hybrid():
+    """
+    The estimator should read the warmup items once the heavy pairs are chosen, give the
+    same counters for items and batches, merge estimators with the same heavy pairs, and
+    be much more accurate than the counter matrices on zipfian streams.
+    """
+    generator = DiscreteSampleGenerator(n=1000, N=100000, distribution="zipfian", seed=0)
+    xs, ys = generator._generate_batch(100000)
+    estimator = HybridL2Estimator(4, 5, heavy=64, warmup=5000, seed=1)
+    estimator.read_batch(xs[:3000], ys[:3000])
+    assert estimator.heavy_keys is None and not estimator.C.any()
+    warm = copy.deepcopy(estimator)
+    warm._finish_warmup()
+    assert estimator.compute() == warm.compute()
+    assert estimator.heavy_keys is None and len(estimator.buffer) == 1
+
+    # The pairs read before a reset are forgotten by the summary
+    estimator.reset()
+    assert estimator.N == 0 and not estimator.buffer and not len(estimator.summary_keys)
+    estimator.read_batch(xs[:3000], ys[:3000])
+    assert estimator.compute() == warm.compute()
+    estimator.read_batch(xs[3000:], ys[3000:])
+    assert len(estimator.heavy_keys) == 64 and not estimator.buffer
+
+    first = HybridL2Estimator(4, 5, heavy_pairs=np.stack([estimator.heavy_x, estimator.heavy_y], axis=1), seed=1)
+    second, items = copy.deepcopy(first), copy.deepcopy(first)
+    for i, j in zip(xs[:6000].tolist(), ys[:6000].tolist()):
+        items._read_item(i, j)
+    first.read_batch(xs[:6000], ys[:6000])
+    second.read_batch(xs[6000:], ys[6000:])
+    for a, b in zip(first.counters(), items.counters()):
+        assert np.array_equal(a, b)
+    for a, b in zip((first + second).counters(), estimator.counters()):
+        assert np.array_equal(a, b)
+
+    exact = SparseExactEstimator(1000, metric="l2")
+    exact.read_batch(xs, ys)
+    answer = exact.compute()[0]
+    errors = []
+    for seed in range(5):
+        for build in [lambda: HybridL2Estimator(4, 5, heavy=64, seed=seed), lambda: L2Estimator(4, 5, seed=seed)]:
+            other = build()
+            other.read_batch(xs, ys)
+            errors.append(abs(other.compute() / answer - 1))
+    assert max(errors[::2]) < 0.02
+    assert np.mean(errors[::2]) < np.mean(errors[1::2]) / 3
+
+    with pytest.raises(AssertionError):
+        estimator.read_batch([1, 2 ** 31], [1, 1])
+
+
+def test_hybrid_parallel(tmp_path):
+    """
+    Files should only be read in parallel once the heavy pairs are chosen, since each
+    process would choose its own.
+    """
+    xs, ys = np.random.default_rng(0).integers(1, 101, size=(2, 20000))
+    path = os.path.join(tmp_path, "data.txt")
+    np.savetxt(path, np.stack([xs, ys], axis=1), fmt="%d")
+    with pytest.raises(AssertionError):
+        read_file_parallel(HybridL2Estimator(4, 5, seed=1), path, workers=2)
+
+    pairs = np.stack([xs[:64], ys[:64]], axis=1)
+    sequential, parallel = [HybridL2Estimator(4, 5, heavy_pairs=pairs, seed=1) for _ in range(2)]
+    sequential.read_from_file(path)
+    read_file_parallel(parallel, path, workers=2, chunk_size=4096)
+    for a, b in zip(parallel.counters(), sequential.counters()):
+        assert np.array_equal(a, b)
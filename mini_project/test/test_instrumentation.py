@@ -0,0 +1,73 @@
+import os
+import tempfile
+from mini_project.algorithms import counter_matrix, sketching_sketches
+from mini_project.checkpoint import save_checkpoint, load_checkpoint
+import numpy as np
+
+
+def test_stats():
+    """
+    The stats should count the items, hash evaluations and compute calls, time each
+    phase, and call the export callbacks.
+    """
+    rng = np.random.default_rng(0)
+    xs, ys = rng.integers(1, 101, size=(2, 1000))
+    estimator = counter_matrix.L2Estimator(10, 5, seed=1)
+    stats = estimator.enable_stats()
+    snapshots = []
+    stats.add_callback(snapshots.append)
+
+    estimator.read_batch(xs, ys)
+    estimator.compute()
+    snapshot = estimator.stats_snapshot()
+    assert snapshot["counts"] == {"items": 1000, "hash_evaluations": 2 * 5 * 1000, "compute_calls": 1}
+    assert set(snapshot["seconds"]) == {"hash", "update", "compute"}
+    assert snapshot["memory_bytes"] == estimator.memory_bytes()
+    assert len(snapshots) == 2 and snapshots[-1]["counts"]["compute_calls"] == 1
+
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+        f.write("".join(f"{i} {j}\n" for i, j in zip(xs.tolist(), ys.tolist())))
+    try:
+        size = os.path.getsize(f.name)
+        estimator.read_from_file(f.name)
+    finally:
+        os.remove(f.name)
+    assert stats.counts["items"] == 2000
+    assert stats.counts["bytes_parsed"] == size
+    assert "parse" in stats.seconds
+
+    # Disabled stats should not change the results
+    other = counter_matrix.L2Estimator(10, 5, seed=1)
+    other.read_batch(xs, ys)
+    other.read_batch(xs, ys)
+    assert np.array_equal(estimator.counters()[1], other.counters()[1])
+    estimator.disable_stats()
+    estimator.read_batch(xs, ys)
+    assert stats.counts["items"] == 2000
+    assert "read_batch" not in vars(estimator)
+
+    # The sign sketches compute A * B values of X and of Y per item
+    estimator = sketching_sketches.L2Estimator(4, 10, n=100, seed=1)
+    stats = estimator.enable_stats()
+    estimator.read_batch(xs, ys)
+    for i, j in zip(xs[:10].tolist(), ys[:10].tolist()):
+        estimator._read_item(i, j)
+    assert stats.counts["hash_evaluations"] == 2 * 4 * 10 * 1010
+
+
+def test_stats_checkpoint():
+    """
+    Estimators with stats enabled should still be saved and copied.
+    """
+    estimator = sketching_sketches.L1Estimator(0.1, 5, n=100, seed=1, cauchy="hash")
+    estimator.enable_stats().add_callback(lambda snapshot: None)
+    estimator.read_batch([1, 2, 3], [4, 5, 6])
+    copy = estimator + estimator
+    assert copy.N == 6 and copy.stats is not estimator.stats
+    copy.read_batch([1], [2])
+    assert copy.stats.counts["items"] == 4 and estimator.stats.counts["items"] == 3
+
+    path = os.path.join(tempfile.mkdtemp(), "checkpoint.bin")
+    save_checkpoint(estimator, path)
+    loaded, _ = load_checkpoint(path)
+    assert loaded.stats is None and loaded.N == 3
@@ -0,0 +1,61 @@
+import os
+from mini_project.parallel import read_file_parallel
+from mini_project.stream import split_file
+from mini_project.test.builders import builders
+import numpy as np
+
+
+def test_split_file(tmp_path):
+    """
+    The byte ranges should cover the file and start at the beginning of lines.
+    """
+    path = os.path.join(tmp_path, "data.txt")
+    with open(path, "w") as f:
+        f.write("".join(f"{i} {i * 7 % 1000}\n" for i in range(1, 1000)))
+    with open(path, "rb") as f:
+        data = f.read()
+    ranges = split_file(path, 7)
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(data)
+    for (_, end), (start, _) in zip(ranges[:-1], ranges[1:]):
+        assert end == start and data[start - 1:start] == b"\n"
+
+    # Files of fewer bytes than ranges
+    with open(path, "w") as f:
+        f.write("1 2\n3 4\n")
+    assert split_file(path, 16) == [(0, 4), (4, 8)]
+
+
+def test_read_file_parallel(tmp_path):
+    """
+    Reading a file in parallel should give the same result as reading it sequentially.
+    """
+    rng = np.random.default_rng(0)
+    xs, ys = rng.integers(1, 101, size=(2, 20000))
+    path = os.path.join(tmp_path, "data.txt")
+    with open(path, "w") as f:
+        f.write("".join(f"{i} {j}\n" for i, j in zip(xs, ys)))
+
+    for build in builders("counter_matrix.L2", "counter_matrix.L1", "sketching_sketches.L2",
+                          "sketching_sketches.L1", "exact.Exact"):
+        sequential, parallel = build(), build()
+        sequential.read_from_file(path)
+        stats = read_file_parallel(parallel, path, workers=2, chunk_size=4096)
+        assert stats["items"] == parallel.N == sequential.N == len(xs)
+        for a, b in zip(parallel.counters(), sequential.counters()):
+            assert np.allclose(a, b)
+
+
+def test_read_file_parallel_columns(tmp_path):
+    """
+    Streams with more than 2 columns should be read in parallel as sequentially.
+    """
+    columns = np.random.default_rng(0).integers(1, 101, size=(3, 20000))
+    path = os.path.join(tmp_path, "data.txt")
+    np.savetxt(path, columns.T, fmt="%d")
+
+    build, = builders("counter_matrix.AllPairsL2(k=3)")
+    sequential, parallel = build(), build()
+    sequential.read_from_file(path)
+    stats = read_file_parallel(parallel, path, workers=2, chunk_size=4096)
+    assert stats["items"] == parallel.N == sequential.N == columns.shape[1]
+    assert np.array_equal(parallel.C, sequential.C)
@@ -0,0 +1,48 @@
+from mini_project.algorithms import counter_matrix
+from mini_project.data import DiscreteSampleGenerator
+from mini_project.pipeline import prefetch
+import numpy as np
+import pytest
+
+
+def test_read_batches():
+    """
+    Reading the batches of a generator, directly or prefetched in a thread or process,
+    should give the same result as reading the whole stream at once.
+    """
+    expected = counter_matrix.L2Estimator(10, 5, seed=1)
+    batches = list(DiscreteSampleGenerator(n=50, N=10000, seed=0).iter_batches(batch_size=3000))
+    assert [len(xs) for xs, _ in batches] == [3000, 3000, 3000, 1000]
+    expected.read_batch(np.concatenate([xs for xs, _ in batches]), np.concatenate([ys for _, ys in batches]))
+
+    for source in ["direct", "thread", "process"]:
+        generator = DiscreteSampleGenerator(n=50, N=10000, seed=0)
+        if source == "direct":
+            batches = generator.iter_batches(batch_size=3000)
+        else:
+            batches = prefetch(generator, depth=2, process=source == "process", batch_size=3000)
+        estimator = counter_matrix.L2Estimator(10, 5, seed=1)
+        stats = estimator.read_batches(batches)
+        assert stats["items"] == 10000
+        assert all(np.array_equal(a, b) for a, b in zip(estimator.counters(), expected.counters()))
+
+
+def test_prefetch_errors():
+    """
+    Errors of the producer should be raised in the consumer, and stopping early should
+    stop the producer.
+    """
+    def batches():
+        yield np.array([1]), np.array([1])
+        raise ValueError("broken producer")
+
+    consumed = []
+    with pytest.raises(ValueError):
+        for batch in prefetch(batches()):
+            consumed.append(batch)
+    assert len(consumed) == 1
+
+    generator = DiscreteSampleGenerator(n=50, N=10 ** 9, seed=0)
+    for k, _ in enumerate(prefetch(generator, depth=1)):
+        if k == 3:
+            break
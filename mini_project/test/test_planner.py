@@ -0,0 +1,40 @@
+from mini_project import planner
+from mini_project.data import DiscreteSampleGenerator
+import numpy as np
+
+
+def test_plan():
+    """
+    The plans should meet the target error, predict the memory of the estimators they
+    build, and fit in the budget, or be flagged.
+    """
+    for plan in planner.plan(0.5, 0.1, n=100):
+        assert plan["meets_target"] and plan["epsilon"] <= 0.5
+        assert planner.build(plan, n=100, seed=0).memory_bytes() == plan["memory_bytes"]
+
+    plans = planner.plan(0.1, 0.01, n=1000, budget=100000)
+    assert all(plan["fits_budget"] and plan["memory_bytes"] <= 100000 for plan in plans)
+    assert any(not plan["meets_target"] for plan in plans)
+
+    plans = planner.plan(0.1, 0.01, n=1000, budget=2000)
+    assert len(plans) == len(planner.FAMILIES)
+    assert any(not plan["fits_budget"] and plan["memory_bytes"] > 2000 for plan in plans)
+    assert all(plan["memory_bytes"] <= 2000 for plan in plans if plan["fits_budget"])
+
+    model = planner.calibrate(families=["counter_matrix.L2"], items=1000)
+    assert all(cost >= 0 for cost in model["counter_matrix.L2"])
+
+
+def test_read_until_stable(capsys):
+    """
+    The ingestion should stop once the estimate is precise and stable, without printing.
+    """
+    generator = DiscreteSampleGenerator(n=50, N=10 ** 7, seed=0)
+    estimator = planner.build(planner.plan(0.5, 0.1, n=50, families=["counter_matrix.L2"])[0], n=50, seed=0)
+    result = planner.read_until_stable(estimator, generator.iter_batches(batch_size=10000),
+                                       tolerance=0.02, patience=3, check_every=20000)
+    assert result["stopped_early"] and result["items"] < 10 ** 6
+    assert len(result["history"]) >= 4
+    assert np.isclose(result["estimate"], result["history"][-1][1])
+    assert result["history"][-1][2] <= 0.02 * result["estimate"]
+    assert capsys.readouterr().out == "" and estimator.verbose
@@ -0,0 +1,75 @@
+import os
+import tempfile
+from mini_project.algorithms.sampled import SampledEstimator
+from mini_project.algorithms import counter_matrix
+from mini_project.algorithms.exact import ExactEstimator
+from mini_project.stream import StreamReader
+from mini_project.data import DiscreteSampleGenerator
+import numpy as np
+
+
+def test_sampled_reader():
+    """
+    The reader should only parse the sampled lines, in order, and count all the lines.
+    """
+    rng = np.random.default_rng(0)
+    xs = np.arange(20000)
+    path = os.path.join(tempfile.mkdtemp(), "stream.txt")
+    np.savetxt(path, np.stack([xs, rng.integers(1, 100, size=20000)], axis=1), fmt="%d")
+    for chunk_size in [1000, 1 << 20]:
+        reader = StreamReader(path, chunk_size=chunk_size, rate=0.1, seed=0)
+        kept = np.concatenate([batch[0] for batch in reader])
+        assert reader.lines == 20000 and reader.items == len(kept)
+        assert 1700 < len(kept) < 2300 and np.all(np.diff(kept) > 0)
+
+
+def test_sampled():
+    """
+    Sampling at rate 1 should give the result of the wrapped estimator, and a smaller
+    rate an estimate within a few times the reported standard deviation. The rate should
+    follow the target throughput.
+    """
+    generator = DiscreteSampleGenerator(n=50, N=100000, seed=0)
+    xs, ys = generator._generate_batch(100000)
+    exact = ExactEstimator(50)
+    exact.read_batch(xs, ys)
+
+    estimator = SampledEstimator(ExactEstimator(50), rate=1.0, groups=3, seed=0)
+    estimator.read_batch(xs[:50000], ys[:50000])
+    for i, j in zip(xs[50000:50100].tolist(), ys[50000:50100].tolist()):
+        estimator._read_item(i, j)
+    estimator.read_batch(xs[50100:], ys[50100:])
+    assert estimator.N == estimator.sampled == 100000
+    assert np.isclose(estimator.compute(), exact.compute())
+
+    path = os.path.join(tempfile.mkdtemp(), "stream.txt")
+    np.savetxt(path, np.stack([xs, ys], axis=1), fmt="%d")
+    estimator = SampledEstimator(ExactEstimator(50), rate=0.2, seed=0)
+    estimator.read_from_file(path, chunk_size=1 << 16)
+    assert estimator.N == 100000 and 19000 < estimator.sampled < 21000
+    error = estimator.sampling_error()
+    assert error["std"] > 0 and abs(estimator.compute()[0] - exact.compute()[0]) < 0.2 * exact.compute()[0]
+    assert not estimator._learns_hash_state()
+
+    # The rate goes down when the target cannot be met, and the counters are rescaled
+    estimator = SampledEstimator(counter_matrix.L2Estimator(10, 5, seed=1), target=1e12, groups=2, seed=0)
+    for start in range(0, 100000, 10000):
+        estimator.read_batch(xs[start:start + 10000], ys[start:start + 10000])
+    assert estimator.rate < 0.1 and estimator.N == 100000 and estimator._learns_hash_state()
+    assert np.isclose(sum(e.N for e in estimator.estimators) / estimator.rate, 100000, rtol=0.5)
+    estimator.reset()
+    assert estimator.rate == 1.0 and estimator.N == 0
+    assert all(e.C.dtype == np.uint16 and not e.C.any() and e.N == 0 for e in estimator.estimators)
+
+    # Items read one by one are only adapted once per window
+    estimator = SampledEstimator(counter_matrix.L2Estimator(10, 5, seed=1), target=1e12, groups=2,
+                                 adapt_items=1000, adapt_seconds=10, seed=0)
+    for i, j in zip(xs[:999].tolist(), ys[:999].tolist()):
+        estimator._read_item(i, j)
+    assert estimator.rate == 1.0 and estimator.window[0] == 999
+    for i, j in zip(xs[999:2500].tolist(), ys[999:2500].tolist()):
+        estimator._read_item(i, j)
+    assert estimator.rate < 1.0 and estimator.window[0] == 500
+    estimator = SampledEstimator(counter_matrix.L2Estimator(10, 5, seed=1), rate=0.5, target=1, seed=0)
+    estimator.read_batch(xs, ys)
+    assert estimator.rate == 1.0
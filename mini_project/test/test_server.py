@@ -0,0 +1,99 @@
+import asyncio
+import os
+import tempfile
+import threading
+from mini_project.algorithms import counter_matrix, sketching_sketches
+from mini_project.server import IngestionServer, Client
+import numpy as np
+import pytest
+
+
+def test_server():
+    """
+    Batches sent in binary and text over Unix and TCP sockets should be read by the
+    estimators, and queries should reflect all the batches sent before them.
+    """
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    path = os.path.join(tempfile.mkdtemp(), "server.sock")
+    server = IngestionServer({"l2": counter_matrix.L2Estimator(10, 5, seed=1)}, max_pending=2, coalesce=500)
+    asyncio.run_coroutine_threadsafe(server.start(path=path, port=0), loop).result()
+
+    rng = np.random.default_rng(0)
+    xs, ys = rng.integers(1, 101, size=(2, 3000))
+    expected = counter_matrix.L2Estimator(10, 5, seed=1)
+    try:
+        with Client(path=path) as client:
+            for k in range(0, 2000, 100):
+                client.send_batch(xs[k:k + 100], ys[k:k + 100])
+            result = client.query()
+            expected.read_batch(xs[:2000], ys[:2000])
+            assert result["N"] == 2000
+            assert np.isclose(result["results"]["l2"], expected.compute())
+
+        with Client(port=server.port) as client:
+            client.send_text("".join(f"{i} {j}\n" for i, j in zip(xs[2000:].tolist(), ys[2000:].tolist())))
+            result = client.query()
+            expected.read_batch(xs[2000:], ys[2000:])
+            assert result["N"] == 3000
+            assert np.isclose(result["results"]["l2"], expected.compute())
+            assert client.stats()["batches"] == 21
+
+            client.send_text("1 2 3\n")
+            with pytest.raises(ValueError):
+                client.query()
+    finally:
+        asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+    assert server.stats()["queries"] == 2
+    with pytest.raises(RuntimeError):
+        server._executor.submit(int)
+    with pytest.raises(RuntimeError):
+        server._query_executor.submit(int)
+
+
+def test_server_errors():
+    """
+    A batch that the estimators fail to read should be answered with an error, while the
+    other connections go on, and queries should not wait for a stopped consumer.
+    """
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    path = os.path.join(tempfile.mkdtemp(), "server.sock")
+    estimator = sketching_sketches.L2Estimator(4, 10, n=100, seed=1, precompute=True)
+    server = IngestionServer({"l2": estimator})
+    asyncio.run_coroutine_threadsafe(server.start(path=path), loop).result()
+
+    rng = np.random.default_rng(0)
+    xs, ys = rng.integers(1, 101, size=(2, 1000))
+    try:
+        with Client(path=path) as client, Client(path=path) as other:
+            client.send_batch(xs, ys)
+            other.send_batch([1, 1000], [1, 1])
+            with pytest.raises(ValueError, match="precomputed"):
+                other.query()
+            client.send_batch(xs, ys)
+            assert client.query()["N"] == 2000
+            assert client.stats()["errors"] == 1
+
+        # The snapshots of the queries share the sign tables
+        snapshot = server.engine.snapshot().estimators["l2"]
+        assert snapshot.sign_x is estimator.sign_x and snapshot.t_1 is not estimator.t_1
+        assert np.array_equal(snapshot.t_1, estimator.t_1)
+
+        async def stop_consumer():
+            future = asyncio.get_running_loop().create_future()
+            server._queue.put_nowait(future)
+            server._consumer.cancel()
+            with pytest.raises(RuntimeError):
+                await future
+            with pytest.raises(RuntimeError):
+                await server.query()
+        asyncio.run_coroutine_threadsafe(stop_consumer(), loop).result()
+    finally:
+        asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
@@ -1,7 +1,13 @@
-from mini_project.algorithms.sketching_sketches import L2Estimator, L1Estimator
+from mini_project.algorithms.sketching_sketches import L2Estimator, L1Estimator, sign_table_bytes, _hash_cauchy
+from mini_project.data import DiscreteSampleGenerator
 from mini_project.utils import check_error
+from scipy import stats
+import numpy as np
+import pytest
 
+# The stream generated by conftest.sample
 TEST_FILE = "sample"
+pytestmark = pytest.mark.usefixtures("sample")
 
 
 def test_l2_estimator():
@@ -22,6 +28,59 @@ def test_l1_estimator():
     print("multiplicative error:", error)
 
 
+def test_precomputed_signs():
+    """
+    The precomputed sign tables should give the same sketches as the hash functions.
+    """
+    rng = np.random.default_rng(0)
+    xs, ys = rng.integers(1, 1001, size=(2, 5000))
+    estimator = L2Estimator(6, 11, n=1000, seed=1)
+    estimator.read_batch(xs, ys)
+    precomputed = L2Estimator(6, 11, n=1000, seed=1, precompute=True)
+    assert precomputed.sign_x.nbytes + precomputed.sign_y.nbytes == sign_table_bytes(6, 11, 1000)
+    precomputed.read_batch(xs[:1000], ys[:1000])
+    for i, j in zip(xs[1000:].tolist(), ys[1000:].tolist()):
+        precomputed._read_item(i, j)
+    for a, b in zip(precomputed.counters(), estimator.counters()):
+        assert np.array_equal(a, b)
+
+
+def test_hash_cauchy():
+    """
+    The hashed Cauchy variables should follow the standard Cauchy distribution.
+    """
+    values = _hash_cauchy(12345, np.arange(100000))
+    assert stats.kstest(values, "cauchy").pvalue > 0.01
+    assert np.array_equal(values, _hash_cauchy(12345, np.arange(100000)))
+
+    estimator = L1Estimator(0.01, 50, n=100, seed=0, cauchy="hash")
+    x_i, y_j = estimator._get_values(np.arange(1, 101), np.arange(1, 101))
+    assert stats.kstest(x_i.ravel(), "cauchy").pvalue > 0.01
+    assert np.abs(y_j).max() <= estimator.T
+
+
+def test_hash_cauchy_accuracy():
+    """
+    The estimates with hashed Cauchy variables should follow the same distribution as the
+    estimates with the table of Cauchy variables.
+    """
+    generator = DiscreteSampleGenerator(n=20, N=1, independent=False, seed=0)
+    xs, ys = generator._generate_batch(5000)
+    results = {}
+    for cauchy in ["table", "hash"]:
+        results[cauchy] = []
+        for seed in range(100):
+            estimator = L1Estimator(0.05, 50, n=20, seed=seed, cauchy=cauchy)
+            estimator.read_batch(xs, ys)
+            results[cauchy].append(estimator.compute())
+    assert stats.ks_2samp(results["table"], results["hash"]).pvalue > 0.01
+
+    estimator = L1Estimator(0.05, 50, n=20, seed=0, cauchy="hash", dtype=np.float32)
+    estimator.read_batch(xs, ys)
+    assert estimator.t_1.dtype == np.float32
+    assert np.isclose(estimator.compute(), results["hash"][0], rtol=1e-3)
+
+
 if __name__ == "__main__":
     #test_l1_estimator()
     test_l2_estimator()
@@ -0,0 +1,66 @@
+import gzip
+import io
+import os
+import pytest
+from mini_project.stream import StreamReader
+from mini_project.algorithms.exact import ExactEstimator
+import numpy as np
+
+
+def _write_stream(path, xs, ys, trailing_newline=True):
+    text = "".join(f"{i} {j}\n" for i, j in zip(xs, ys))
+    if not trailing_newline:
+        text = text[:-1]
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "wt") as f:
+        f.write(text)
+
+
+def test_stream_reader(tmp_path):
+    """
+    The reader should parse plain and gzip files in any chunk size.
+    """
+    rng = np.random.default_rng(0)
+    xs, ys = rng.integers(1, 1001, size=(2, 2000))
+    for name, trailing_newline in [("data.txt", True), ("data.txt.gz", True), ("no_newline.txt", False)]:
+        path = os.path.join(tmp_path, name)
+        _write_stream(path, xs, ys, trailing_newline)
+        for chunk_size in [7, 100, 1 << 20]:
+            reader = StreamReader(path, chunk_size=chunk_size)
+            batches = list(reader)
+            assert np.array_equal(np.concatenate([b[0] for b in batches]), xs)
+            assert np.array_equal(np.concatenate([b[1] for b in batches]), ys)
+            assert reader.stats()["items"] == len(xs)
+
+
+def test_stream_reader_errors():
+    """
+    Malformed lines should raise an error instead of being silently dropped.
+    """
+    with pytest.raises(ValueError):
+        list(StreamReader(io.BytesIO(b"1 2\n3 x\n")))
+    with pytest.raises(ValueError):
+        list(StreamReader(io.BytesIO(b"1 2\n3\n")))
+    # Rows of the wrong length, even if the total count is a multiple of the columns
+    for chunk_size in [4, 1 << 20]:
+        with pytest.raises(ValueError):
+            list(StreamReader(io.BytesIO(b"1 2 3\n4\n5 6\n"), chunk_size=chunk_size))
+        with pytest.raises(ValueError):
+            list(StreamReader(io.BytesIO(b"1 2\n\n3 4\n"), chunk_size=chunk_size))
+
+
+def test_read_from_file(tmp_path):
+    """
+    Reading a file by path should give the same result as reading the batch directly.
+    """
+    rng = np.random.default_rng(0)
+    xs, ys = rng.integers(1, 101, size=(2, 2000))
+    path = os.path.join(tmp_path, "data.txt.gz")
+    _write_stream(path, xs, ys)
+
+    estimator = ExactEstimator(100)
+    stats = estimator.read_from_file(path, chunk_size=1000)
+    expected = ExactEstimator(100)
+    expected.read_batch(xs, ys)
+    assert stats["items"] == estimator.N == len(xs)
+    assert np.array_equal(estimator.C, expected.C)
@@ -0,0 +1,73 @@
+from mini_project.algorithms.windowed import SlidingWindowEstimator, DecayedEstimator
+from mini_project.algorithms import counter_matrix
+from mini_project.test.builders import builders
+import numpy as np
+
+
+BUILDERS = builders("counter_matrix.L2", "sketching_sketches.L2")
+
+
+def test_sliding_window():
+    """
+    The sliding window estimator should give the same result as an estimator that only
+    reads the complete blocks in the window plus the current block.
+    """
+    rng = np.random.default_rng(0)
+    xs, ys = rng.integers(1, 101, size=(2, 10000))
+    for build in BUILDERS:
+        windowed = SlidingWindowEstimator(build(), window=2000, blocks=4)
+        windowed.read_batch(xs[:7000], ys[:7000])
+        for i, j in zip(xs[7000:7300].tolist(), ys[7000:7300].tolist()):
+            windowed._read_item(i, j)
+
+        # Blocks of 500 items: 5 complete blocks are expired, 3 are kept
+        expected = build()
+        expected.read_batch(xs[5500:7300], ys[5500:7300])
+        assert windowed.N == expected.N == 1800
+        assert np.isclose(windowed.compute(), expected.compute())
+
+        windowed.reset()
+        assert windowed.N == 0
+
+
+def test_sliding_window_time_based():
+    """
+    Data older than the window should expire with time.
+    """
+    now = [0.0]
+    rng = np.random.default_rng(0)
+    xs, ys = rng.integers(1, 101, size=(2, 3000))
+    windowed = SlidingWindowEstimator(counter_matrix.L2Estimator(10, 5, seed=1), window=10,
+                                      blocks=5, time_based=True, clock=lambda: now[0])
+    windowed.read_batch(xs[:1000], ys[:1000])
+    now[0] = 5.0
+    windowed.read_batch(xs[1000:2000], ys[1000:2000])
+    now[0] = 13.0
+    windowed.read_batch(xs[2000:], ys[2000:])
+
+    expected = counter_matrix.L2Estimator(10, 5, seed=1)
+    expected.read_batch(xs[1000:], ys[1000:])
+    assert np.isclose(windowed.compute(), expected.compute())
+
+    now[0] = 1000.0
+    windowed.read_batch([], [])
+    assert windowed.N == 0
+
+
+def test_decayed():
+    """
+    Each block should be weighted by 0.5 ** (age / half life).
+    """
+    rng = np.random.default_rng(0)
+    xs, ys = rng.integers(1, 101, size=(2, 3000))
+    decayed = DecayedEstimator(counter_matrix.CounterMatrix(10, seed=1), half_life=1000, block=1000)
+    decayed.read_batch(xs, ys)
+
+    blocks = []
+    for k in range(3):
+        block = counter_matrix.CounterMatrix(10, seed=1)
+        block.read_batch(xs[1000 * k:1000 * (k + 1)], ys[1000 * k:1000 * (k + 1)])
+        blocks.append(block)
+    assert np.isclose(decayed.N, 1000 * (0.25 + 0.5 + 1))
+    assert np.allclose(decayed.window[1], 0.25 * blocks[0].C + 0.5 * blocks[1].C + blocks[2].C)
+    assert decayed.compute() > 0
@@ -1,12 +1,63 @@
 import os
+import copy
+import collections
+import contextlib
 import warnings
 import pickle
+import time
+import types
+import numpy as np
+from mini_project.stream import StreamReader, DEFAULT_CHUNK_SIZE
+from mini_project.instrumentation import Stats, INSTRUMENTED_METHODS, instrumented
 
 CURRENT_WORK_DIR = os.path.abspath(os.path.dirname(__file__))
 TEST_DATA_DIR = os.path.join(CURRENT_WORK_DIR, 'test', 'test_data')
 GROUND_TRUTH_DIR = os.path.join(CURRENT_WORK_DIR, 'test', 'ground_truth')
 ANSWER_DIR = os.path.join(CURRENT_WORK_DIR, 'test', 'answer')
 
+# Number of samples generated and written at a time
+GENERATE_BATCH_SIZE = 1 << 16
+
+
+def _resolve_stream(file_name):
+    """
+    Find the source of a stream. A name of a stream in TEST_DATA_DIR (without the ".txt"
+    suffix) is resolved to that file; anything else is returned unchanged.
+    """
+    if isinstance(file_name, str) and file_name != "-" and not os.path.exists(file_name):
+        return os.path.join(TEST_DATA_DIR, file_name + '.txt')
+    return file_name
+
+
+def _equal(a, b) -> bool:
+    """
+    Check whether two parameters (numbers, arrays, or lists and dicts of them) are equal.
+    """
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_equal(a[k], b[k]) for k in a)
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        return len(a) == len(b) and all(_equal(x, y) for x, y in zip(a, b))
+    if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        return np.array_equal(a, b)
+    return a == b
+
+
+def _nbytes(value) -> int:
+    """
+    Count the bytes of the numpy arrays in a value (arrays, estimators, or lists, tuples
+    and dicts of them).
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, Estimator):
+        return value.memory_bytes()
+    if isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple, collections.deque)):
+        return sum(_nbytes(v) for v in value)
+    return 0
+
+
 class Estimator:
     """
     Base class for the correlation estimators.
@@ -14,9 +65,46 @@ class Estimator:
     Args:
         input_type (class): Usually int or float, indicating the type of input.
     """
+    # Names of the attributes that are linear in the stream (besides N), i.e. the state
+    # after reading two streams is the sum of the states after reading each of them.
+    _linear_state = ()
+
+    # Names of the attributes (hash parameters, sizes) that must be identical for two
+    # estimators to be merged.
+    _hash_state = ()
+
+    # Names of the attributes derived from the hash state (e.g. precomputed tables), which
+    # are never modified once built.
+    _tables = ()
+
+    # Timers and counters of the hot path, None unless enable_stats is called
+    stats = None
+
+    # Hash values shared between the estimators reading the same batch, see engine.FanOut
+    _hash_cache = None
+
+    # Number of columns of the streams read by the estimator, i.e. of arrays given to
+    # read_batch
+    columns = 2
+
+    # Whether compute() prints its diagnostics (e.g. the variance of the groups)
+    verbose = True
+
     def __init__(self, input_type=int) -> None:
         self.input_type = input_type   # Input type (int or float)
         self.N = 0                     # Length of the stream
+
+
+    def __getstate__(self):
+        # The instrumented methods are bound to this estimator (see enable_stats), so
+        # copies are instrumented again by __setstate__ instead
+        return {k: v for k, v in vars(self).items() if k not in INSTRUMENTED_METHODS}
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.stats is not None:
+            self._instrument()
     
 
     def _read_item(self, i, j):
@@ -31,18 +119,138 @@ class Estimator:
         pass
 
 
-    def read_from_file(self, file_name: str):
+    def _to_arrays(self, xs, ys):
         """
-        Read the stream from a file. For each line, there should be 2 numbers, which are
-        the samples from X and Y distributions, respectively.
+        Convert a batch of samples into two 1-d numpy arrays of the input type.
 
         Args:
-            file_name (string): the path to the data file.
+            xs (array-like): samples in the stream that follow distribution X.
+            ys (array-like): samples in the stream that follow distribution Y.
+
+        Returns:
+            xs, ys (np.array): arrays of dtype int64 (or float64 if input type is float).
+        """
+        dtype = np.int64 if self.input_type is int else np.float64
+        # Arrays that are already 1-d of the right type are returned as is, so that the
+        # estimators reading the same batch can recognize it
+        xs = np.asarray(xs, dtype=dtype)
+        ys = np.asarray(ys, dtype=dtype)
+        if xs.ndim != 1 or ys.ndim != 1:
+            xs, ys = xs.ravel(), ys.ravel()
+        assert len(xs) == len(ys), f"the batch has {len(xs)} samples of X but {len(ys)} samples of Y."
+        return xs, ys
+
+
+    def read_batch(self, xs, ys):
+        """
+        Read a batch of pairs (xs[k], ys[k]) from the stream. The result is identical to
+        calling _read_item on each pair in order. Subclasses should override this with a
+        vectorized implementation.
+
+        Args:
+            xs (np.array): samples in the stream that follow distribution X.
+            ys (np.array): samples in the stream that follow distribution Y.
+        """
+        xs, ys = self._to_arrays(xs, ys)
+        for i, j in zip(xs.tolist(), ys.tolist()):
+            self._read_item(i, j)
+
+
+    def _hash_key(self):
         """
-        with open(os.path.join(TEST_DATA_DIR, file_name + '.txt')) as f:
-            for line in f:
-                i, j = [self.input_type(x) for x in line.split()]
-                self._read_item(i, j)
+        Return a hashable key of the hash functions, such that estimators with equal keys
+        hash every sample identically (e.g. counter matrices built from the same seed), or
+        None if the hash values should not be shared.
+        """
+        return None
+
+
+    def _hash_batch(self, xs, ys):
+        """
+        Evaluate the hash functions on a batch. When several estimators read the same batch
+        through engine.FanOut, the values are computed by the first estimator with a given
+        _hash_key and reused by the others.
+        """
+        cache = self._hash_cache
+        if cache is None or xs is not cache["xs"] or ys is not cache["ys"]:
+            return self._batch_hash_functions(xs, ys)
+        key = self._hash_key()
+        if key is None:
+            return self._batch_hash_functions(xs, ys)
+        if key not in cache["values"]:
+            cache["values"][key] = self._batch_hash_functions(xs, ys)
+        return cache["values"][key]
+
+
+    def _batch_hash_functions(self, xs, ys):
+        """
+        Evaluate the hash functions on a batch, in the form shared by _hash_batch: the
+        values of _calculate_hash_functions by default.
+        """
+        return self._calculate_hash_functions(xs, ys)
+
+
+    def _set_hash_cache(self, cache):
+        """
+        Share the hash values of the current batch (see _hash_batch) with this estimator
+        and the estimators it is composed of, or stop sharing if cache is None.
+        """
+        self._hash_cache = cache
+        for child in self._children():
+            child._set_hash_cache(cache)
+
+
+    def read_from_file(self, file_name, chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+        """
+        Read the stream from a file. For each line, there should be 2 numbers (or
+        self.columns numbers), which are the samples from X and Y distributions,
+        respectively. The file is parsed in chunks
+        and fed to the estimator through read_batch.
+
+        Args:
+            file_name (string or file object): the name of a stream in TEST_DATA_DIR, or
+                a path to a text file (possibly ending with ".gz"), "-" for the standard
+                input, or a file object.
+            chunk_size (int): number of bytes parsed at a time.
+
+        Returns:
+            A dict of the reading statistics (see stream.StreamReader.stats), together with
+            the total time spent in "total_seconds".
+        """
+        start = time.perf_counter()
+        dtype = np.int64 if self.input_type is int else np.float64
+        reader = StreamReader(_resolve_stream(file_name), columns=self.columns, dtype=dtype,
+                              chunk_size=chunk_size)
+        for batch in reader:
+            self.read_batch(*batch)
+
+        stats = reader.stats()
+        stats["total_seconds"] = time.perf_counter() - start
+        if self.stats is not None:
+            self.stats.add_time("read", stats["read_seconds"])
+            self.stats.add_time("parse", stats["parse_seconds"])
+            self.stats.add("bytes_parsed", stats["bytes"])
+        return stats
+
+
+    def read_batches(self, batches) -> dict:
+        """
+        Read a stream given as an iterable of batches, e.g. DataGenerator.iter_batches or
+        pipeline.prefetch, without going through a file.
+
+        Args:
+            batches (iterable): tuples of self.columns arrays, e.g. (xs, ys) pairs, see
+                read_batch.
+
+        Returns:
+            A dict with the number of "items" read and the "total_seconds" spent.
+        """
+        start = time.perf_counter()
+        items = 0
+        for batch in batches:
+            self.read_batch(*batch)
+            items += len(batch[0])
+        return {"items": items, "total_seconds": time.perf_counter() - start}
 
 
     def compute(self) -> float:
@@ -58,9 +266,219 @@ class Estimator:
         """
         Clear out all the stored data and be ready for the next stream.
         """
+        self._load_counters([np.zeros_like(c) if isinstance(c, np.ndarray) else 0
+                             for c in self.counters()])
+
+
+    def memory_bytes(self) -> int:
+        """
+        Return the number of bytes used by the numpy arrays of the estimator (counters,
+        hash parameters and tables), including those of the estimators it contains.
+        """
+        return _nbytes(vars(self))
+
+
+    def enable_stats(self, stats: Stats = None) -> Stats:
+        """
+        Start timing the phases of the estimator (read, parse, hash, update, compute) and
+        counting the items, bytes parsed, hash evaluations and compute calls. The
+        estimators it is composed of share the same stats. The timed methods are only
+        wrapped on the estimators whose stats are enabled, so when they are disabled (the
+        default) there is no overhead at all.
+
+        Args:
+            stats (instrumentation.Stats): the stats to add to, a new one by default.
+
+        Returns:
+            The stats, whose add_callback can be used to export snapshots periodically.
+        """
+        self.stats = stats if stats is not None else Stats()
+        self._instrument()
+        for child in self._children():
+            child.enable_stats(self.stats)
+        return self.stats
+
+
+    def _instrument(self):
+        """
+        Replace the methods of INSTRUMENTED_METHODS of this estimator by timed ones.
+        """
+        for name, phase in INSTRUMENTED_METHODS.items():
+            method = getattr(type(self), name, None)
+            if method is not None:
+                setattr(self, name, types.MethodType(instrumented(method, phase), self))
+
+
+    def disable_stats(self):
+        """
+        Stop timing the estimator.
+        """
+        self.stats = None
+        for name in INSTRUMENTED_METHODS:
+            self.__dict__.pop(name, None)
+        for child in self._children():
+            child.disable_stats()
+
+
+    def set_verbose(self, verbose: bool):
+        """
+        Turn on or off the diagnostics printed by compute(), for this estimator and the
+        estimators it is composed of.
+        """
+        self.verbose = verbose
+        for child in self._children():
+            child.set_verbose(verbose)
+
+
+    def stats_snapshot(self) -> dict:
+        """
+        Return the current stats (see instrumentation.Stats.snapshot) together with the
+        number of bytes of the estimator in "memory_bytes".
+        """
+        assert self.stats is not None, "the stats are not enabled, call enable_stats first."
+        snapshot = self.stats.snapshot()
+        snapshot["memory_bytes"] = self.memory_bytes()
+        return snapshot
+
+
+    def _children(self):
+        """
+        Return the estimators that this estimator is composed of.
+        """
+        return []
+
+
+    def _counter_slots(self):
+        """
+        Return the (estimator, attribute name) pairs of all the state that is linear in the
+        stream, including that of the children.
+        """
+        slots = [(self, "N")] + [(self, name) for name in self._linear_state]
+        for child in self._children():
+            slots += child._counter_slots()
+        return slots
+
+
+    def counters(self) -> list:
+        """
+        Return the state that is linear in the stream (N and the counters) as a list.
+        """
+        return [getattr(owner, name) for owner, name in self._counter_slots()]
+
+
+    def _load_counters(self, counters: list):
+        """
+        Replace the state that is linear in the stream, in the same order as counters().
+        """
+        owners, previous = [], []
+        for (owner, name), value in zip(self._counter_slots(), counters):
+            if owner not in owners:
+                owners.append(owner)
+                previous.append({})
+            previous[owners.index(owner)][name] = getattr(owner, name)
+            setattr(owner, name, value)
+        for owner, old in zip(owners, previous):
+            owner._refresh(old)
+
+
+    def _refresh(self, previous: dict = None):
+        """
+        Recompute the state derived from the counters, after they are replaced (e.g. by
+        merge or reset).
+
+        Args:
+            previous (dict): the counters before they were replaced, by attribute name,
+                so that the derived state can be updated from the difference.
+        """
         pass
 
 
+    def _learns_hash_state(self) -> bool:
+        """
+        Return whether the hash state of the estimator, or of an estimator it is composed
+        of, is still to be chosen from the stream it reads (e.g. from a warmup prefix), in
+        which case copies reading different parts of a stream cannot be merged.
+        """
+        return any(child._learns_hash_state() for child in self._children())
+
+
+    def is_compatible(self, other) -> bool:
+        """
+        Check whether the estimator can be merged with another one, i.e. they are of the
+        same type and use the same hash parameters (e.g. built with the same seed).
+        """
+        if type(self) != type(other):
+            return False
+        if not all(_equal(getattr(self, name), getattr(other, name)) for name in self._hash_state):
+            return False
+        children, other_children = self._children(), other._children()
+        return len(children) == len(other_children) and \
+            all(c.is_compatible(o) for c, o in zip(children, other_children))
+
+
+    def merge(self, other, sign: int = 1):
+        """
+        Add the state of another compatible estimator to this one, so that the result is
+        the same as reading both streams with this estimator.
+
+        Args:
+            other (Estimator): an estimator with the same hash parameters.
+            sign (int): 1 to add the other stream, -1 to subtract it.
+
+        Returns:
+            The estimator itself.
+        """
+        assert self.is_compatible(other), "the estimators should be of the same type and "\
+            "constructed with the same parameters and seed."
+        self._add_counters(other.counters(), sign)
+        return self
+
+
+    def _add_counters(self, counters: list, sign: int = 1):
+        """
+        Add a list of counters, in the same order as counters(), to this estimator.
+        """
+        self._load_counters([c + sign * o for c, o in zip(self.counters(), counters)])
+
+
+    def subtract(self, other):
+        """
+        Subtract the state of another compatible estimator from this one.
+        """
+        return self.merge(other, sign=-1)
+
+
+    def __add__(self, other):
+        return copy.deepcopy(self).merge(other)
+
+
+    def __sub__(self, other):
+        return copy.deepcopy(self).subtract(other)
+
+
+    def snapshot(self):
+        """
+        Copy the estimator, e.g. to compute its results in another thread while it goes on
+        reading. The hash state and the tables of the estimator and of the estimators it is
+        composed of are never modified, so they are shared with the copy instead of being
+        copied: the cost is that of the counters.
+        """
+        memo = {}
+        self._share_state(memo)
+        return copy.deepcopy(self, memo)
+
+
+    def _share_state(self, memo: dict):
+        """
+        Add the hash state and the tables to a deepcopy memo, see snapshot.
+        """
+        for name in self._hash_state + self._tables:
+            value = getattr(self, name)
+            memo[id(value)] = value
+        for child in self._children():
+            child._share_state(memo)
+
+
 class DataGenerator:
     """
     Base class for the data generators.
@@ -89,14 +507,52 @@ class DataGenerator:
         pass
 
 
+    def _generate_batch(self, size: int):
+        """
+        Generate a batch of pairs of samples. Subclasses should override this with a
+        vectorized implementation.
+
+        Args:
+            size (int): number of pairs to generate.
+
+        Returns:
+            xs (np.array): samples in the stream that follow distribution X.
+            ys (np.array): samples in the stream that follow distribution Y.
+        """
+        xs, ys = zip(*[self._generate_item() for _ in range(size)])
+        return np.array(xs), np.array(ys)
+
+
+    def iter_batches(self, batch_size: int = GENERATE_BATCH_SIZE):
+        """
+        Generate the stream of length self.N in batches, without storing it.
+
+        Args:
+            batch_size (int): number of pairs in each batch.
+
+        Yields:
+            xs, ys (np.array): a batch of samples of X and Y.
+        """
+        for start in range(0, self.N, batch_size):
+            yield self._generate_batch(min(batch_size, self.N - start))
+
 
-    def write_file(self, file_name: str):
+    def write_file(self, file_name: str, estimator: Estimator = None, stream: bool = True) -> bool:
         """
         Write the stream to a file. For each line, there should be 2 numbers, which are
         the samples from X and Y distributions, respectively.
 
         Args:
             file_name (string): the path to the data file.
+            estimator (utils.Estimator): an estimator that reads the stream as it is
+                generated, e.g. to compute the answer without reading the file again.
+            stream (bool): whether to write the stream. If not, only the ground truth is
+                written (and the estimator reads the stream), for streams that are too
+                large to store.
+
+        Returns:
+            Whether the files were written, i.e. False if they already existed and
+            self.overwrite is not set.
         """
         # Make directory if the paths doesn't exist
         for directory in [TEST_DATA_DIR, GROUND_TRUTH_DIR, ANSWER_DIR]:
@@ -104,16 +560,24 @@ class DataGenerator:
                 os.makedirs(directory)
 
         # Write data
-        if os.path.exists(os.path.join(TEST_DATA_DIR, file_name + '.txt')) and not self.overwrite:
-            warnings.warn(f"The path {file_name}.txt already exists in {TEST_DATA_DIR}. Skipping the function.")
-            return
-        with open(os.path.join(TEST_DATA_DIR, file_name + '.txt'), 'w') as f:
-            for _ in range(self.N):
-                i, j = self._generate_item()
-                f.write(str(i) + " " + str(j) + "\n")
+        if stream:
+            directory, path = TEST_DATA_DIR, os.path.join(TEST_DATA_DIR, file_name + '.txt')
+        else:
+            directory, path = GROUND_TRUTH_DIR, os.path.join(GROUND_TRUTH_DIR, file_name + '.pickle')
+        if os.path.exists(path) and not self.overwrite:
+            warnings.warn(f"The path {os.path.basename(path)} already exists in {directory}. Skipping the function.")
+            return False
+        with open(os.path.join(TEST_DATA_DIR, file_name + '.txt'), 'w') if stream else contextlib.nullcontext() as f:
+            for xs, ys in self.iter_batches():
+                if estimator is not None:
+                    estimator.read_batch(xs, ys)
+                if stream:
+                    samples = np.column_stack([xs, ys]).ravel().tolist()
+                    f.write(("%s %s\n" * len(xs)) % tuple(samples))
         
         with open(os.path.join(GROUND_TRUTH_DIR, file_name + '.pickle'), 'wb') as p:
             pickle.dump(self.ground_truth, p, protocol=pickle.HIGHEST_PROTOCOL)
+        return True
 
 
 